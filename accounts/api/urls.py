@@ -9,11 +9,15 @@ urlpatterns =[
     path('user_report/', views.UserReportView.as_view(), name='user_report'),
     path('animal_reports/', views.AnimalReportListView.as_view()),
     path('user_report2/', views.UserReportV2View.as_view()),
+    path('uploads/', views.UploadSessionCreateView.as_view(), name='upload_create'),
+    path('uploads/<uuid:upload_id>/', views.UploadSessionView.as_view(), name='upload_session'),
+    path('uploads/<uuid:upload_id>/complete/', views.UploadSessionCompleteView.as_view(), name='upload_complete'),
     path('save-org-location/', views.save_org_location),
     path('organizations/', views.OrgListView.as_view()),
     path('volunteers/nearby/', views.NearbyVolunteersView.as_view(), name='nearby_volunteers'),
     path('volunteers/all/', views.AllVolunteersView.as_view(), name='all_volunteers'),
     path('volunteers/active/', views.ActiveVolunteersView.as_view(), name='all_volunteers'),
     path('volunteer/location/<int:volunteer_id>/', views.get_volunteer_location, name='get_volunteer_location'),
+    path('presence/heartbeat/', views.presence_heartbeat, name='presence_heartbeat'),
 
 ]
\ No newline at end of file
@@ -4,16 +4,21 @@ from django.contrib.gis.measure import D
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
+from jobqueue.jobs import queue_mail
 from django.conf import settings
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 import json
-from django.contrib.sessions.models import Session
+import re
 
 from rest_framework import generics, status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import api_view, permission_classes
@@ -23,6 +28,14 @@ from datetime import timedelta
 
 from ..models import UserProfile
 from rescue.models import AnimalReport, AnimalReportImage, RescueTask, VolunteerLocation
+from rescue import dispatch
+from base import chunked
+from base.idempotency import idempotent
+from base.images import schedule_photo
+from base.models import UploadSession
+from base.snapshots import SnapshotListMixin
+from base.storage import add_references
+from base.uploads import SpooledPhotoUploadHandler, UploadLimitExceeded
 from ..serializers import (
     UserProfileSerializer,
     AnimalReportSerializer,
@@ -34,6 +47,7 @@ from ..serializers import (
     VolunteerLocationSerializer
 )
 from .. import send_email as sm
+from .. import presence
 
 import logging
 
@@ -114,6 +128,16 @@ def get_volunteer_location(request, volunteer_id):
             'message': str(e)
         }, status=500)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def presence_heartbeat(request):
+    """Keep the user listed as online; clients call this while their dashboard is open."""
+    presence.mark_online(request.user)
+    return Response({
+        'status': 'success',
+        'ttl': presence.get_presence_store().ttl
+    })
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def save_org_location(request):
@@ -154,17 +178,20 @@ def save_org_location(request):
             'message': str(e)
         }, status=500)
 
-class AllVolunteersView(generics.ListAPIView):
+class AllVolunteersView(SnapshotListMixin, generics.ListAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = [AllowAny]
+    snapshot_name = "profiles.VOLUNTEER"
 
     def get_queryset(self):
         return UserProfile.objects.filter(user_type="VOLUNTEER")
     
-class ActiveVolunteersView(generics.ListAPIView):
+class ActiveVolunteersView(SnapshotListMixin, generics.ListAPIView):
     """API view to list active volunteers based on recent location updates."""
     serializer_class = VolunteerLocationSerializer
     permission_classes = [AllowAny]
+    snapshot_name = "volunteer_locations"
+    snapshot_timeout = 30  # Volunteers drop out of the five-minute window without any write
 
     def get_queryset(self):
         five_minutes_ago = now() - timedelta(minutes=5)
@@ -182,35 +209,10 @@ class NearbyVolunteersView(generics.ListAPIView):
             if not lat or not lng:
                 return UserProfile.objects.none()
 
-            # Convert to float and create Point
-            user_location = Point(float(lng), float(lat), srid=4326)  # longitude first, latitude second
-
-            # Get active sessions
-            active_sessions = Session.objects.filter(expire_date__gte=timezone.now())
-            uid_list = []
-
-            # Extract user IDs from valid sessions
-            for session in active_sessions:
-                try:
-                    data = session.get_decoded()
-                    uid = data.get('_auth_user_id')
-                    if uid:
-                        uid_list.append(uid)
-                except:
-                    continue
-
-            # Query for logged-in volunteers with distance annotation
-            volunteers = (
-                UserProfile.objects.filter(
-                    user_type="VOLUNTEER",
-                    location__isnull=False,
-                    user__id__in=uid_list  # Only get volunteers who are logged in
-                )
-                .annotate(distance=Distance("location", user_location))
-                .order_by("distance")
-            )
+            # Logged-in volunteers ordered by distance, served from the in-memory index
+            volunteers = dispatch.nearest_volunteers(float(lat), float(lng))
 
-            print(f"Found {volunteers.count()} logged-in volunteers")
+            print(f"Found {len(volunteers)} logged-in volunteers")
             return volunteers
 
         except (ValueError, TypeError) as e:
@@ -225,24 +227,26 @@ class NearbyVolunteersView(generics.ListAPIView):
         context["distance"] = True  # Ensures distance is included in the response
         return context
 
-class OrgListView(generics.ListAPIView):
+class OrgListView(SnapshotListMixin, generics.ListAPIView):
     """
     API View to fetch all ORGANIZATION users and calculate the distance from the authenticated user.
     """
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
+    snapshot_name = "profiles.ORGANIZATION"
 
     def get_queryset(self):
         # Get all ORGANIZATION profiles
         orgs = UserProfile.objects.filter(user_type="ORGANIZATION").select_related('user')
-        
-        # Set static location for all ORGANIZATION
+
+        # Organizations without a location are shown at a static point; this is not saved,
+        # as writing every org on each GET would also invalidate the cached listing
         static_point = Point(73.8567, 18.5204, srid=4326)  # longitude, latitude
-        
+
         for org in orgs:
-            org.location = static_point
-            org.save()
-        
+            if org.location is None:
+                org.location = static_point
+
         return orgs
 
 
@@ -250,12 +254,14 @@ class UserReportView(generics.CreateAPIView):
     serializer_class = AnimalReportSerializer
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(idempotent)
     def create(self, request, *args, **kwargs):
         try:
             logger.info(f"Received data: {request.data}")
 
-            # Validate required fields
-            if "photo" not in request.FILES:
+            # Validate required fields; the photo is either uploaded inline or, from flaky
+            # connections, through a resumable upload session referenced by upload_id
+            if "photo" not in request.FILES and not request.data.get("upload_id"):
                 return Response(
                     {"status": "error", "message": "Photo is required"},
                     status=status.HTTP_400_BAD_REQUEST,
@@ -291,38 +297,15 @@ class UserReportView(generics.CreateAPIView):
             # Create report location point
             report_location = Point(float(longitude), float(latitude), srid=4326)
 
-            # Get active sessions to find logged-in volunteers
-            active_sessions = Session.objects.filter(expire_date__gte=timezone.now())
-            logged_in_user_ids = []
-
-            # Extract user IDs from valid sessions
-            for session in active_sessions:
-                try:
-                    data = session.get_decoded()
-                    uid = data.get('_auth_user_id')
-                    if uid:
-                        logged_in_user_ids.append(int(uid))
-                except:
-                    continue
-
             # Find nearest logged-in volunteer within 10km
-            nearest_volunteer = (
-                UserProfile.objects.filter(
-                    user_type="VOLUNTEER",
-                    location__isnull=False,
-                    user__id__in=logged_in_user_ids  # Only get logged-in volunteers
-                )
-                .annotate(
-                    distance=Distance("location", report_location)
-                )
-                .filter(distance__lte=D(km=10))  # Within 10km radius
-                .order_by("distance")
-                .first()
-            )
+            nearby = dispatch.nearest_volunteers(float(latitude), float(longitude), radius_km=10, limit=1)
+            nearest_volunteer = nearby[0] if nearby else None
+
+            photo = request.FILES.get("photo") or chunked.completed_upload(request.user, request.data["upload_id"])
 
             report = AnimalReport.objects.create(
                 user=request.user,
-                photo=request.FILES["photo"],
+                photo=photo,
                 description=request.data["description"],
                 location=report_location,
                 status="PENDING",
@@ -353,6 +336,7 @@ class UserReportView(generics.CreateAPIView):
                         "status": "success",
                         "message": "Report submitted and assigned to a volunteer.",
                         "task_id": task.id,
+                        "report_id": report.id,
                         "assigned_volunteer": {
                             "id": nearest_volunteer.id,
                             "user": {
@@ -432,6 +416,19 @@ class UserReportV2View(generics.CreateAPIView):
     serializer_class = AnimalReport2Serializer
     permission_classes = [IsAuthenticated]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Photos are streamed to spooled temp files with per-request limits instead of
+        # Django's default handlers; this has to happen before anything reads the body
+        request.upload_handlers = [SpooledPhotoUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        # DRF wraps parser errors in ParseError; surface broken upload limits as 413
+        if isinstance(exc, ParseError) and isinstance(exc.__context__, UploadLimitExceeded):
+            return Response({"status": "error", "message": str(exc.__context__)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return super().handle_exception(exc)
+
+    @method_decorator(idempotent)
     def create(self, request, *args, **kwargs):
         try:
             logger.info(f"Received data: {request.data}")
@@ -450,31 +447,142 @@ class UserReportV2View(generics.CreateAPIView):
 
             logger.info(f"Final Priority assigned: {priority}")
 
-            # Create the report
-            report = AnimalReport.objects.create(
-                user=request.user,
-                description=request.data["description"],
-                location=Point(float(request.data["longitude"]), float(request.data["latitude"]), srid=4326),
-                status="PENDING",
-                priority=priority,
-            )
+            # Create the report and all of its images in one transaction
+            with transaction.atomic():
+                report = AnimalReport.objects.create(
+                    user=request.user,
+                    description=request.data["description"],
+                    location=Point(float(request.data["longitude"]), float(request.data["latitude"]), srid=4326),
+                    status="PENDING",
+                    priority=priority,
+                )
 
-            # Handle multiple images
-            if "photos" in request.FILES:
-                images = request.FILES.getlist("photos")  # Get list of images
+                # Inline files are written to storage as part of the bulk insert; finished
+                # upload sessions are attached by their storage name
+                upload_ids = request.data.getlist("upload_ids") if hasattr(request.data, "getlist") else request.data.get("upload_ids", [])
+                photos = request.FILES.getlist("photos") + [chunked.completed_upload(request.user, upload_id) for upload_id in upload_ids]
+                images = AnimalReportImage.objects.bulk_create(
+                    [AnimalReportImage(report=report, image=photo) for photo in photos]
+                )
+                # bulk_create skips post_save, so do what the image receivers would have done
+                add_references(image.image for image in images)
                 for image in images:
-                    AnimalReportImage.objects.create(report=report, image=image)
+                    schedule_photo(image.image)
 
             return Response(
                 {"status": "success", "message": "Report submitted.", "priority": report.priority},
                 status=status.HTTP_201_CREATED,
             )
 
+        except ParseError:
+            raise
         except Exception as e:
             logger.error(f"Error in UserReportV2View: {str(e)}")
             return Response({"status": "error", "message": f"Error processing report: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+#### Resumable photo uploads ####
+
+class ChunkParser(BaseParser):
+    """Hands the raw request body of an upload chunk to the view as bytes."""
+    media_type = "application/octet-stream"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        # Raw body reads aren't bounded by DATA_UPLOAD_MAX_MEMORY_SIZE, so cap them here
+        max_chunk = getattr(settings, "CHUNKED_UPLOAD_MAX_CHUNK_SIZE", 2 * 1024 * 1024)
+        request = (parser_context or {}).get("request")
+        content_length = request.META.get("CONTENT_LENGTH") if request else None
+        if content_length and content_length.isdigit() and int(content_length) > max_chunk:
+            raise UploadLimitExceeded(f"Chunks are limited to {max_chunk} bytes")
+        data = stream.read(max_chunk + 1) if stream else b""
+        if len(data) > max_chunk:
+            raise UploadLimitExceeded(f"Chunks are limited to {max_chunk} bytes")
+        return data
+
+
+class UploadSessionCreateView(generics.GenericAPIView):
+    """Start a resumable upload: POST {filename, size, content_type?, sha256?}."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            session = chunked.start_upload(
+                request.user,
+                filename=request.data.get("filename") or "photo.jpg",
+                size=int(request.data.get("size", 0)),
+                content_type=request.data.get("content_type", ""),
+                sha256=request.data.get("sha256", ""),
+            )
+        except (TypeError, ValueError) as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {
+                "status": "success",
+                "upload_id": str(session.pk),
+                "offset": 0,
+                "chunk_size": getattr(settings, "CHUNKED_UPLOAD_CHUNK_SIZE", 512 * 1024),
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class UploadSessionView(generics.GenericAPIView):
+    """
+    GET returns the offset to resume from. PUT writes one chunk, with its position given
+    by a `Content-Range: bytes <start>-<end>/<size>` header.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [ChunkParser]
+
+    def handle_exception(self, exc):
+        if isinstance(exc, UploadLimitExceeded):
+            return Response({"status": "error", "message": str(exc)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return super().handle_exception(exc)
+
+    def get_session(self):
+        return get_object_or_404(UploadSession, pk=self.kwargs["upload_id"], user=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        session = self.get_session()
+        return Response({"upload_id": str(session.pk), "offset": session.received, "size": session.size, "state": session.status})
+
+    def put(self, request, *args, **kwargs):
+        session = self.get_session()
+        match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", request.headers.get("Content-Range", ""))
+        data = request.data
+        if not match or int(match.group(2)) - int(match.group(1)) + 1 != len(data):
+            return Response(
+                {"status": "error", "message": "A Content-Range header matching the chunk is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            session = chunked.write_chunk(session.pk, int(match.group(1)), data)
+        except chunked.UploadConflict as e:
+            session.refresh_from_db()
+            return Response({"status": "error", "message": str(e), "offset": session.received}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"status": "success", "offset": session.received})
+
+
+class UploadSessionCompleteView(generics.GenericAPIView):
+    """Finalize an upload once every byte has been received; the upload_id can then be used on reports."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        session = get_object_or_404(UploadSession, pk=self.kwargs["upload_id"], user=request.user)
+        try:
+            session = chunked.finalize_upload(session.pk)
+        except chunked.UploadConflict as e:
+            session.refresh_from_db()
+            return Response({"status": "error", "message": str(e), "offset": session.received}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"status": "success", "upload_id": str(session.pk), "size": session.size})
+
+
 class AnimalReportListView(generics.ListAPIView):
     queryset = AnimalReport.objects.all().order_by(
         "-timestamp"
@@ -504,7 +612,7 @@ class PasswordResetRequestView(generics.GenericAPIView):
                 "protocol": "http",
             }
             email = render_to_string(email_template_name, context)
-            send_mail(subject, email, settings.DEFAULT_FROM_EMAIL, [user.email], fail_silently=False)
+            queue_mail(subject, email, settings.DEFAULT_FROM_EMAIL, [user.email])
             return Response({"message": "A password reset link has been sent to your email."}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
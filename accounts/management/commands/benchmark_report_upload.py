@@ -0,0 +1,95 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.api.views import UserReportV2View
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure latency and peak memory of multi-photo report uploads to UserReportV2View'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photos', nargs='+', type=int, default=[1, 10], help='Photos per request')
+        parser.add_argument('--size-mb', type=float, default=5, help='Size of each photo')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--threshold-mb', type=float, help='Override PHOTO_UPLOAD_MEMORY_THRESHOLD')
+
+    def handle(self, *args, **options):
+        overrides = {
+            'MEDIA_ROOT': tempfile.mkdtemp(prefix='upload-bench-'),
+            'PHOTO_UPLOAD_MAX_FILE_SIZE': int(options['size_mb'] * 1024 * 1024) + 1,
+            'PHOTO_UPLOAD_MAX_TOTAL_SIZE': int((max(options['photos']) + 1) * options['size_mb'] * 1024 * 1024),
+            'PHOTO_UPLOAD_MAX_FILES': max(options['photos']),
+        }
+        if options['threshold_mb'] is not None:
+            overrides['PHOTO_UPLOAD_MEMORY_THRESHOLD'] = int(options['threshold_mb'] * 1024 * 1024)
+
+        try:
+            with override_settings(**overrides):
+                for count in options['photos']:
+                    latencies, peaks = [], []
+                    for run in range(options['repeat']):
+                        latencies.append(self.upload(count, options['size_mb'], trace=False))
+                        peaks.append(self.upload(count, options['size_mb'], trace=True))
+                    upload_mb = count * options['size_mb']
+                    self.stdout.write(
+                        f'{count:>3} x {options["size_mb"]:g} MB ({upload_mb:6.1f} MB) | '
+                        f'median {statistics.median(latencies):8.1f} ms | '
+                        f'max {max(latencies):8.1f} ms | '
+                        f'peak Python memory {max(peaks) / 1024 / 1024:7.2f} MB'
+                    )
+        finally:
+            shutil.rmtree(overrides['MEDIA_ROOT'], ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def upload(self, count, size_mb, trace):
+        """
+        Post one report with `count` random photos against a throwaway user, rolled back
+        afterwards. Returns latency in ms, or peak traced memory in bytes when `trace` is set.
+        The multipart body is built before timing starts, as a client would send it.
+        """
+        size = int(size_mb * 1024 * 1024)
+        result = None
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username=f'bench-reporter-{time.monotonic_ns()}')
+                photos = [SimpleUploadedFile(f'photo-{i}.jpg', os.urandom(size), 'image/jpeg') for i in range(count)]
+                request = APIRequestFactory().post(
+                    '/api/user_report2/',
+                    {'description': 'Benchmark report', 'latitude': '18.5204', 'longitude': '73.8567', 'photos': photos},
+                    format='multipart',
+                )
+                del photos
+                force_authenticate(request, user=user)
+                view = UserReportV2View.as_view()
+
+                if trace:
+                    tracemalloc.start()
+                    response = view(request)
+                    result = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                else:
+                    started = time.perf_counter()
+                    response = view(request)
+                    result = (time.perf_counter() - started) * 1000
+                if response.status_code != 201:
+                    raise RuntimeError(f'Upload failed with {response.status_code}: {response.data}')
+                raise Rollback
+        except Rollback:
+            pass
+        return result
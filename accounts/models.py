@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
+from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.dispatch import receiver
 from django.contrib.gis.db import models as geomodels
 from phonenumber_field.modelfields import PhoneNumberField
+from base.snapshots import invalidate_snapshot
+from . import presence
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -21,4 +24,20 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
     """Create UserProfile only if it doesn't exist (no updates)."""
     if created:
         # Use get_or_create to avoid duplicates
-        UserProfile.objects.get_or_create(user=instance)
\ No newline at end of file
+        UserProfile.objects.get_or_create(user=instance)
+
+# Signals to keep the presence registry in sync with logins
+@receiver(user_logged_in)
+def mark_user_online(sender, request, user, **kwargs):
+    presence.mark_online(user)
+
+@receiver(user_logged_out)
+def mark_user_offline(sender, request, user, **kwargs):
+    if user is not None:
+        presence.mark_offline(user)
+
+# Cached volunteer and organization listings (base/snapshots.py) are rebuilt after profile changes
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_listing(sender, instance, **kwargs):
+    invalidate_snapshot(f"profiles.{instance.user_type}")
@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class BasePresenceStore:
+    """
+    Keeps a roster of online users per user_type, each entry expiring after `ttl` seconds
+    unless refreshed by a login, heartbeat or WebSocket connection.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def mark_online(self, user_id, user_type):
+        raise NotImplementedError
+
+    def mark_offline(self, user_id, user_type):
+        raise NotImplementedError
+
+    def online_user_ids(self, user_type):
+        raise NotImplementedError
+
+    def is_online(self, user_id, user_type):
+        return int(user_id) in self.online_user_ids(user_type)
+
+    @staticmethod
+    def _live(roster, now):
+        return {uid for uid, expires_at in roster.items() if expires_at > now}
+
+
+class InMemoryPresenceStore(BasePresenceStore):
+    """Process-local store, used by the test suite and single-process development servers."""
+
+    def __init__(self, ttl):
+        super().__init__(ttl)
+        self._rosters = {}
+        self._lock = threading.Lock()
+
+    def mark_online(self, user_id, user_type):
+        with self._lock:
+            self._rosters.setdefault(user_type, {})[int(user_id)] = time.time() + self.ttl
+
+    def mark_offline(self, user_id, user_type):
+        with self._lock:
+            self._rosters.get(user_type, {}).pop(int(user_id), None)
+
+    def online_user_ids(self, user_type):
+        with self._lock:
+            return self._live(self._rosters.get(user_type, {}), time.time())
+
+    def clear(self):
+        with self._lock:
+            self._rosters.clear()
+
+
+class CachePresenceStore(BasePresenceStore):
+    """
+    Stores one roster dict per user_type in the Django cache, so "who is online" is a single
+    cache read. Writes take a short cache lock so concurrent workers don't drop each other's entries.
+    """
+
+    key_prefix = "presence"
+    lock_timeout = 5
+
+    def __init__(self, ttl, cache_alias="default"):
+        super().__init__(ttl)
+        self.cache = caches[cache_alias]
+
+    def _key(self, user_type):
+        return f"{self.key_prefix}:{user_type}"
+
+    @contextmanager
+    def _locked(self, user_type):
+        lock_key = f"{self._key(user_type)}:lock"
+        deadline = time.time() + self.lock_timeout
+        while not (acquired := self.cache.add(lock_key, 1, timeout=self.lock_timeout)):
+            if time.time() > deadline:
+                break  # Stale lock; the write is still better than losing the heartbeat
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            # Never release a lock another worker holds
+            if acquired:
+                self.cache.delete(lock_key)
+
+    def _update(self, user_type, user_id, expires_at):
+        now = time.time()
+        with self._locked(user_type):
+            roster = self.cache.get(self._key(user_type)) or {}
+            # Drop expired entries on write so the roster stays proportional to online users
+            roster = {uid: exp for uid, exp in roster.items() if exp > now}
+            if expires_at is None:
+                roster.pop(int(user_id), None)
+            else:
+                roster[int(user_id)] = expires_at
+            self.cache.set(self._key(user_type), roster, timeout=self.ttl)
+
+    def mark_online(self, user_id, user_type):
+        self._update(user_type, user_id, time.time() + self.ttl)
+
+    def mark_offline(self, user_id, user_type):
+        self._update(user_type, user_id, None)
+
+    def online_user_ids(self, user_type):
+        return self._live(self.cache.get(self._key(user_type)) or {}, time.time())
+
+
+_store = None
+
+
+def get_presence_store():
+    global _store
+    if _store is None:
+        backend = import_string(getattr(settings, "PRESENCE_STORE", "accounts.presence.CachePresenceStore"))
+        _store = backend(ttl=getattr(settings, "PRESENCE_TTL", settings.SESSION_COOKIE_AGE))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_presence_store(sender, setting, **kwargs):
+    global _store
+    if setting in ("PRESENCE_STORE", "PRESENCE_TTL"):
+        _store = None
+
+
+def _user_type(user):
+    profile = getattr(user, "userprofile", None)
+    return profile.user_type if profile else None
+
+
+def mark_online(user, user_type=None):
+    """Record `user` as online; pass `user_type` when the profile is already loaded."""
+    user_type = user_type or _user_type(user)
+    if user_type:
+        get_presence_store().mark_online(user.pk, user_type)
+
+
+def mark_offline(user, user_type=None):
+    user_type = user_type or _user_type(user)
+    if user_type:
+        get_presence_store().mark_offline(user.pk, user_type)
+
+
+def online_user_ids(user_type):
+    """Return the ids of users of `user_type` that are currently online."""
+    return get_presence_store().online_user_ids(user_type)
@@ -1,5 +1,5 @@
-from django.core.mail import send_mail
 from django.conf import settings
+from jobqueue.jobs import queue_mail
 import requests
 
 '''def send_sms_to_user(mobile_number, otp):
@@ -21,7 +21,7 @@ import requests
 
 def send_mail_to_volunteer(volunteer_profile, report):
     """
-    Sends an email notification to the assigned volunteer with report details.
+    Queues an email notification to the assigned volunteer with report details.
     """
     subject = 'New Animal Report Assigned'
     message = f"""
@@ -40,12 +40,12 @@ def send_mail_to_volunteer(volunteer_profile, report):
     """
     recipient_list = [volunteer_profile.user.email]
 
-    send_mail(subject, message, settings.EMAIL_HOST_USER, recipient_list, fail_silently=False)
+    queue_mail(subject, message, settings.EMAIL_HOST_USER, recipient_list)
 
 
 def send_mail_to_org(profile, report, request):
     """
-    Sends an email notification to the Organization when no volunteer is available.
+    Queues an email notification to the Organization when no volunteer is available.
     """
     subject = "New Animal Report - No Volunteers Available"
     message = f"""
@@ -64,4 +64,4 @@ def send_mail_to_org(profile, report, request):
     """
     recipient_list = [profile.user.email]
 
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list, fail_silently=False)
+    queue_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list)
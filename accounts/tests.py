@@ -1,4 +1,5 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import TestCase, SimpleTestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 
@@ -18,3 +19,192 @@ class AccountsTest(APITestCase):
         
         self.assertEqual(_response.status_code, status.HTTP_201_CREATED)  # Expect 201 instead of 200
         self.assertTrue(_response.data['message'], "User created successfully.")
+
+
+@override_settings(PRESENCE_STORE="accounts.presence.InMemoryPresenceStore", PRESENCE_TTL=60)
+class PresenceStoreTest(SimpleTestCase):
+    def test_online_volunteers_expire_after_ttl(self):
+        from accounts.presence import get_presence_store
+
+        store = get_presence_store()
+        store.mark_online(1, "VOLUNTEER")
+        store.mark_online(2, "USER")
+        self.assertEqual(store.online_user_ids("VOLUNTEER"), {1})
+
+        with mock.patch("accounts.presence.time.time", return_value=store._rosters["VOLUNTEER"][1] + 1):
+            self.assertEqual(store.online_user_ids("VOLUNTEER"), set())
+
+    def test_mark_offline_removes_user(self):
+        from accounts.presence import get_presence_store
+
+        store = get_presence_store()
+        store.mark_online(1, "VOLUNTEER")
+        store.mark_offline(1, "VOLUNTEER")
+        self.assertFalse(store.is_online(1, "VOLUNTEER"))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "presence-lock"}})
+class CachePresenceStoreTest(SimpleTestCase):
+    def test_timed_out_write_leaves_other_workers_lock_alone(self):
+        from django.core.cache import cache
+
+        from accounts.presence import CachePresenceStore
+
+        store = CachePresenceStore(ttl=60)
+        store.lock_timeout = 0.05
+        cache.add("presence:VOLUNTEER:lock", "other-worker", timeout=60)
+        store.mark_online(1, "VOLUNTEER")
+        self.assertEqual(store.online_user_ids("VOLUNTEER"), {1})
+        self.assertEqual(cache.get("presence:VOLUNTEER:lock"), "other-worker")
+
+        cache.delete("presence:VOLUNTEER:lock")
+        store.mark_online(2, "VOLUNTEER")
+        self.assertIsNone(cache.get("presence:VOLUNTEER:lock"))
+
+
+class ResumableUploadTest(APITestCase):
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth.models import User
+
+        media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=media_root, CHUNKED_UPLOAD_DIR=media_root + "/chunks")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username="reporter", password="name1234")
+        self.client.force_authenticate(self.user)
+
+    def test_resume_after_dropped_chunk_and_attach_to_report(self):
+        import io
+        from PIL import Image
+        from base.models import StoredBlob
+        from rescue.models import AnimalReport
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "orange").save(buffer, "PNG")
+        photo = buffer.getvalue()
+        half = len(photo) // 2
+
+        response = self.client.post("/api/uploads/", {"filename": "dog.png", "size": len(photo)}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = f"/api/uploads/{response.data['upload_id']}/"
+
+        def put(start, chunk):
+            return self.client.put(
+                url, chunk, content_type="application/octet-stream",
+                HTTP_CONTENT_RANGE=f"bytes {start}-{start + len(chunk) - 1}/{len(photo)}",
+            )
+
+        self.assertEqual(put(0, photo[:half]).data["offset"], half)
+        # A chunk past the current end is refused and the client is told where to resume
+        self.assertEqual(put(half + 1, photo[half + 1:]).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.get(url).data["offset"], half)
+        self.assertEqual(put(half, photo[half:]).data["offset"], len(photo))
+        self.assertEqual(self.client.post(url + "complete/").status_code, status.HTTP_200_OK)
+
+        with mock.patch("base.images.process_photo") as process_photo, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/user_report/",
+                {"description": "Injured dog", "latitude": "18.52", "longitude": "73.85", "upload_id": response.data["upload_id"]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        report = AnimalReport.objects.get()
+        self.assertEqual(report.photo.read(), photo)
+        # The attached blob is referenced, so dedupe_media keeps it, and gets derivatives
+        self.assertEqual(StoredBlob.objects.get(name=report.photo.name).ref_count, 1)
+        process_photo.assert_called_once()
+        self.assertEqual(process_photo.call_args.args[0].name, report.photo.name)
+
+
+    @override_settings(CHUNKED_UPLOAD_MAX_CHUNK_SIZE=1024)
+    def test_oversized_chunk_is_refused_before_reading(self):
+        response = self.client.post("/api/uploads/", {"filename": "dog.png", "size": 4096}, format="json")
+        url = f"/api/uploads/{response.data['upload_id']}/"
+        response = self.client.put(
+            url, b"x" * 2048, content_type="application/octet-stream", HTTP_CONTENT_RANGE="bytes 0-2047/4096"
+        )
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(self.client.get(url).data["offset"], 0)
+
+
+class PhotoUploadLimitTest(APITestCase):
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth.models import User
+
+        settings_override = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username="reporter", password="name1234")
+        self.client.force_authenticate(self.user)
+
+    def post_report(self, *photos):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        files = [SimpleUploadedFile(f"dog{i}.png", content, content_type="image/png") for i, content in enumerate(photos)]
+        return self.client.post(
+            "/api/user_report2/",
+            {"description": "Injured dog", "latitude": "18.52", "longitude": "73.85", "photos": files},
+            format="multipart",
+        )
+
+    def assertRefused(self, response):
+        from rescue.models import AnimalReport
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(response.data["status"], "error")
+        self.assertFalse(AnimalReport.objects.exists())
+
+    @override_settings(PHOTO_UPLOAD_MAX_FILE_SIZE=2048)
+    def test_file_over_the_per_file_limit_is_refused(self):
+        self.assertRefused(self.post_report(b"x" * 1024, b"x" * 4096))
+
+    @override_settings(PHOTO_UPLOAD_MAX_FILES=2)
+    def test_too_many_files_are_refused(self):
+        self.assertRefused(self.post_report(b"x", b"x", b"x"))
+
+    @override_settings(PHOTO_UPLOAD_MAX_FILE_SIZE=4096, PHOTO_UPLOAD_MAX_TOTAL_SIZE=8192)
+    def test_body_over_the_total_limit_is_refused(self):
+        self.assertRefused(self.post_report(b"x" * 3072, b"x" * 3072, b"x" * 3072))
+
+    def test_multi_photo_upload_within_the_limits(self):
+        import io
+        from PIL import Image
+        from rescue.models import AnimalReportImage
+
+        photos = []
+        for colour in ("orange", "brown", "black"):
+            buffer = io.BytesIO()
+            Image.new("RGB", (64, 64), colour).save(buffer, "PNG")
+            photos.append(buffer.getvalue())
+
+        with mock.patch("base.images.process_photo"), self.captureOnCommitCallbacks(execute=True):
+            response = self.post_report(*photos)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        images = AnimalReportImage.objects.order_by("pk")
+        self.assertEqual([image.image.read() for image in images], photos)
+
+
+class VolunteerListingSnapshotTest(TestCase):
+    def test_unchanged_listing_is_revalidated_without_queries(self):
+        from django.contrib.auth.models import User
+
+        profile = User.objects.create_user(username="helper", password="name1234").userprofile
+        profile.user_type = "VOLUNTEER"
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+
+        first = self.client.get("/api/volunteers/all/")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()[0]["user"]["username"], "helper")
+        with self.assertNumQueries(0):
+            cached = self.client.get("/api/volunteers/all/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        profile.mobile_number = "+919056342734"
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        changed = self.client.get("/api/volunteers/all/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
@@ -2,7 +2,7 @@ from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
-from django.core.mail import send_mail
+from jobqueue.jobs import queue_mail
 from django.conf import settings
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
@@ -121,7 +121,7 @@ def password_reset_request(request):
                         "protocol": "http",
                     }
                     email = render_to_string(email_template_name, context)
-                    send_mail(subject, email, settings.DEFAULT_FROM_EMAIL, [user.email], fail_silently=False)
+                    queue_mail(subject, email, settings.DEFAULT_FROM_EMAIL, [user.email])
                 messages.success(request, "A password reset link has been sent to your email.")
                 return redirect("login")
             else:
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from base.images import track_photo_derivatives
+from base.storage import track_blob_references
 
 class AdoptableAnimal(models.Model):
     category = models.CharField(max_length=100)
@@ -14,4 +16,11 @@ class AdoptableAnimal(models.Model):
         ]
 
     def __str__(self):
-        return self.category
\ No newline at end of file
+        return self.category
+
+
+# Build resized photo derivatives off the request thread when the photo changes
+track_photo_derivatives(AdoptableAnimal, 'photo')
+
+# Reference counts for deduplicated photo blobs
+track_blob_references(AdoptableAnimal, 'photo')
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession
+
+MB = 1024 * 1024
+
+
+class UploadConflict(Exception):
+    """A chunk or finalize request that doesn't match the session's current state."""
+
+
+def upload_dir():
+    return getattr(settings, "CHUNKED_UPLOAD_DIR", os.path.join(settings.BASE_DIR, "chunked_uploads"))
+
+
+def part_path(session):
+    return os.path.join(upload_dir(), f"{session.pk}.part")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as part:
+        for block in iter(lambda: part.read(MB), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def start_upload(user, filename, size, content_type="", sha256=""):
+    max_size = getattr(settings, "PHOTO_UPLOAD_MAX_FILE_SIZE", 10 * MB)
+    if size <= 0 or size > max_size:
+        raise ValueError(f"Upload size must be between 1 and {max_size} bytes")
+    return UploadSession.objects.create(
+        user=user,
+        filename=os.path.basename(filename)[:255],
+        size=size,
+        content_type=content_type or "",
+        sha256=(sha256 or "").lower(),
+    )
+
+
+def write_chunk(session_id, offset, data):
+    """
+    Write `data` at byte `offset` of the upload. Offsets at or before the current end are
+    accepted, so a client that lost the response to a chunk can simply send it again.
+    Returns the updated session.
+    """
+    max_chunk = getattr(settings, "CHUNKED_UPLOAD_MAX_CHUNK_SIZE", 2 * MB)
+    if len(data) > max_chunk:
+        raise ValueError(f"Chunks are limited to {max_chunk} bytes")
+
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != "UPLOADING":
+            raise UploadConflict("Upload is already complete")
+        if offset > session.received:
+            raise UploadConflict(f"Expected a chunk at offset {session.received}")
+        if offset + len(data) > session.size:
+            raise ValueError(f"Chunk ends past the declared size of {session.size} bytes")
+
+        os.makedirs(upload_dir(), exist_ok=True)
+        fd = os.open(part_path(session), os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            os.pwrite(fd, data, offset)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        session.received = max(session.received, offset + len(data))
+        session.save(update_fields=["received", "updated_at"])
+    return session
+
+
+def finalize_upload(session_id):
+    """
+    Verify an upload that has received all of its bytes, move it into default storage and
+    mark the session COMPLETE. Finalizing a completed session is a no-op.
+    """
+    from PIL import Image
+
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status == "COMPLETE":
+            return session
+        if session.received != session.size:
+            raise UploadConflict(f"Upload is incomplete: {session.received} of {session.size} bytes received")
+
+        path = part_path(session)
+        corrupted = bool(session.sha256) and file_sha256(path) != session.sha256
+        if corrupted:
+            # Nothing reaches storage; the client starts over from offset 0
+            os.remove(path)
+            session.received = 0
+            session.save(update_fields=["received", "updated_at"])
+        else:
+            try:
+                with Image.open(path) as image:
+                    image.verify()
+            except Exception:
+                raise ValueError("Upload is not a valid image")
+
+            with open(path, "rb") as part:
+                name = default_storage.save(posixpath.join("animal_reports", session.filename), File(part))
+            os.remove(path)
+            session.status = "COMPLETE"
+            session.file_name = name
+            session.save(update_fields=["status", "file_name", "updated_at"])
+
+    if corrupted:
+        raise UploadConflict("Checksum mismatch, upload the file again")
+    return session
+
+
+def completed_upload(user, session_id):
+    """The storage name of `user`'s finished upload, for attaching to a report by reference."""
+    session = UploadSession.objects.filter(pk=session_id, user=user, status="COMPLETE").first()
+    if session is None:
+        raise ValueError(f"No completed upload {session_id}")
+    return session.file_name
+
+
+def purge_expired_uploads(now=None):
+    """Delete sessions idle for longer than CHUNKED_UPLOAD_EXPIRY along with their chunk files."""
+    now = now or timezone.now()
+    expiry = timedelta(seconds=getattr(settings, "CHUNKED_UPLOAD_EXPIRY", 24 * 3600))
+    expired = list(UploadSession.objects.filter(updated_at__lt=now - expiry))
+    for session in expired:
+        if os.path.exists(part_path(session)):
+            os.remove(part_path(session))
+    UploadSession.objects.filter(pk__in=[session.pk for session in expired]).delete()
+    return len(expired)
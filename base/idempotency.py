@@ -0,0 +1,114 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def request_fingerprint(request):
+    """Hash of what the request asks for, so a key can't be reused for a different request."""
+    data = request.data
+    items = data.lists() if hasattr(data, "lists") else data.items() if hasattr(data, "items") else enumerate(data)
+    fields = {}
+    for name, value in items:
+        # Files are identified by name and size; hashing their bytes would mean reading them twice
+        values = value if isinstance(value, list) else [value]
+        fields[str(name)] = [[v.name, v.size] if isinstance(v, UploadedFile) else v for v in values]
+    payload = json.dumps([request.method, request.path, fields], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def set_lock_timeout(value):
+    """Bound how long the current transaction waits on row locks (PostgreSQL only)."""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            if value == "DEFAULT":
+                cursor.execute("SET LOCAL lock_timeout = DEFAULT")
+            else:
+                cursor.execute("SELECT set_config('lock_timeout', %s, true)", [value])
+
+
+def idempotent(view):
+    """
+    Replay the stored response when a DRF view is called again with the same Idempotency-Key.
+
+    The key row is inserted in the same transaction that runs the view, so a concurrent
+    duplicate blocks on the unique index until the first request commits, then replays its
+    response. Only 2xx responses are kept; anything else releases the key for a retry.
+    Expired keys are removed by the retention sweeper (base/retention.py).
+    Requests without the header are passed straight through. Use method_decorator on
+    class-based views.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"status": "error", "message": f"{HEADER} is too long"}, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        fingerprint = request_fingerprint(request)
+        IdempotencyKey.objects.filter(user=request.user, expires_at__lt=now).delete()
+
+        with transaction.atomic():
+            timeout = getattr(settings, "IDEMPOTENCY_WAIT_TIMEOUT", 30)
+            set_lock_timeout(f"{int(timeout * 1000)}ms")
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user,
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=now + timedelta(seconds=getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 3600)),
+                    )
+            except IntegrityError:
+                record = None
+            except OperationalError:
+                return Response(
+                    {"status": "error", "message": "A request with this key is still in progress"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            set_lock_timeout("DEFAULT")
+
+            if record is None:
+                return replay(IdempotencyKey.objects.get(user=request.user, key=key), fingerprint)
+
+            # The view gets its own savepoint, so a database error it catches and turns into
+            # an error response can't leave the key's transaction unusable
+            response = None
+            try:
+                with transaction.atomic():
+                    response = view(request, *args, **kwargs)
+            except DatabaseError:
+                if response is None:
+                    raise
+            if 200 <= response.status_code < 300:
+                record.status_code = response.status_code
+                record.response = response.data
+                record.save(update_fields=["status_code", "response"])
+            else:
+                record.delete()
+        return response
+
+    return wrapper
+
+
+def replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {"status": "error", "message": f"{HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(record.response, status=record.status_code, headers={"Idempotent-Replayed": "true"})
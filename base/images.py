@@ -0,0 +1,151 @@
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_init, post_save
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {"thumb": 160, "medium": 640, "full": 1600}
+DEFAULT_FORMATS = ("webp", "jpeg")
+FORMAT_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+}
+
+
+def derivative_name(source_name, variant, fmt):
+    """Storage name of a derivative, e.g. derivatives/animal_reports/photo.jpg/medium.webp."""
+    extension = "jpg" if fmt == "jpeg" else fmt
+    return posixpath.join("derivatives", source_name, f"{variant}.{extension}")
+
+
+def render_derivatives(source_path, media_root, source_name, sizes, formats):
+    """
+    Build every variant of one image. Runs in a worker process: it only touches the
+    filesystem and returns plain dicts describing the files it wrote.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as original:
+        # Apply the EXIF orientation, then drop EXIF/ICC/XMP by copying pixels only
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+    results = []
+    for variant, max_edge in sizes.items():
+        resized = image.copy()
+        resized.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        for fmt in formats:
+            name = derivative_name(source_name, variant, fmt)
+            path = os.path.join(media_root, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            output = resized.convert("RGB") if fmt == "jpeg" else resized
+            output.save(path, **FORMAT_OPTIONS[fmt])
+            results.append({
+                "variant": variant,
+                "format": fmt,
+                "name": name,
+                "width": resized.width,
+                "height": resized.height,
+                "size": os.path.getsize(path),
+            })
+    return results
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=getattr(settings, "PHOTO_PIPELINE_WORKERS", 2))
+        return _executor
+
+
+def record_derivatives(source_name, results):
+    from .models import PhotoDerivative
+
+    for result in results:
+        PhotoDerivative.objects.update_or_create(
+            source=source_name,
+            variant=result["variant"],
+            format=result["format"],
+            defaults={
+                "name": result["name"],
+                "width": result["width"],
+                "height": result["height"],
+                "size": result["size"],
+            },
+        )
+
+
+def _on_rendered(source_name, future):
+    # Runs on the executor's callback thread, which has its own DB connection
+    try:
+        record_derivatives(source_name, future.result())
+    except Exception as e:
+        logger.error(f"Failed to build derivatives for {source_name}: {e}")
+    finally:
+        close_old_connections()
+
+
+def process_photo(field_file):
+    """Build derivatives for an ImageField file, in the process pool unless it is disabled."""
+    if not field_file or not field_file.name:
+        return
+    args = (
+        field_file.path,
+        settings.MEDIA_ROOT,
+        field_file.name,
+        getattr(settings, "PHOTO_DERIVATIVE_SIZES", DEFAULT_SIZES),
+        getattr(settings, "PHOTO_DERIVATIVE_FORMATS", DEFAULT_FORMATS),
+    )
+    if not getattr(settings, "PHOTO_PIPELINE_WORKERS", 2):
+        record_derivatives(field_file.name, render_derivatives(*args))
+        return
+    future = get_executor().submit(render_derivatives, *args)
+    future.add_done_callback(lambda f: _on_rendered(field_file.name, f))
+
+
+def schedule_photo(field_file):
+    """Process a freshly saved photo once the surrounding transaction commits."""
+    from .models import PhotoDerivative
+
+    if not field_file or not field_file.name:
+        return
+    # Deduplicated uploads may reuse a blob whose derivatives are already built
+    if PhotoDerivative.objects.filter(source=field_file.name).exists():
+        return
+    transaction.on_commit(lambda: process_photo(field_file))
+
+
+def track_photo_derivatives(model, field_name):
+    """
+    Schedule derivatives whenever `model.<field_name>` gets a new file. Saves that leave the
+    photo alone, such as status updates, cost nothing.
+    """
+    attr = f"_{field_name}_derivative_source"
+
+    def remember(sender, instance, **kwargs):
+        # Raw value, so deferred fields don't trigger a query per instance
+        value = instance.__dict__.get(field_name)
+        setattr(instance, attr, value if isinstance(value, str) else getattr(value, "name", None))
+
+    def on_save(sender, instance, created=False, **kwargs):
+        field_file = getattr(instance, field_name)
+        # New rows built from an existing storage name (e.g. a finished resumable upload)
+        # start out remembering that name, so always schedule them
+        if created or field_file.name != getattr(instance, attr, None):
+            schedule_photo(field_file)
+        setattr(instance, attr, field_file.name)
+
+    uid = f"photo-derivatives-{model._meta.label}-{field_name}"
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(on_save, sender=model, weak=False, dispatch_uid=uid)
@@ -0,0 +1,44 @@
+import os
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from adoption.models import AdoptableAnimal
+from base.images import DEFAULT_FORMATS, DEFAULT_SIZES, get_executor, record_derivatives, render_derivatives
+from base.models import PhotoDerivative
+from rescue.models import AnimalReport, AnimalReportImage
+
+
+class Command(BaseCommand):
+    help = 'Build thumbnail/medium/full derivatives for photos uploaded before the pipeline existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives that already exist')
+
+    def handle(self, *args, **options):
+        sources = set()
+        for model, field in ((AnimalReport, 'photo'), (AnimalReportImage, 'image'), (AdoptableAnimal, 'photo')):
+            sources.update(model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True))
+        if not options['force']:
+            sources -= set(PhotoDerivative.objects.values_list('source', flat=True))
+
+        sizes = getattr(settings, 'PHOTO_DERIVATIVE_SIZES', DEFAULT_SIZES)
+        formats = getattr(settings, 'PHOTO_DERIVATIVE_FORMATS', DEFAULT_FORMATS)
+        executor = get_executor()
+        futures = {
+            executor.submit(render_derivatives, os.path.join(settings.MEDIA_ROOT, name), settings.MEDIA_ROOT, name, sizes, formats): name
+            for name in sorted(sources)
+        }
+
+        built = failed = 0
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                record_derivatives(name, future.result())
+                built += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{name}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Built derivatives for {built} photos ({failed} failed).'))
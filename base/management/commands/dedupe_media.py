@@ -0,0 +1,116 @@
+import os
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from adoption.models import AdoptableAnimal
+from base.images import derivative_name
+from base.models import PhotoDerivative, StoredBlob, UploadSession
+from base.storage import CAS_PREFIX, is_blob_name
+from rescue.models import AnimalReport, AnimalReportImage
+
+PHOTO_FIELDS = ((AnimalReport, 'photo'), (AnimalReportImage, 'image'), (AdoptableAnimal, 'photo'))
+
+
+class Command(BaseCommand):
+    help = 'Move uploads into content-addressed storage, reconcile reference counts and delete unreferenced blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-originals', action='store_true', help='Leave migrated files in their old location')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be collected without deleting')
+
+    def handle(self, *args, **options):
+        migrated = self.migrate_legacy_files(options['keep_originals'] or options['dry_run'], options['dry_run'])
+        self.reconcile_counts()
+        collected, freed = self.collect_garbage(options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Migrated {migrated} files; collected {collected} blobs ({freed / 1024 / 1024:.1f} MB).'
+        ))
+
+    def migrate_legacy_files(self, keep_originals, dry_run):
+        """Hash files saved before content-addressed storage and point their rows at the blob."""
+        migrated = 0
+        for model, field in PHOTO_FIELDS:
+            names = (
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .exclude(**{f'{field}__startswith': CAS_PREFIX})
+                .values_list(field, flat=True).distinct()
+            )
+            for name in names:
+                if not default_storage.exists(name):
+                    self.stderr.write(f'{model._meta.label}.{field}: {name} is missing')
+                    continue
+                if dry_run:
+                    migrated += 1
+                    continue
+                with default_storage.open(name) as source:
+                    blob = default_storage.save(name, source)
+                # queryset.update skips the reference-tracking signals; counts are rebuilt below
+                model.objects.filter(**{field: name}).update(**{field: blob})
+                self.move_derivatives(name, blob)
+                if not keep_originals:
+                    os.remove(default_storage.path(name))
+                migrated += 1
+        return migrated
+
+    def move_derivatives(self, name, blob):
+        """Reuse derivatives of the old file for its blob, unless the blob already has its own."""
+        derivatives = PhotoDerivative.objects.filter(source=name)
+        if PhotoDerivative.objects.filter(source=blob).exists():
+            for derivative in derivatives.values_list('name', flat=True):
+                default_storage.delete(derivative)
+            derivatives.delete()
+        else:
+            derivatives.update(source=blob)
+
+    def reconcile_counts(self):
+        """Rebuild StoredBlob.ref_count from the rows that actually reference each blob."""
+        counts = Counter()
+        for model, field in PHOTO_FIELDS:
+            counts.update(
+                name for name in model.objects.filter(**{f'{field}__startswith': CAS_PREFIX}).values_list(field, flat=True)
+            )
+        known = {blob.name: blob for blob in StoredBlob.objects.all()}
+        stale = []
+        for name, blob in known.items():
+            if blob.ref_count != counts.get(name, 0):
+                blob.ref_count = counts.get(name, 0)
+                stale.append(blob)
+        StoredBlob.objects.bulk_update(stale, ['ref_count'], batch_size=500)
+        StoredBlob.objects.bulk_create(
+            [
+                StoredBlob(name=name, ref_count=count, size=default_storage.size(name))
+                for name, count in counts.items()
+                if name not in known and default_storage.exists(name)
+            ],
+            batch_size=500,
+        )
+
+    def collect_garbage(self, dry_run):
+        """Delete unreferenced blobs, blob files without a row, and their derivatives."""
+        orphaned = set(StoredBlob.objects.filter(ref_count__lte=0).values_list('name', flat=True))
+        # Finished resumable uploads that haven't been attached to a report yet
+        pending = set(UploadSession.objects.filter(status='COMPLETE').values_list('file_name', flat=True))
+        tracked = set(StoredBlob.objects.values_list('name', flat=True))
+        root = default_storage.path(CAS_PREFIX)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d != 'tmp']
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(dirpath, filename), default_storage.location).replace(os.sep, '/')
+                if is_blob_name(name) and name not in tracked:
+                    orphaned.add(name)
+
+        collected = freed = 0
+        for name in sorted(orphaned - pending):
+            if default_storage.exists(name):
+                freed += default_storage.size(name)
+            collected += 1
+            if dry_run:
+                continue
+            for derivative in PhotoDerivative.objects.filter(source=name).values_list('name', flat=True):
+                default_storage.delete(derivative)
+            PhotoDerivative.objects.filter(source=name).delete()
+            default_storage.delete(name)
+            StoredBlob.objects.filter(name=name).delete()
+        return collected, freed
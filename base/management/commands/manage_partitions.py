@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from base.partitions import (
+    convert_to_partitioned,
+    drop_expired_partitions,
+    ensure_partitions,
+    is_partitioned,
+    partitioned_models,
+)
+from base.retention import get_policies
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming daily partitions of PARTITIONED_TABLES and drop those past their retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Convert plain tables to partitioned ones first')
+        parser.add_argument('--days-ahead', type=int, default=None, help='Days of partitions to keep ready (PARTITION_DAYS_AHEAD)')
+        parser.add_argument('--dry-run', action='store_true', help='List expired partitions without dropping them')
+        parser.add_argument('--loop', action='store_true', help='Keep running every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600.0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write('Table partitioning needs PostgreSQL.')
+            return
+
+        policies = get_policies()
+        while True:
+            close_old_connections()
+            for model, field in partitioned_models():
+                label = model._meta.label
+                if not is_partitioned(model):
+                    if not options['convert']:
+                        self.stderr.write(f'{label} is not partitioned yet; run with --convert')
+                        continue
+                    convert_to_partitioned(model, field)
+                    self.stdout.write(f'{label}: converted to daily partitions on {field}')
+
+                created = ensure_partitions(model, options['days_ahead'])
+                self.stdout.write(f"{label}: created {len(created)} partitions {', '.join(created)}")
+
+                policy = policies.get(label)
+                if policy:
+                    cutoff = timezone.now() - timedelta(seconds=policy['max_age'])
+                    dropped = drop_expired_partitions(model, cutoff, dry_run=options['dry_run'])
+                    verb = 'would drop' if options['dry_run'] else 'dropped'
+                    self.stdout.write(f"{label}: {verb} {len(dropped)} partitions {', '.join(dropped)}")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
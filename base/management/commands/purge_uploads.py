@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from base.chunked import purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable upload sessions idle for longer than CHUNKED_UPLOAD_EXPIRY, with their chunk files'
+
+    def handle(self, *args, **options):
+        purged = purge_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} upload sessions.'))
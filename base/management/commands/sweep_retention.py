@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from base.retention import get_policies, sweep
+
+
+class Command(BaseCommand):
+    help = 'Delete rows past their retention period (RETENTION_POLICIES) in bounded primary-key batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', action='append', dest='tables', help='Only sweep this app.Model (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Count expired rows without deleting them')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600.0)
+
+    def handle(self, *args, **options):
+        unknown = set(options['tables'] or ()) - set(get_policies())
+        if unknown:
+            self.stderr.write(f"No retention policy for: {', '.join(sorted(unknown))}")
+            return
+
+        while True:
+            close_old_connections()
+            for label, stats in sweep(options['tables'], dry_run=options['dry_run']).items():
+                verb = 'would delete' if options['dry_run'] else 'deleted'
+                partitions = f" and {stats['partitions_dropped']} partitions" if stats['partitions_dropped'] else ''
+                self.stdout.write(
+                    f"{label}: {verb} {stats['deleted']} rows in {stats['batches']} batches{partitions}, "
+                    f"{stats['elapsed_s']} s ({stats['rows_per_s']} rows/s)"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -1,3 +1,7 @@
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 class JobOpening(models.Model):
@@ -7,3 +11,72 @@ class JobOpening(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class PhotoDerivative(models.Model):
+    """Resized, metadata-free copy of an uploaded photo (see base/images.py)."""
+    source = models.CharField(max_length=255, db_index=True)  # Storage name of the original upload
+    variant = models.CharField(max_length=20)  # thumb, medium or full
+    format = models.CharField(max_length=10)  # webp or jpeg
+    name = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()  # Bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source', 'variant', 'format')
+
+    def __str__(self):
+        return f"{self.source} [{self.variant}.{self.format}] {self.width}x{self.height}"
+
+
+class StoredBlob(models.Model):
+    """A deduplicated upload in content-addressed storage and how many rows reference it."""
+    name = models.CharField(max_length=255, unique=True)  # cas/ab/cd/<sha256>.<ext>
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class UploadSession(models.Model):
+    """A resumable photo upload; chunks are appended on local disk until it is finalized (see base/chunked.py)."""
+    STATUS_CHOICES = (
+        ('UPLOADING', 'Uploading'),
+        ('COMPLETE', 'Complete'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()  # Expected total bytes
+    received = models.PositiveBigIntegerField(default=0)  # Bytes written so far, i.e. the next offset
+    sha256 = models.CharField(max_length=64, blank=True)  # Optional checksum supplied by the client
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='UPLOADING')
+    file_name = models.CharField(max_length=255, blank=True)  # Storage name once complete
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes, {self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of a request sent with an Idempotency-Key header (see base/idempotency.py)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 of method, path and request fields
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
@@ -0,0 +1,175 @@
+import logging
+import re
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITIONED_TABLES = {
+    "rescue.UserLocationHistory": "timestamp",
+}
+
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def get_partitioned_tables():
+    """PARTITIONED_TABLES: {"app.Model": <datetime field the table is range-partitioned on by day>}."""
+    return getattr(settings, "PARTITIONED_TABLES", DEFAULT_PARTITIONED_TABLES)
+
+
+def partition_name(table, day):
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def legacy_partition_name(table):
+    return f"{table}_legacy"
+
+
+def _day_start(day):
+    return datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def is_partitioned(model):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [model._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def convert_to_partitioned(model, field):
+    """
+    Turn `model`'s plain table into one range-partitioned by day on `field`. The existing
+    table is attached as-is as the partition for everything up to the end of the day of its
+    newest row (at least until today), so no rows are copied; it is dropped like any other
+    partition once all of it has expired. The primary key becomes (id, field), as
+    PostgreSQL requires the partition key in unique constraints.
+    """
+    opts = model._meta
+    table, pk = opts.db_table, opts.pk.column
+    column = opts.get_field(field).column
+    legacy = legacy_partition_name(table)
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING IDENTITY "
+            f"INCLUDING CONSTRAINTS) PARTITION BY RANGE ({qn(column)})"
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY ({qn(pk)}, {qn(column)})")
+
+        # LIKE copies neither indexes nor foreign keys
+        for index in opts.indexes:
+            columns = ", ".join(qn(opts.get_field(name.lstrip("-")).column) for name in index.fields)
+            cursor.execute(f"CREATE INDEX {qn(index.name + '_part')} ON {qn(table)} ({columns})")
+        for f in opts.concrete_fields:
+            if getattr(f, "spatial_index", False):
+                cursor.execute(f"CREATE INDEX {qn(f'{table}_{f.column}_gist')} ON {qn(table)} USING GIST ({qn(f.column)})")
+            if f.remote_field and f.db_constraint:
+                target = f.target_field
+                cursor.execute(
+                    f"ALTER TABLE {qn(table)} ADD FOREIGN KEY ({qn(f.column)}) "
+                    f"REFERENCES {qn(target.model._meta.db_table)} ({qn(target.column)}) DEFERRABLE INITIALLY DEFERRED"
+                )
+
+        # New ids continue after the legacy ones, whether the key is an identity or a serial column
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, pk])
+        (sequence,) = cursor.fetchone()
+        if sequence:
+            cursor.execute(
+                f"SELECT setval(%s, (SELECT COALESCE(MAX({qn(pk)}), 0) + 1 FROM {qn(legacy)}), false)", [sequence]
+            )
+        else:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [legacy, pk])
+            (sequence,) = cursor.fetchone()
+            if sequence:
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.{qn(pk)}")
+
+        # The bound has to cover every row already in the table, including today's
+        cursor.execute(f"SELECT MAX({qn(column)}) FROM {qn(legacy)}")
+        (newest,) = cursor.fetchone()
+        end = today if newest is None else max(today, newest.astimezone(dt_timezone.utc).date() + timedelta(days=1))
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} FOR VALUES FROM (MINVALUE) TO (%s)",
+            [_day_start(end)],
+        )
+        # Catches rows outside every daily partition, e.g. an old offline track
+        cursor.execute(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+    logger.info(f"Converted {table} to daily partitions on {column}")
+
+
+def ensure_partitions(model, days_ahead=None, today=None):
+    """
+    Create the daily partitions from today to `days_ahead` days out, starting after the end
+    of the legacy partition if that still covers today. Returns the names created.
+    """
+    days_ahead = getattr(settings, "PARTITION_DAYS_AHEAD", 7) if days_ahead is None else days_ahead
+    today = today or timezone.now().astimezone(dt_timezone.utc).date()
+    table = model._meta.db_table
+    qn = connection.ops.quote_name
+    existing = dict(list_partitions(model))
+    legacy_end = existing.get(legacy_partition_name(table))
+    first = max(today, legacy_end.astimezone(dt_timezone.utc).date()) if legacy_end else today
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range((today + timedelta(days=days_ahead) - first).days + 1):
+            day = first + timedelta(days=offset)
+            name = partition_name(table, day)
+            if name in existing:
+                continue
+            try:
+                with transaction.atomic():
+                    cursor.execute(
+                        f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)",
+                        [_day_start(day), _day_start(day + timedelta(days=1))],
+                    )
+                created.append(name)
+            except DatabaseError as e:
+                # E.g. the default partition already holds rows for that day
+                logger.warning(f"Could not create partition {name}: {e}")
+    return created
+
+
+def list_partitions(model):
+    """[(name, upper_bound)] of `model`'s partitions; the bound is None for the default partition."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s ORDER BY c.relname",
+            [model._meta.db_table],
+        )
+        partitions = []
+        for name, bound in cursor.fetchall():
+            match = _UPPER_BOUND.search(bound or "")
+            partitions.append((name, parse_datetime(match.group(1)) if match else None))
+        return partitions
+
+
+def drop_expired_partitions(model, cutoff, dry_run=False):
+    """
+    Drop every partition whose rows are all older than `cutoff`. Dropping a partition is a
+    catalog change, so it costs the same for a day of pings as for an empty table and
+    leaves no dead tuples to vacuum. Returns the names dropped.
+    """
+    qn = connection.ops.quote_name
+    expired = [name for name, upper in list_partitions(model) if upper is not None and upper <= cutoff]
+    if not dry_run:
+        with connection.cursor() as cursor:
+            for name in expired:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+                logger.info(f"Dropped expired partition {name}")
+    return expired
+
+
+def partitioned_models():
+    return [(apps.get_model(label), field) for label, field in get_partitioned_tables().items()]
@@ -0,0 +1,84 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .partitions import drop_expired_partitions, is_partitioned
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICIES = {
+    "rescue.VolunteerLocation": {"field": "updated_at", "max_age": 24 * 3600},
+    "rescue.UserLocationHistory": {"field": "timestamp", "max_age": 24 * 3600},
+    "chatbot.ChatMessage": {"field": "timestamp", "max_age": 90 * 24 * 3600},
+    "base.IdempotencyKey": {"field": "expires_at", "max_age": 0},
+}
+
+
+def get_policies():
+    """RETENTION_POLICIES: {"app.Model": {"field": <datetime field>, "max_age": <seconds>}}."""
+    return getattr(settings, "RETENTION_POLICIES", DEFAULT_POLICIES)
+
+
+def retention_cutoff(label, now=None):
+    """Oldest timestamp still kept for `label`, or None without a policy. Filtering on it lets
+    PostgreSQL skip partitions that only hold expired rows."""
+    policy = get_policies().get(label)
+    if not policy:
+        return None
+    return (now or timezone.now()) - timedelta(seconds=policy["max_age"])
+
+
+def sweep_table(label, field, max_age, batch_size=None, pause=None, dry_run=False, now=None):
+    """
+    Delete rows of `label` whose `field` is older than `max_age` seconds. Rows are deleted
+    in primary-key windows of `batch_size` ids, each in its own short statement, so the
+    sweep never holds long locks or builds one huge transaction; `pause` seconds between
+    batches leave room for other writers. Tables partitioned by `field` first have their
+    fully expired partitions dropped, leaving only the boundary day for row deletes.
+    Returns {"deleted", "batches", "partitions_dropped", "elapsed_s", "rows_per_s"}.
+    """
+    model = apps.get_model(label)
+    batch_size = batch_size or getattr(settings, "RETENTION_BATCH_SIZE", 5000)
+    pause = getattr(settings, "RETENTION_BATCH_PAUSE", 0.05) if pause is None else pause
+    cutoff = (now or timezone.now()) - timedelta(seconds=max_age)
+    expired = model._base_manager.filter(**{f"{field}__lt": cutoff})
+
+    started = time.perf_counter()
+    deleted = batches = 0
+    dropped = drop_expired_partitions(model, cutoff, dry_run=dry_run) if is_partitioned(model) else []
+    bounds = expired.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is not None:
+        if dry_run:
+            deleted = expired.count()
+        else:
+            for low in range(bounds["low"], bounds["high"] + 1, batch_size):
+                count, _ = expired.filter(pk__gte=low, pk__lt=low + batch_size).delete()
+                deleted += count
+                batches += 1
+                if pause and count:
+                    time.sleep(pause)
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "deleted": deleted,
+        "batches": batches,
+        "partitions_dropped": len(dropped),
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_s": round(deleted / elapsed) if elapsed and deleted else 0,
+    }
+    logger.info(f"Retention sweep of {label}: {stats}")
+    return stats
+
+
+def sweep(labels=None, dry_run=False):
+    """Apply every configured retention policy (or only those in `labels`). Returns {label: stats}."""
+    return {
+        label: sweep_table(label, policy["field"], policy["max_age"], dry_run=dry_run)
+        for label, policy in get_policies().items()
+        if not labels or label in labels
+    }
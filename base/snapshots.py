@@ -0,0 +1,89 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+KEY_PREFIX = "snapshot"
+
+
+def _cache():
+    return caches[getattr(settings, "SNAPSHOT_CACHE", "default")]
+
+
+def _version_key(name):
+    return f"{KEY_PREFIX}:{name}:version"
+
+
+def snapshot_version(name):
+    """
+    Current version of a named snapshot. Versions start from the clock, so a version key
+    lost from the cache restarts above every version cached before it.
+    """
+    cache = _cache()
+    version = cache.get(_version_key(name))
+    if version is None:
+        cache.add(_version_key(name), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def invalidate_snapshot(*names):
+    """Move the named snapshots to a new version once the current transaction commits."""
+    def bump():
+        cache = _cache()
+        for name in names:
+            try:
+                cache.incr(_version_key(name))
+            except ValueError:
+                cache.add(_version_key(name), time.time_ns(), timeout=None)
+    transaction.on_commit(bump)
+
+
+def snapshot_response(request, name, build, timeout=None):
+    """
+    Serve the listing snapshot `name`, calling `build()` for its data only when the current
+    version is not cached yet. The JSON bytes are cached with a strong ETag of their content,
+    so a hit is a cache read and a matching If-None-Match gets 304 Not Modified.
+    """
+    cache = _cache()
+    key = f"{KEY_PREFIX}:{name}:{snapshot_version(name)}"
+    snapshot = cache.get(key)
+    if snapshot is None:
+        body = JSONRenderer().render(build())
+        snapshot = (f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+        cache.set(key, snapshot, timeout=timeout or getattr(settings, "SNAPSHOT_CACHE_TIMEOUT", 300))
+    etag, body = snapshot
+
+    client_etags = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in client_etags or "*" in client_etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    # Browsers keep the body and revalidate every poll with If-None-Match
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+class SnapshotListMixin:
+    """
+    For list views whose output is the same for every caller: serves it through
+    snapshot_response under `snapshot_name`, rebuilt only after invalidate_snapshot().
+    Authentication is left lazy, so views with AllowAny answer without a session lookup.
+    """
+
+    snapshot_name = None
+    snapshot_timeout = None
+
+    def perform_authentication(self, request):
+        pass
+
+    def list(self, request, *args, **kwargs):
+        def build():
+            return self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data
+        return snapshot_response(request, self.snapshot_name, build, self.snapshot_timeout)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+
+CAS_PREFIX = "cas/"
+
+
+def blob_name(digest, extension):
+    """Sharded storage name for a content hash, e.g. cas/ab/cd/abcd...ef.jpg."""
+    return f"{CAS_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(CAS_PREFIX)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each upload once under the SHA-256 of its bytes. The hash is computed while
+    the upload is streamed to a temporary file, so identical photos share a single blob
+    instead of being saved again with a random suffix.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save, so collisions mean identical bytes
+        return name
+
+    def _save(self, name, content):
+        extension = posixpath.splitext(name)[1].lower()
+        tmp_dir = self.path(f"{CAS_PREFIX}tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            final_name = blob_name(digest.hexdigest(), extension)
+            final_path = self.path(final_name)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return final_name
+
+
+def _change_refs(name, delta):
+    from django.core.files.storage import default_storage
+    from .models import StoredBlob
+
+    if not is_blob_name(name):
+        return
+    updated = StoredBlob.objects.filter(name=name).update(ref_count=F("ref_count") + delta)
+    if not updated and delta > 0:
+        blob, created = StoredBlob.objects.get_or_create(
+            name=name, defaults={"ref_count": delta, "size": default_storage.size(name)}
+        )
+        if not created:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + delta)
+
+
+def add_references(field_files):
+    """Count new references for files saved without model signals, e.g. via bulk_create."""
+    for name, count in Counter(f.name for f in field_files if f).items():
+        _change_refs(name, count)
+
+
+def track_blob_references(model, field_name):
+    """Keep StoredBlob.ref_count in step with `model.<field_name>` across saves and deletes."""
+    attr = f"_{field_name}_blob_name"
+
+    def remember(sender, instance, **kwargs):
+        # Read the raw value so deferred fields don't trigger a query per instance;
+        # None means unknown, and the dedupe_media command reconciles those counts
+        value = instance.__dict__.get(field_name)
+        setattr(instance, attr, value if isinstance(value, str) else getattr(value, "name", None))
+
+    def on_save(sender, instance, created=False, **kwargs):
+        # A new row references nothing yet, even when it was built with a storage name
+        old = "" if created else getattr(instance, attr, None)
+        new = getattr(instance, field_name).name or ""
+        if old is not None and old != new:
+            _change_refs(new, 1)
+            _change_refs(old, -1)
+        setattr(instance, attr, new)
+
+    def on_delete(sender, instance, **kwargs):
+        old = getattr(instance, attr, None)
+        if old is not None:
+            _change_refs(old, -1)
+
+    uid = f"blob-refs-{model._meta.label}-{field_name}"
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(on_save, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(on_delete, sender=model, weak=False, dispatch_uid=uid)
@@ -0,0 +1,47 @@
+import time
+
+from django import template
+from django.core.files.storage import default_storage
+
+from base.models import PhotoDerivative
+
+register = template.Library()
+
+# Derivative names already recorded as built, keyed by (source, variant, format). Derivatives
+# are never rebuilt under another name, so a hit stays valid for the life of the process.
+_built = {}
+BUILT_CACHE_SIZE = 10000
+# Derivatives not built yet, with when to look again, so a list page of fresh photos
+# doesn't query for each of them on every render while the pool catches up
+_missing = {}
+MISSING_TTL = 30
+
+
+@register.filter
+def variant_url(field_file, spec="medium"):
+    """
+    URL of a photo derivative, e.g. {{ report.photo|variant_url:"thumb.webp" }}.
+    Falls back to the original upload until the derivative has been recorded.
+    """
+    if not field_file:
+        return ""
+    variant, _, fmt = spec.partition(".")
+    key = (field_file.name, variant, fmt or "jpeg")
+    name = _built.get(key)
+    if name is None:
+        now = time.monotonic()
+        if _missing.get(key, 0) > now:
+            return field_file.url
+        name = PhotoDerivative.objects.filter(
+            source=key[0], variant=key[1], format=key[2]
+        ).values_list("name", flat=True).first()
+        if name is None:
+            if len(_missing) >= BUILT_CACHE_SIZE:
+                _missing.clear()
+            _missing[key] = now + MISSING_TTL
+            return field_file.url
+        if len(_built) >= BUILT_CACHE_SIZE:
+            _built.clear()
+        _missing.pop(key, None)
+        _built[key] = name
+    return default_storage.url(name)
@@ -1,3 +1,316 @@
-from django.test import TestCase
+import hashlib
+import io
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .models import StoredBlob
+
+
+class MediaRootMixin:
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, CHUNKED_UPLOAD_DIR=media_root + "/chunks")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_animal(self, content):
+        from adoption.models import AdoptableAnimal
+
+        animal = AdoptableAnimal(category="Dog", description="Friendly")
+        animal.photo.save("dog.jpg", ContentFile(content))
+        return animal
+
+    def ref_count(self, name):
+        return StoredBlob.objects.get(name=name).ref_count
+
+
+class BlobReferenceTest(MediaRootMixin, TestCase):
+    def test_identical_uploads_share_one_blob(self):
+        first = self.create_animal(b"same photo")
+        second = self.create_animal(b"same photo")
+
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertTrue(first.photo.name.startswith("cas/"))
+        self.assertEqual(self.ref_count(first.photo.name), 2)
+
+    def test_row_created_from_a_storage_name_takes_a_reference(self):
+        from adoption.models import AdoptableAnimal
+
+        name = default_storage.save("dog.jpg", ContentFile(b"resumed photo"))
+        with mock.patch("base.images.process_photo") as process_photo, self.captureOnCommitCallbacks(execute=True):
+            AdoptableAnimal.objects.create(category="Dog", description="Friendly", photo=name)
+        self.assertEqual(self.ref_count(name), 1)
+        process_photo.assert_called_once()
+
+    def test_replacing_and_deleting_release_references(self):
+        first = self.create_animal(b"same photo")
+        second = self.create_animal(b"same photo")
+        shared = first.photo.name
+
+        second.photo.save("cat.jpg", ContentFile(b"other photo"))
+        self.assertEqual(self.ref_count(shared), 1)
+        self.assertEqual(self.ref_count(second.photo.name), 1)
+
+        first.delete()
+        self.assertEqual(self.ref_count(shared), 0)
+        # Loaded rows know their photo too, not only the instance that saved it
+        type(second).objects.get(pk=second.pk).delete()
+        self.assertEqual(self.ref_count(second.photo.name), 0)
+
+
+class DedupeMediaTest(MediaRootMixin, TestCase):
+    def test_reconciles_counts_and_collects_only_unheld_blobs(self):
+        from django.contrib.auth.models import User
+
+        from .models import UploadSession
+
+        referenced = self.create_animal(b"kept photo").photo.name
+        self.create_animal(b"kept photo")
+        orphaned = default_storage.save("orphan.jpg", ContentFile(b"orphaned photo"))
+        StoredBlob.objects.create(name=orphaned, size=14, ref_count=0)
+        untracked = default_storage.save("stray.jpg", ContentFile(b"stray photo"))
+        uploaded = default_storage.save("upload.jpg", ContentFile(b"uploaded photo"))
+        UploadSession.objects.create(
+            user=User.objects.create_user(username="reporter"), filename="upload.jpg",
+            size=14, received=14, status="COMPLETE", file_name=uploaded,
+        )
+        # Counts drift when rows change through queryset.update or bulk operations
+        StoredBlob.objects.filter(name=referenced).update(ref_count=7)
+
+        call_command("dedupe_media", stdout=io.StringIO())
+
+        self.assertEqual(self.ref_count(referenced), 2)
+        self.assertTrue(default_storage.exists(referenced))
+        self.assertTrue(default_storage.exists(uploaded))
+        self.assertFalse(default_storage.exists(orphaned))
+        self.assertFalse(default_storage.exists(untracked))
+        self.assertFalse(StoredBlob.objects.filter(name=orphaned).exists())
+
+
+class FinalizeUploadTest(MediaRootMixin, TestCase):
+    def upload(self, checksum=None):
+        from PIL import Image
+        from django.contrib.auth.models import User
+
+        from .chunked import start_upload, write_chunk
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), "orange").save(buffer, "PNG")
+        photo = buffer.getvalue()
+        user = User.objects.create_user(username="reporter")
+        session = start_upload(user, "dog.png", len(photo), sha256=checksum or hashlib.sha256(photo).hexdigest())
+        write_chunk(session.pk, 0, photo)
+        return session
+
+    def test_checksum_mismatch_is_rejected_before_storage(self):
+        from .chunked import UploadConflict, finalize_upload
+
+        session = self.upload(checksum="0" * 64)
+        with self.assertRaises(UploadConflict):
+            finalize_upload(session.pk)
+        session.refresh_from_db()
+        self.assertEqual((session.status, session.received), ("UPLOADING", 0))
+        self.assertFalse(default_storage.exists("cas"))
+
+    def test_matching_checksum_completes(self):
+        from .chunked import finalize_upload
+
+        session = finalize_upload(self.upload().pk)
+        self.assertEqual(session.status, "COMPLETE")
+        self.assertTrue(default_storage.exists(session.file_name))
+
+
+class PartitionTest(SimpleTestCase):
+    def mock_cursor(self, rows=()):
+        patcher = mock.patch("base.partitions.connection")
+        connection = patcher.start()
+        self.addCleanup(patcher.stop)
+        connection.ops.quote_name = lambda name: f'"{name}"'
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = list(rows)
+        return cursor
+
+    def test_list_partitions_parses_names_and_upper_bounds(self):
+        from .partitions import list_partitions
+
+        self.mock_cursor([
+            ("history_default", "DEFAULT"),
+            ("history_legacy", "FOR VALUES FROM (MINVALUE) TO ('2025-03-02 00:00:00+00')"),
+            ("history_p20250302", "FOR VALUES FROM ('2025-03-02 00:00:00+00') TO ('2025-03-03 00:00:00+00')"),
+        ])
+        model = mock.Mock(**{"_meta.db_table": "history"})
+        self.assertEqual(list_partitions(model), [
+            ("history_default", None),
+            ("history_legacy", datetime(2025, 3, 2, tzinfo=dt_timezone.utc)),
+            ("history_p20250302", datetime(2025, 3, 3, tzinfo=dt_timezone.utc)),
+        ])
+
+    def test_drop_expired_partitions_keeps_partitions_ending_after_cutoff(self):
+        from .partitions import drop_expired_partitions
+
+        cursor = self.mock_cursor()
+        day = lambda n: datetime(2025, 3, n, tzinfo=dt_timezone.utc)
+        partitions = [("history_default", None), ("history_p20250301", day(2)), ("history_p20250302", day(3))]
+        with mock.patch("base.partitions.list_partitions", return_value=partitions):
+            self.assertEqual(drop_expired_partitions(mock.Mock(), day(2)), ["history_p20250301"])
+            self.assertEqual(drop_expired_partitions(mock.Mock(), day(2) + timedelta(hours=12)), ["history_p20250301"])
+        cursor.execute.assert_called_with('DROP TABLE "history_p20250301"')
+
+    def test_ensure_partitions_starts_after_legacy_partition(self):
+        from .partitions import ensure_partitions
+
+        cursor = self.mock_cursor()
+        model = mock.Mock(**{"_meta.db_table": "history"})
+        legacy = [("history_legacy", datetime(2025, 3, 3, tzinfo=dt_timezone.utc))]
+        with mock.patch("base.partitions.list_partitions", return_value=legacy), mock.patch("base.partitions.transaction"):
+            created = ensure_partitions(model, days_ahead=2, today=date(2025, 3, 2))
+        self.assertEqual(created, ["history_p20250303", "history_p20250304"])
+        self.assertEqual(cursor.execute.call_count, 2)
+
+
+class RetentionSweepTest(TestCase):
+    def test_rows_are_deleted_only_after_expired_partitions_are_dropped(self):
+        from django.contrib.auth.models import User
+
+        from .models import IdempotencyKey
+        from .retention import sweep_table
+
+        now = datetime(2025, 3, 3, 12, tzinfo=dt_timezone.utc)
+        user = User.objects.create_user(username="reporter")
+        for key, age in (("old", timedelta(days=2)), ("boundary", timedelta(hours=13)), ("fresh", timedelta(hours=1))):
+            IdempotencyKey.objects.create(user=user, key=key, fingerprint="", expires_at=now - age)
+
+        def drop(model, cutoff, dry_run=False):
+            # What dropping the 2025-03-01 partition does to the table
+            self.assertEqual(IdempotencyKey.objects.count(), 3)
+            IdempotencyKey.objects.filter(expires_at__lt=datetime(2025, 3, 2, tzinfo=dt_timezone.utc)).delete()
+            return ["idempotency_p20250301"]
+
+        with mock.patch("base.retention.is_partitioned", return_value=True), \
+                mock.patch("base.retention.drop_expired_partitions", side_effect=drop):
+            stats = sweep_table("base.IdempotencyKey", "expires_at", 12 * 3600, pause=0, now=now)
+
+        self.assertEqual((stats["partitions_dropped"], stats["deleted"]), (1, 1))
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["fresh"])
+
+
+    def create_keys(self, now, ages):
+        from django.contrib.auth.models import User
+
+        from .models import IdempotencyKey
+
+        user = User.objects.create_user(username="sweeper")
+        return [
+            IdempotencyKey.objects.create(user=user, key=f"key-{i}", fingerprint="", expires_at=now - age)
+            for i, age in enumerate(ages)
+        ]
+
+    def test_expired_rows_are_deleted_in_primary_key_windows(self):
+        from .models import IdempotencyKey
+        from .retention import sweep_table
+
+        now = timezone.now()
+        hour = timedelta(hours=1)
+        keys = self.create_keys(now, [3 * hour, 2 * hour, -hour, 5 * hour, 4 * hour, -2 * hour, 2 * hour])
+        expired_pks = [key.pk for key in keys if key.expires_at < now - hour / 2]
+
+        with mock.patch("base.retention.time.sleep") as sleep:
+            stats = sweep_table("base.IdempotencyKey", "expires_at", 1800, batch_size=2, pause=0.01, now=now)
+
+        # Windows of 2 ids from the lowest to the highest expired pk
+        self.assertEqual(stats["batches"], (max(expired_pks) - min(expired_pks)) // 2 + 1)
+        self.assertEqual(stats["deleted"], 5)
+        self.assertEqual(stats["partitions_dropped"], 0)
+        self.assertEqual(sleep.call_count, stats["batches"])  # A pause after every window that deleted rows
+        self.assertEqual(
+            sorted(IdempotencyKey.objects.values_list("key", flat=True)), ["key-2", "key-5"]
+        )
+
+    def test_dry_run_counts_without_deleting(self):
+        from .models import IdempotencyKey
+
+        now = timezone.now()
+        self.create_keys(now, [timedelta(hours=2), timedelta(hours=-2)])
+        out = io.StringIO()
+        call_command("sweep_retention", "--table", "base.IdempotencyKey", "--dry-run", stdout=out)
+        self.assertIn("base.IdempotencyKey: would delete 1 rows", out.getvalue())
+        self.assertEqual(IdempotencyKey.objects.count(), 2)
+
+
+class IdempotencyTest(TestCase):
+    def test_view_that_handles_a_database_error_releases_the_key(self):
+        from django.contrib.auth.models import User
+        from django.db import IntegrityError
+        from rest_framework.decorators import api_view
+        from rest_framework.response import Response
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        from .idempotency import idempotent
+        from .models import IdempotencyKey
+
+        user = User.objects.create_user(username="reporter")
+
+        @api_view(["POST"])
+        @idempotent
+        def create(request):
+            try:
+                # Fails on the key row the decorator just inserted
+                IdempotencyKey.objects.create(user=request.user, key="retry-1", fingerprint="", expires_at=timezone.now())
+            except IntegrityError:
+                return Response({"status": "error"}, status=500)
+            return Response({"status": "success"}, status=201)
+
+        request = APIRequestFactory().post("/reports/", {}, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        force_authenticate(request, user=user)
+        self.assertEqual(create(request).status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_retention_sweep_removes_expired_keys(self):
+        from django.contrib.auth.models import User
+
+        from .models import IdempotencyKey
+        from .retention import sweep
+
+        user = User.objects.create_user(username="reporter")
+        IdempotencyKey.objects.create(user=user, key="old", fingerprint="", expires_at=timezone.now() - timedelta(minutes=1))
+        IdempotencyKey.objects.create(user=user, key="new", fingerprint="", expires_at=timezone.now() + timedelta(hours=1))
+        with override_settings(RETENTION_BATCH_PAUSE=0):
+            sweep(["base.IdempotencyKey"])
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["new"])
+
+
+class VariantUrlTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        from .templatetags import photos
+
+        self.addCleanup(photos._built.clear)
+        self.addCleanup(photos._missing.clear)
+
+    def test_falls_back_to_original_until_derivative_is_recorded(self):
+        from .images import derivative_name
+        from .models import PhotoDerivative
+        from .templatetags.photos import variant_url
+
+        photo = self.create_animal(b"new photo").photo
+        with self.assertNumQueries(1):
+            self.assertEqual(variant_url(photo, "thumb.webp"), photo.url)
+            self.assertEqual(variant_url(photo, "thumb.webp"), photo.url)  # Miss is remembered
+
+        name = derivative_name(photo.name, "thumb", "webp")
+        PhotoDerivative.objects.create(source=photo.name, variant="thumb", format="webp", name=name, width=1, height=1, size=1)
+        later = time.monotonic() + 60
+        with mock.patch("base.templatetags.photos.time.monotonic", return_value=later), self.assertNumQueries(1):
+            self.assertEqual(variant_url(photo, "thumb.webp"), default_storage.url(name))
+            self.assertEqual(variant_url(photo, "thumb.webp"), default_storage.url(name))
+        self.assertEqual(variant_url(None), "")
@@ -0,0 +1,67 @@
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+MB = 1024 * 1024
+
+
+class UploadLimitExceeded(MultiPartParserError):
+    """Raised while parsing a multipart body that breaks the configured photo upload limits."""
+
+
+class SpooledPhotoUploadHandler(FileUploadHandler):
+    """
+    Streams every uploaded file into a SpooledTemporaryFile that rolls over to disk past
+    PHOTO_UPLOAD_MEMORY_THRESHOLD bytes, and aborts the parse as soon as the request has
+    more than PHOTO_UPLOAD_MAX_FILES files or a file/the whole body goes over its size limit.
+    Install it before the request body is read, e.g. in a view's initialize_request.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.memory_threshold = getattr(settings, "PHOTO_UPLOAD_MEMORY_THRESHOLD", 1 * MB)
+        self.max_files = getattr(settings, "PHOTO_UPLOAD_MAX_FILES", 10)
+        self.max_file_size = getattr(settings, "PHOTO_UPLOAD_MAX_FILE_SIZE", 10 * MB)
+        self.max_total_size = getattr(settings, "PHOTO_UPLOAD_MAX_TOTAL_SIZE", 60 * MB)
+        self.file_count = 0
+        self.total_size = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Reject oversized bodies from the Content-Length header before reading anything
+        if content_length and content_length > self.max_total_size:
+            raise UploadLimitExceeded(
+                f"Upload of {content_length} bytes exceeds the {self.max_total_size} byte limit"
+            )
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file_count += 1
+        if self.file_count > self.max_files:
+            raise UploadLimitExceeded(f"At most {self.max_files} files can be uploaded at once")
+        self.file = tempfile.SpooledTemporaryFile(max_size=self.memory_threshold, suffix=".upload")
+
+    def receive_data_chunk(self, raw_data, start):
+        self.total_size += len(raw_data)
+        if start + len(raw_data) > self.max_file_size:
+            raise UploadLimitExceeded(f"{self.file_name} exceeds the {self.max_file_size} byte limit per file")
+        if self.total_size > self.max_total_size:
+            raise UploadLimitExceeded(f"Uploaded files exceed the {self.max_total_size} byte limit")
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        return UploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
@@ -1,6 +1,6 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.core.mail import send_mail
+from jobqueue.jobs import queue_mail
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
 from django.conf import settings
@@ -24,12 +24,11 @@ def contact_us(request):
         body = f"Name: {name}\nEmail: {email}\n\nMessage:\n{message}"
 
         try:
-            send_mail(
+            queue_mail(
                 subject, 
                 body, 
                 email, 
                 [settings.DEFAULT_FROM_EMAIL],  # Replace with the receiver's email
-                fail_silently=False
             )
             messages.success(request, "Your message has been sent successfully!")
         except Exception as e:
@@ -51,13 +50,12 @@ def send_notification_email(request):
         return JsonResponse({"error": "Invalid email address!"}, status=400)
 
     try:
-        # Send Email
-        send_mail(
+        # Queue Email
+        queue_mail(
             "Wesalvator - Stay Notified!",
             "Thank you for subscribing! We will notify you when we launch.",
             settings.DEFAULT_FROM_EMAIL,  # Ensure SMTP is correctly configured
             [email],
-            fail_silently=False,
         )
         return JsonResponse({"success": "Notification email sent successfully!"})
     
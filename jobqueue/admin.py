@@ -0,0 +1,23 @@
+from django.contrib import admin
+from .models import Job, DeadLetterJob
+from .queue import requeue
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'created_at')
+    list_filter = ('name', 'status')
+
+
+class DeadLetterJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'attempts', 'created_at', 'failed_at')
+    list_filter = ('name',)
+    actions = ['requeue_jobs']
+
+    @admin.action(description='Requeue selected jobs')
+    def requeue_jobs(self, request, queryset):
+        for dead_letter in queryset:
+            requeue(dead_letter)
+
+
+admin.site.register(Job, JobAdmin)
+admin.site.register(DeadLetterJob, DeadLetterJobAdmin)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobqueueConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobqueue'
+
+    def ready(self):
+        # Register job handlers declared in each app's jobs.py
+        autodiscover_modules('jobs')
@@ -0,0 +1,21 @@
+from django.core.mail import send_mail
+
+from .queue import enqueue, register
+
+
+@register('jobqueue.send_mail')
+def deliver_mail(subject, message, from_email, recipient_list, html_message=None):
+    # Raise on SMTP errors so the worker retries with backoff
+    send_mail(subject, message, from_email, recipient_list, fail_silently=False, html_message=html_message)
+
+
+def queue_mail(subject, message, from_email, recipient_list, html_message=None):
+    """Queue an email for background delivery instead of blocking on the SMTP handshake."""
+    return enqueue(
+        'jobqueue.send_mail',
+        subject=subject,
+        message=message,
+        from_email=from_email,
+        recipient_list=list(recipient_list),
+        html_message=html_message,
+    )
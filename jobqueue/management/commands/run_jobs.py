@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobqueue.queue import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (emails and other dispatch side effects)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process due jobs once and exit')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed per database round trip')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Job worker started.'))
+        while True:
+            close_old_connections()
+            succeeded, failed = run_pending(options['batch'])
+            if succeeded or failed:
+                self.stdout.write(f'Ran {succeeded + failed} jobs ({failed} failed)')
+            if options['once'] and not (succeeded or failed):
+                break
+            if not (succeeded or failed):
+                time.sleep(options['sleep'])
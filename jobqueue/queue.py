@@ -0,0 +1,117 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job, DeadLetterJob
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def register(name):
+    """Decorator registering `func(**payload)` as the handler for jobs called `name`."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, run_at=None, max_attempts=None, **payload):
+    """
+    Persist a job for the worker to run. The payload must be JSON serialisable, so pass ids
+    and plain values rather than model instances.
+    """
+    if name not in _handlers:
+        raise KeyError(f"No job handler registered for '{name}'")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or getattr(settings, 'JOBQUEUE_MAX_ATTEMPTS', 5),
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at JOBQUEUE_RETRY_MAX_DELAY seconds."""
+    base = getattr(settings, 'JOBQUEUE_RETRY_BASE_DELAY', 30)
+    cap = getattr(settings, 'JOBQUEUE_RETRY_MAX_DELAY', 3600)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_jobs(limit=10):
+    """
+    Lock and mark up to `limit` due jobs as RUNNING. RUNNING jobs whose lease expired
+    (a worker died mid-job) are claimed again.
+    """
+    now = timezone.now()
+    lease_expired = now - timedelta(seconds=getattr(settings, 'JOBQUEUE_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='PENDING', run_at__lte=now) | Q(status='RUNNING', locked_at__lt=lease_expired))
+            .order_by('run_at')[:limit]
+        )
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(status='RUNNING', locked_at=now)
+    return jobs
+
+
+def run_job(job):
+    """Run a claimed job; on failure schedule a retry or move it to the dead-letter table."""
+    job.attempts += 1
+    try:
+        handler = _handlers[job.name]
+        handler(**job.payload)
+    except Exception as e:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error(f"Job {job.name} #{job.id} moved to dead letters after {job.attempts} attempts: {e}")
+            with transaction.atomic():
+                DeadLetterJob.objects.create(
+                    name=job.name,
+                    payload=job.payload,
+                    attempts=job.attempts,
+                    last_error=job.last_error,
+                    created_at=job.created_at,
+                )
+                job.delete()
+        else:
+            job.status = 'PENDING'
+            job.locked_at = None
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+            job.save(update_fields=['status', 'locked_at', 'run_at', 'attempts', 'last_error'])
+            logger.warning(f"Job {job.name} #{job.id} failed (attempt {job.attempts}), retrying at {job.run_at}: {e}")
+        return False
+
+    job.delete()
+    return True
+
+
+def run_pending(limit=10):
+    """Claim and run one batch of due jobs. Returns (succeeded, failed)."""
+    succeeded = failed = 0
+    for job in claim_jobs(limit):
+        if run_job(job):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
+
+
+def requeue(dead_letter):
+    """Move a dead-letter job back onto the queue with a fresh retry budget."""
+    with transaction.atomic():
+        job = Job.objects.create(
+            name=dead_letter.name,
+            payload=dead_letter.payload,
+            max_attempts=getattr(settings, 'JOBQUEUE_MAX_ATTEMPTS', 5),
+        )
+        dead_letter.delete()
+    return job
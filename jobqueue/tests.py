@@ -0,0 +1,108 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+
+from .models import DeadLetterJob, Job
+from .queue import claim_jobs, enqueue, register, requeue, retry_delay, run_job
+
+
+@register('jobqueue.tests.fail')
+def fail(**payload):
+    raise RuntimeError('SMTP unavailable')
+
+
+@register('jobqueue.tests.noop')
+def noop(**payload):
+    pass
+
+
+@override_settings(JOBQUEUE_RETRY_BASE_DELAY=30, JOBQUEUE_RETRY_MAX_DELAY=3600)
+class RetryDelayTest(SimpleTestCase):
+    def test_delay_doubles_per_attempt_up_to_the_cap(self):
+        with mock.patch('jobqueue.queue.random.uniform', return_value=1.0):
+            self.assertEqual([retry_delay(n).total_seconds() for n in range(1, 5)], [30, 60, 120, 240])
+            self.assertEqual(retry_delay(20).total_seconds(), 3600)
+
+    def test_jitter_stays_within_twenty_percent(self):
+        for _ in range(100):
+            self.assertTrue(timedelta(seconds=48) <= retry_delay(2) <= timedelta(seconds=72))
+
+
+@override_settings(JOBQUEUE_LEASE_SECONDS=300)
+class JobQueueTest(TestCase):
+    def test_failing_job_is_retried_then_dead_lettered(self):
+        job = enqueue('jobqueue.tests.fail', max_attempts=2, to='volunteer@example.com')
+
+        (claimed,) = claim_jobs()
+        self.assertFalse(run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('PENDING', 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('SMTP unavailable', job.last_error)
+        self.assertEqual(claim_jobs(), [])  # Not due until the backoff has passed
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        (claimed,) = claim_jobs()
+        self.assertFalse(run_job(claimed))
+        self.assertFalse(Job.objects.exists())
+        dead_letter = DeadLetterJob.objects.get()
+        self.assertEqual((dead_letter.name, dead_letter.attempts), ('jobqueue.tests.fail', 2))
+        self.assertEqual(dead_letter.payload, {'to': 'volunteer@example.com'})
+
+    def test_running_job_is_reclaimed_only_after_its_lease_expires(self):
+        now = timezone.now()
+        stale = Job.objects.create(name='jobqueue.tests.noop', status='RUNNING', locked_at=now - timedelta(seconds=600))
+        Job.objects.create(name='jobqueue.tests.noop', status='RUNNING', locked_at=now - timedelta(seconds=60))
+
+        self.assertEqual([job.id for job in claim_jobs()], [stale.id])
+        stale.refresh_from_db()
+        self.assertGreater(stale.locked_at, now - timedelta(seconds=1))
+
+    def test_admin_requeue_puts_dead_letter_back_on_the_queue(self):
+        from django.contrib.admin.sites import site
+
+        DeadLetterJob.objects.create(
+            name='jobqueue.tests.noop', payload={'report_id': 7}, attempts=5, created_at=timezone.now()
+        )
+        site._registry[DeadLetterJob].requeue_jobs(None, DeadLetterJob.objects.all())
+
+        self.assertFalse(DeadLetterJob.objects.exists())
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, job.payload), ('PENDING', 0, {'report_id': 7}))
+        (claimed,) = claim_jobs()
+        self.assertTrue(run_job(claimed))
+
+    def test_requeue_returns_the_new_job(self):
+        dead_letter = DeadLetterJob.objects.create(
+            name='jobqueue.tests.noop', payload={}, attempts=5, created_at=timezone.now()
+        )
+        self.assertEqual(requeue(dead_letter), Job.objects.get())
+
+
+class ClaimLockingTest(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_rows_locked_by_another_worker_are_skipped(self):
+        locked = enqueue('jobqueue.tests.noop')
+        free = enqueue('jobqueue.tests.noop')
+        holding, release = threading.Event(), threading.Event()
+
+        def other_worker():
+            with transaction.atomic():
+                list(Job.objects.select_for_update().filter(id=locked.id))
+                holding.set()
+                release.wait(5)
+            connection.close()
+
+        worker = threading.Thread(target=other_worker)
+        worker.start()
+        try:
+            holding.wait(5)
+            self.assertEqual([job.id for job in claim_jobs()], [free.id])
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual([job.id for job in claim_jobs()], [locked.id])
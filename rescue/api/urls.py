@@ -7,6 +7,9 @@ urlpatterns = [
     path('user-info/', views.get_user_info, name='get_user_info'),
     path('all-user-locations/', views.get_all_users_locations, name='get_all_users_locations'),
     path('save-location/', views.save_user_location),
+    path('locations/batch/', views.save_location_batch, name='save_location_batch'),
     path('complete-task/<int:task_id>/', views.complete_task, name='complete_task'),
     path('create_task/', views.create_task, name='create_task'),
+    path('route/', views.get_route, name='route'),
+    path('map/clusters/', views.map_clusters, name='map_clusters'),
 ]
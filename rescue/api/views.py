@@ -6,12 +6,26 @@ from ..models import (
     UserLocationHistory,
 )
 from accounts.models import UserProfile
+from accounts import presence
+from base.idempotency import idempotent
+from base.retention import retention_cutoff
+from base.snapshots import invalidate_snapshot
+from ..broadcast import record_position
+from ..clusters import get_cluster_index
+from ..live import InvalidMessage, get_live_store, parse_points
+from ..track_filter import movement_filter
+from .. import routing
+from django.db import transaction
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
 from django.http import JsonResponse
-from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import Point, Polygon
 from django.contrib.gis.measure import D
 from django.views.decorators.csrf import ensure_csrf_cookie
 from math import radians, sin, cos, sqrt, atan2
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta, datetime
 import logging
 from rest_framework.response import Response
@@ -39,10 +53,13 @@ def save_user_location(request):
             # Serialize current user profile
             user_serializer = UserProfileSerializer(user_profile, context={"request": request})
             
-            # Fetch last 10 location history records for the user
-            location_history = UserLocationHistory.objects.filter(
-                user=request.user
-            ).order_by("-timestamp")[:10]
+            # Fetch last 10 location history records for the user; the time bound lets
+            # PostgreSQL scan only the daily partitions still within retention
+            location_history = UserLocationHistory.objects.filter(user=request.user)
+            kept_since = retention_cutoff("rescue.UserLocationHistory")
+            if kept_since:
+                location_history = location_history.filter(timestamp__gte=kept_since)
+            location_history = location_history.order_by("-timestamp")[:10]
             history_serializer = UserLocationHistorySerializer(
                 location_history, many=True
             )
@@ -54,20 +71,6 @@ def save_user_location(request):
                 }
             )
 
-        # Update last_location_update timestamp
-        user_profile.last_location_update = timezone.now()
-
-        # Get coordinates from request
-        latitude = float(request.data.get('latitude'))
-        longitude = float(request.data.get('longitude'))
-
-        # Create Point object
-        location = Point(longitude, latitude, srid=4326)
-
-        # Update location
-        user_profile.location = location
-        user_profile.save()
-
         # Handle POST request (Updating location)
         serializer = UserLocationSerializer(
             user_profile, data=request.data, partial=True
@@ -77,13 +80,13 @@ def save_user_location(request):
                 {"status": "error", "message": serializer.errors}, status=400
             )
 
-        serializer.save()  # Updates user location and history
-
-        # Clean up old location history (only keep last 24 hours)
-        cleanup_time = timezone.now() - timedelta(hours=24)
-        UserLocationHistory.objects.filter(
-            user=request.user, timestamp__lt=cleanup_time
-        ).delete()
+        serializer.save()  # Updates user location, last_location_update and history in one save
+        record_position(
+            request.user.id,
+            user_profile.user_type,
+            serializer.validated_data["latitude"],
+            serializer.validated_data["longitude"],
+        )
 
         return Response({
             "status": "success",
@@ -96,33 +99,139 @@ def save_user_location(request):
         return Response({"status": "error", "message": str(e)}, status=400)
 
 
-@api_view(["GET"])
+@api_view(["POST"])
 @permission_classes([IsAuthenticated])
-def get_all_users_locations(request):
+def save_location_batch(request):
+    """
+    Store a batch of {"points": [[unix_seconds, lat, lng], ...]}, e.g. buffered while
+    offline. Points that pass the movement filter are inserted with one bulk_create, and
+    the profile is moved to the newest point with one UPDATE, in a single transaction.
+    """
     try:
-        # Get active users (updated in last 5 minutes)
-        active_time = timezone.now() - timedelta(minutes=5)
-        users = UserProfile.objects.filter(
-            location__isnull=False
+        points = parse_points(request.data.get("points"))
+    except InvalidMessage as e:
+        return Response({"status": "error", "message": str(e)}, status=400)
+
+    user_profile = request.user.userprofile
+    user_type = user_profile.user_type
+    history = [
+        UserLocationHistory(
+            user=request.user,
+            location=Point(longitude, latitude, srid=4326),
+            timestamp=timestamp,
+            user_type=user_type,
+        )
+        for timestamp, latitude, longitude in points
+        if movement_filter.accept(request.user.id, user_type, latitude, longitude, timestamp)
+    ]
+    timestamp, latitude, longitude = points[-1]
+
+    with transaction.atomic():
+        UserLocationHistory.objects.bulk_create(history)
+        # A batch older than the saved position only adds history
+        moved = (
+            UserProfile.objects.filter(pk=user_profile.pk)
+            .filter(Q(last_location_update__isnull=True) | Q(last_location_update__lt=timestamp))
+            .update(location=Point(longitude, latitude, srid=4326), last_location_update=timestamp)
         )
+    if moved:
+        # update() skips post_save, so do what the UserProfile receiver would have done
+        invalidate_snapshot(f"profiles.{user_type}")
+        record_position(request.user.id, user_type, latitude, longitude)
+
+    return Response({
+        "status": "success",
+        "received": len(points),
+        "stored": len(history),
+        "timestamp": timestamp if moved else user_profile.last_location_update,
+    })
 
-        users_data = []
 
-        for user_profile in users:
-            # Get location history for the last hour
-            history = UserLocationHistory.objects.filter(
-                user=user_profile.user,
-                timestamp__gte=timezone.now() - timedelta(hours=1),
-            ).order_by("-timestamp")
+def _parse_feed_params(params):
+    """Validated filters of the all-users location feed; raises ValueError on bad input."""
+    page_size = getattr(settings, "LOCATIONS_FEED_PAGE_SIZE", 200)
+    filters = {
+        "cursor": int(params["cursor"]) if params.get("cursor") else None,
+        "limit": min(int(params.get("limit", page_size)), page_size),
+        "user_type": params.get("user_type"),
+        "bbox": None,
+        "since": None,
+    }
+    if filters["limit"] < 1:
+        raise ValueError("limit must be positive")
+    if filters["user_type"] and filters["user_type"] not in dict(UserProfile._meta.get_field("user_type").choices):
+        raise ValueError(f"Unknown user_type {filters['user_type']}")
+    if params.get("bbox"):
+        south, west, north, east = map(float, params["bbox"].split(","))
+        filters["bbox"] = Polygon.from_bbox((west, south, east, north))
+        filters["bbox"].srid = 4326
+    if params.get("since"):
+        filters["since"] = parse_datetime(params["since"])
+        if filters["since"] is None:
+            raise ValueError("since must be an ISO 8601 datetime")
+        if timezone.is_naive(filters["since"]):
+            filters["since"] = timezone.make_aware(filters["since"])
+    return filters
 
-            location_history = [
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_all_users_locations(request):
+    """
+    Page of users with a saved location, ordered by user id. Optional filters:
+    ?bbox=south,west,north,east, ?user_type= and ?since= (users updated since then; also
+    the start of the returned history, which otherwise covers the last hour). Each user gets
+    at most LOCATIONS_FEED_HISTORY_LIMIT history points. Pass the returned next_cursor as
+    ?cursor= for the next page. Two queries per page, however many users it holds.
+    """
+    try:
+        try:
+            filters = _parse_feed_params(request.query_params)
+        except (TypeError, ValueError) as e:
+            return JsonResponse({"status": "error", "message": f"Invalid filter: {e}"}, status=400)
+
+        users = UserProfile.objects.filter(location__isnull=False).select_related("user").order_by("user_id")
+        if filters["cursor"] is not None:
+            users = users.filter(user_id__gt=filters["cursor"])
+        if filters["user_type"]:
+            users = users.filter(user_type=filters["user_type"])
+        if filters["bbox"] is not None:
+            users = users.filter(location__within=filters["bbox"])
+        if filters["since"] is not None:
+            users = users.filter(last_location_update__gte=filters["since"])
+        # One extra row tells whether there is a next page
+        users = list(users[:filters["limit"] + 1])
+        has_more = len(users) > filters["limit"]
+        users = users[:filters["limit"]]
+        user_ids = [user_profile.user_id for user_profile in users]
+
+        # One constant lower bound, so the history query is pruned to the last day's partitions
+        history_since = filters["since"] or timezone.now() - timedelta(hours=1)
+        history_limit = getattr(settings, "LOCATIONS_FEED_HISTORY_LIMIT", 50)
+        # Newest points of every user on the page in one windowed query
+        history = (
+            UserLocationHistory.objects.filter(user_id__in=user_ids, timestamp__gte=history_since)
+            .annotate(rank=Window(RowNumber(), partition_by=F("user_id"), order_by=F("timestamp").desc()))
+            .filter(rank__lte=history_limit)
+            .order_by("user_id", "-timestamp")
+            .values_list("user_id", "location", "timestamp")
+        )
+        history_by_user = {}
+        for user_id, location, timestamp in history:
+            history_by_user.setdefault(user_id, []).append(
                 {
-                    "latitude": h.location.y,
-                    "longitude": h.location.x,
-                    "timestamp": h.timestamp.isoformat(),
+                    "latitude": location.y,
+                    "longitude": location.x,
+                    "timestamp": timestamp.isoformat(),
                 }
-                for h in history
-            ]
+            )
+
+        # Positions streamed over WebSockets are newer than the saved profile location
+        live_positions = get_live_store().positions(user_ids)
+
+        users_data = []
+        for user_profile in users:
+            live_position = live_positions.get(user_profile.user_id)
             users_data.append(
                 {
                     "id": user_profile.user.id,
@@ -130,15 +239,20 @@ def get_all_users_locations(request):
                     "phone":str( user_profile.mobile_number),
                     "user_type": user_profile.user_type,
                     "location": {
-                        "latitude": user_profile.location.y if user_profile.location else None,
-                        "longitude": user_profile.location.x if user_profile.location else None,
+                        "latitude": live_position[0] if live_position else user_profile.location.y,
+                        "longitude": live_position[1] if live_position else user_profile.location.x,
                         "last_update": user_profile.last_location_update.strftime("%B %d, %Y at %I:%M %p") if user_profile.last_location_update else None,
+                        "live": live_position is not None,
                     },
-                    "location_history": location_history,
+                    "location_history": history_by_user.get(user_profile.user_id, []),
                 }
             )
 
-        return JsonResponse({"status": "success", "users": users_data})
+        return JsonResponse({
+            "status": "success",
+            "users": users_data,
+            "next_cursor": str(user_ids[-1]) if has_more else None,
+        })
     except Exception as e:
         logger.error(f"Error getting locations: {str(e)}")
         return JsonResponse({"status": "error", "message": str(e)}, status=400)
@@ -203,6 +317,10 @@ def update_volunteer_location(request):
         user_profile.location = location
         user_profile.save()
 
+        # Location updates double as presence heartbeats
+        presence.mark_online(request.user, user_profile.user_type)
+        record_position(request.user.id, user_profile.user_type, latitude, longitude)
+
         print("Location updated successfully")  # Debug print
 
         return Response({"status": "success"})
@@ -211,6 +329,7 @@ def update_volunteer_location(request):
     
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_task(request):
     try:
         data = request.data
@@ -239,6 +358,40 @@ def create_task(request):
             'message': str(e)
         }, status=400)
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_route(request):
+    """Road route between ?from=lat,lng and ?to=lat,lng, served from the offline road graph."""
+    try:
+        start_lat, start_lng = map(float, request.query_params["from"].split(","))
+        end_lat, end_lng = map(float, request.query_params["to"].split(","))
+    except (KeyError, ValueError):
+        return Response({"status": "error", "message": "from and to must be given as lat,lng"}, status=400)
+
+    if routing.get_graph() is None:
+        return Response({"status": "error", "message": "Routing is not configured"}, status=503)
+    result = routing.route(start_lat, start_lng, end_lat, end_lng)
+    if result is None:
+        return Response({"status": "error", "message": "No route found"}, status=404)
+    return Response({"status": "success", **result})
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def map_clusters(request):
+    """
+    Clusters of volunteers and open reports for ?bbox=south,west,north,east&zoom=, served
+    from the in-memory cluster index; ?kinds=volunteer or ?kinds=report limits the kinds.
+    """
+    try:
+        south, west, north, east = map(float, request.query_params["bbox"].split(","))
+        zoom = int(request.query_params["zoom"])
+    except (KeyError, ValueError):
+        return Response({"status": "error", "message": "bbox must be given as south,west,north,east and zoom as an integer"}, status=400)
+
+    kinds = set(request.query_params["kinds"].split(",")) if request.query_params.get("kinds") else None
+    clusters = get_cluster_index().clusters(south, west, north, east, zoom, kinds)
+    return Response({"status": "success", "zoom": zoom, "clusters": clusters})
+
 @login_required
 def complete_task(request, task_id):
     task = get_object_or_404(RescueTask, id=task_id, assigned_to=request.user)
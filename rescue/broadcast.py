@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import threading
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .clusters import track_position, untrack_position
+from .live import get_live_store, group_name, merge_changes
+
+logger = logging.getLogger(__name__)
+
+
+class LiveBroadcaster:
+    """
+    Tick-based sender of live location deltas. Changes published between ticks are merged
+    per cell, and every LIVE_BROADCAST_INTERVAL seconds each changed cell gets one delta
+    frame on its channel group, so a burst of pings costs subscribers one frame per tick
+    rather than one per ping. An interval of 0 sends on the next loop iteration instead.
+    Each tick also expires stale entries from the live store and sends their removals.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self._flush_lock = self._flush_loop = None
+        self.published = self.coalesced = self.frames = self.ticks = 0
+        # Reported by consumers, see PendingFrames
+        self.client_coalesced = self.client_dropped = 0
+
+    @property
+    def interval(self):
+        return getattr(settings, "LIVE_BROADCAST_INTERVAL", 1.0)
+
+    def publish(self, changes):
+        """Queue (cell, updated, removed) changes for the next tick; must be called from the event loop."""
+        if not changes:
+            return
+        with self._lock:
+            for cell, updated, removed in changes:
+                pending = self._pending.setdefault(cell, ({}, set()))
+                self.coalesced += merge_changes(*pending, updated, removed)
+                self.published += 1
+        if self.interval > 0:
+            self._ensure_running()
+        else:
+            asyncio.get_running_loop().create_task(self.flush())
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def _get_flush_lock(self):
+        # One lock per event loop, whether or not the tick task runs (LIVE_BROADCAST_INTERVAL=0)
+        loop = asyncio.get_running_loop()
+        if self._flush_loop is not loop:
+            self._flush_lock, self._flush_loop = asyncio.Lock(), loop
+        return self._flush_lock
+
+    async def flush(self):
+        """Send one frame per changed cell. Concurrent calls are serialised."""
+        async with self._get_flush_lock():
+            try:
+                self.publish_expired(await sync_to_async(get_live_store().purge_expired)())
+            except Exception as e:
+                logger.error(f"Expiring live locations failed: {e}")
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if batch:
+                self.ticks += 1
+                await self.send(batch)
+
+    def publish_expired(self, changes):
+        # Not counted as published: these come from the store, not from pings
+        with self._lock:
+            for cell, updated, removed in changes:
+                merge_changes(*self._pending.setdefault(cell, ({}, set())), updated, removed)
+        for cell, updated, removed in changes:
+            for user_id in removed:
+                untrack_position(user_id)
+
+    async def send_now(self, changes):
+        """Send changes immediately, e.g. from a REST view outside the consumers' event loop."""
+        batch = {}
+        for cell, updated, removed in changes:
+            merge_changes(*batch.setdefault(cell, ({}, set())), updated, removed)
+        await self.send(batch)
+
+    async def send(self, batch):
+        channel_layer = get_channel_layer()
+        store = get_live_store()
+        for cell, (updated, removed) in batch.items():
+            try:
+                seq = await sync_to_async(store.next_seq)(cell)
+                await channel_layer.group_send(group_name(cell), {
+                    "type": "send_location_update",
+                    "cell": cell,
+                    "since": seq - 1,
+                    "seq": seq,
+                    "updated": [[user_id, lat, lng] for user_id, (lat, lng) in updated.items()],
+                    "removed": list(removed),
+                })
+                self.frames += 1
+            except Exception as e:
+                # Subscribers see the seq gap and resync the cell
+                logger.error(f"Live broadcast to cell {cell} failed: {e}")
+
+    def stats(self):
+        return {
+            "pending_cells": len(self._pending),
+            "published": self.published,
+            "coalesced": self.coalesced,
+            "frames": self.frames,
+            "ticks": self.ticks,
+            "client_coalesced": self.client_coalesced,
+            "client_dropped": self.client_dropped,
+        }
+
+
+class PendingFrames:
+    """
+    A consumer's unsent delta frames, at most one per cell. A frame arriving while an older
+    one for the same cell is still waiting is merged into it, so a client that reads slowly
+    gets fewer, larger frames instead of an ever-growing queue. Frames already covered by
+    what the client was sent (e.g. a snapshot) are dropped.
+    """
+
+    def __init__(self):
+        self._frames = {}
+        self._sent = {}
+
+    def __len__(self):
+        return len(self._frames)
+
+    def add(self, cell, since, seq, updated, removed):
+        """Queue a frame. Returns "queued", "coalesced" or "dropped"."""
+        if seq <= self._sent.get(cell, 0):
+            return "dropped"
+        pending = self._frames.get(cell)
+        if pending is None:
+            self._frames[cell] = [since, seq, dict(updated), set(removed)]
+            return "queued"
+        if seq > pending[1]:
+            pending[1] = seq
+            merge_changes(pending[2], pending[3], updated, removed)
+        else:
+            # An older frame from another worker arrived late; keep the newer entries
+            changed = pending[2].keys() | pending[3]
+            merge_changes(
+                pending[2], pending[3],
+                {user_id: position for user_id, position in updated.items() if user_id not in changed},
+                [user_id for user_id in removed if user_id not in changed],
+            )
+        pending[0] = min(pending[0], since)
+        return "coalesced"
+
+    def sent(self, cell, seq):
+        """Record that the client holds the state of `cell` up to `seq`."""
+        self._sent[cell] = max(self._sent.get(cell, 0), seq)
+        pending = self._frames.get(cell)
+        if pending and pending[1] <= seq:
+            del self._frames[cell]
+
+    def forget(self, cells):
+        for cell in cells:
+            self._frames.pop(cell, None)
+            self._sent.pop(cell, None)
+
+    def pop(self):
+        """Oldest waiting frame as (cell, since, seq, updated, removed), or None."""
+        if not self._frames:
+            return None
+        cell = next(iter(self._frames))
+        since, seq, updated, removed = self._frames.pop(cell)
+        self.sent(cell, seq)
+        return cell, since, seq, updated, removed
+
+
+# Process-wide broadcaster shared by every LocationConsumer
+live_broadcaster = LiveBroadcaster()
+
+
+def record_position(user_id, user_type, latitude, longitude):
+    """Store a position reported over REST and send its deltas right away (sync code only)."""
+    changes = get_live_store().update(user_id, user_type, latitude, longitude)
+    track_position(user_id, user_type, latitude, longitude)
+    async_to_sync(live_broadcaster.send_now)(changes)
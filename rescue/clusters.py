@@ -0,0 +1,200 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .live import MAX_LATITUDE
+
+# Map markers are pre-aggregated per zoom level on a Web Mercator grid whose cells are
+# CLUSTER_RADIUS_PX screen pixels wide at that zoom, so a viewport never holds more
+# clusters than fit on screen, however many volunteers and reports exist. Every level is
+# kept up to date on each write, which costs one dict update per zoom level.
+
+TILE_SIZE = 256
+
+
+def project(latitude, longitude):
+    """Web Mercator position of a point, scaled to [0, 1] on both axes with y growing southwards."""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    sin_lat = math.sin(math.radians(latitude))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return (longitude + 180) / 360, y
+
+
+def unproject(x, y):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y)))), x * 360 - 180
+
+
+class ClusterIndex:
+    """
+    Thread-safe hierarchical grid of points of several kinds ("volunteer", "report"), keyed
+    by (kind, id). Each zoom level keeps, per occupied cell, the point count, the sum of
+    their projected coordinates for the centroid and the sum of their ids, which is the id
+    itself when a cell holds a single point.
+    """
+
+    def __init__(self, max_zoom=18, radius_px=64):
+        self.max_zoom = max_zoom
+        self.radius_px = radius_px
+        self._cell_sizes = [radius_px / (TILE_SIZE * 2 ** zoom) for zoom in range(max_zoom + 1)]
+        self._points = {}
+        self._levels = {}
+        self._lock = threading.RLock()
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._points)
+
+    def _add(self, kind, key, x, y, sign):
+        levels = self._levels.setdefault(kind, [{} for _ in self._cell_sizes])
+        for grid, size in zip(levels, self._cell_sizes):
+            cell = (math.floor(x / size), math.floor(y / size))
+            entry = grid.get(cell)
+            if entry is None:
+                entry = grid[cell] = [0, 0.0, 0.0, 0]
+            entry[0] += sign
+            if entry[0] == 0:
+                del grid[cell]
+                continue
+            entry[1] += sign * x
+            entry[2] += sign * y
+            entry[3] += sign * key
+
+    def update(self, kind, key, latitude, longitude):
+        x, y = project(float(latitude), float(longitude))
+        with self._lock:
+            previous = self._points.get((kind, key))
+            if previous == (x, y):
+                return
+            if previous:
+                self._add(kind, key, *previous, -1)
+            self._points[(kind, key)] = (x, y)
+            self._add(kind, key, x, y, 1)
+
+    def remove(self, kind, key):
+        with self._lock:
+            previous = self._points.pop((kind, key), None)
+            if previous:
+                self._add(kind, key, *previous, -1)
+
+    def load(self, items):
+        """Replace the whole index with `(kind, key, lat, lng)` tuples."""
+        with self._lock:
+            self._points.clear()
+            self._levels.clear()
+            for kind, key, latitude, longitude in items:
+                self.update(kind, key, latitude, longitude)
+            self.loaded_at = time.monotonic()
+
+    def _cell_ranges(self, south, west, north, east, size):
+        left, top = project(north, west)
+        right, bottom = project(south, east)
+        rows = (math.floor(top / size), math.floor(bottom / size))
+        if west <= east:
+            columns = [(math.floor(left / size), math.floor(right / size))]
+        else:
+            # The viewport crosses the antimeridian
+            columns = [(math.floor(left / size), math.floor(1 / size)), (0, math.floor(right / size))]
+        return rows, columns
+
+    def clusters(self, south, west, north, east, zoom, kinds=None):
+        """
+        Clusters of the given kinds in a bounding box at a map zoom level, as dicts with
+        kind, count, latitude and longitude, plus the id of single points. Zoom levels
+        beyond max_zoom use the finest grid.
+        """
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        size = self._cell_sizes[zoom]
+        (top, bottom), columns = self._cell_ranges(south, west, north, east, size)
+        result = []
+        with self._lock:
+            for kind, levels in self._levels.items():
+                if kinds is not None and kind not in kinds:
+                    continue
+                grid = levels[zoom]
+                span = (bottom - top + 1) * sum(last - first + 1 for first, last in columns)
+                if span > len(grid):
+                    # The viewport has more cells than the level has occupied ones
+                    cells = [
+                        cell for cell in grid
+                        if top <= cell[1] <= bottom and any(first <= cell[0] <= last for first, last in columns)
+                    ]
+                else:
+                    cells = [
+                        (column, row)
+                        for first, last in columns
+                        for column in range(first, last + 1)
+                        for row in range(top, bottom + 1)
+                        if (column, row) in grid
+                    ]
+                for cell in cells:
+                    count, sum_x, sum_y, sum_keys = grid[cell]
+                    latitude, longitude = unproject(sum_x / count, sum_y / count)
+                    cluster = {"kind": kind, "count": count, "latitude": latitude, "longitude": longitude}
+                    if count == 1:
+                        cluster["id"] = sum_keys
+                    result.append(cluster)
+        return result
+
+
+def read_cluster_points():
+    """(kind, id, lat, lng) of every located online volunteer and every open report."""
+    from accounts import presence
+    from accounts.models import UserProfile
+    from .live import get_live_store
+    from .models import AnimalReport
+
+    online_ids = presence.online_user_ids("VOLUNTEER")
+    volunteers = {
+        user_id: (location.y, location.x)
+        for user_id, location in UserProfile.objects.filter(
+            user_type="VOLUNTEER", location__isnull=False, user_id__in=online_ids
+        ).values_list("user_id", "location")
+    }
+    # Live positions are newer than the saved ones
+    volunteers.update(get_live_store().positions(online_ids, "VOLUNTEER"))
+    reports = (
+        AnimalReport.objects.filter(location__isnull=False)
+        .exclude(status="COMPLETED")
+        .values_list("id", "location")
+    )
+    return [("volunteer", user_id, lat, lng) for user_id, (lat, lng) in volunteers.items()] + [
+        ("report", report_id, location.y, location.x) for report_id, location in reports
+    ]
+
+
+def get_cluster_index():
+    """
+    The process-wide index, loaded on first use. Writes made in this process update it
+    as they happen; it is reloaded every CLUSTER_INDEX_REFRESH seconds to pick up writes
+    made by other workers.
+    """
+    refresh = getattr(settings, "CLUSTER_INDEX_REFRESH", 300)
+    if cluster_index.loaded_at is None or (refresh and time.monotonic() - cluster_index.loaded_at > refresh):
+        cluster_index.load(read_cluster_points())
+    return cluster_index
+
+
+def track_position(user_id, user_type, latitude, longitude):
+    if user_type == "VOLUNTEER":
+        # The WebSocket consumer passes the user id as a string
+        cluster_index.update("volunteer", int(user_id), latitude, longitude)
+
+
+def untrack_position(user_id):
+    """Drop a volunteer that went offline, e.g. on disconnect, logout or live position expiry."""
+    cluster_index.remove("volunteer", int(user_id))
+
+
+def track_report(report):
+    if report.location is None or report.status == "COMPLETED":
+        cluster_index.remove("report", report.id)
+    else:
+        cluster_index.update("report", report.id, report.location.y, report.location.x)
+
+
+cluster_index = ClusterIndex(
+    max_zoom=getattr(settings, "CLUSTER_MAX_ZOOM", 18),
+    radius_px=getattr(settings, "CLUSTER_RADIUS_PX", 64),
+)
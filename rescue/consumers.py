@@ -1,19 +1,38 @@
+import asyncio
 import json
-from datetime import timedelta
-from django.utils.timezone import now
+import time
+from django.conf import settings
+from django.utils import timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.layers import get_channel_layer
 from asgiref.sync import sync_to_async
-from rescue.models import VolunteerLocation
-
-# Dictionary to store active volunteer locations
-volunteer_locations = {}
+from accounts import presence
+from rescue.location_buffer import location_buffer
+from rescue.track_filter import movement_filter
+from rescue.broadcast import PendingFrames, live_broadcaster
+from rescue import routing
+from rescue.clusters import track_position, untrack_position
+from rescue.geo_index import haversine_km
+from rescue.live import (
+    BINARY_SUBPROTOCOL,
+    InvalidMessage,
+    cell_of,
+    decode_message,
+    delta_frame,
+    encode_frame,
+    get_live_store,
+    group_name,
+    parse_points,
+    snapshot_frame,
+    viewport_cells,
+)
 
 class LocationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         """Handle WebSocket connection."""
         self.user = self.scope["user"]
         self.volunteer_id = None
+        # msgpack frames for clients that offer the binary subprotocol, JSON text otherwise
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get("subprotocols", [])
 
         if not self.user or not self.user.is_authenticated:
             print("❌ Unauthorized WebSocket attempt.")
@@ -21,84 +40,289 @@ class LocationConsumer(AsyncWebsocketConsumer):
             return
 
         self.volunteer_id = str(self.user.id)
-        volunteer_locations[self.volunteer_id] = {"latitude": None, "longitude": None}
+        self.user_type = await self.get_user_type()
+        self.cells = set()  # Geohash cells this client is subscribed to
+        self.frames = PendingFrames()  # Deltas not yet written to this client
+        self.sender = None
 
-        await self.accept()
-        await self.channel_layer.group_add("volunteers", self.channel_name)
+        await self.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
+        await self.refresh_presence()
         print(f"✅ Volunteer {self.volunteer_id} connected.")
 
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
         if self.volunteer_id:
-            volunteer_locations.pop(self.volunteer_id, None)  # Remove from in-memory store
-            await self.channel_layer.group_discard("volunteers", self.channel_name)
+            if self.sender:
+                self.sender.cancel()
+            await self.unsubscribe(set(self.cells))
+            live_broadcaster.publish(await sync_to_async(get_live_store().remove)(self.volunteer_id))
+            untrack_position(self.volunteer_id)
+            # Persist this user's last position without waiting for the interval
+            await location_buffer.flush(user_ids=[self.volunteer_id])
             print(f"🚪 Volunteer {self.volunteer_id} disconnected.")
 
-    async def receive(self, text_data):
-        """Handle incoming location updates."""
+    async def receive(self, text_data=None, bytes_data=None):
+        """Handle incoming location updates and subscription requests."""
         if not self.volunteer_id:
-            await self.send(json.dumps({"error": "Unauthorized"}))
+            await self.send_frame({"error": "Unauthorized"})
             await self.close()
             return
 
         try:
-            data = json.loads(text_data)
-            print(data)
+            data = decode_message(text_data, bytes_data)
+            if data.get("type") == "subscribe":
+                await self.subscribe(data)
+                return
+            if data.get("type") == "unsubscribe":
+                await self.unsubscribe(set(data.get("cells") or self.cells) & self.cells)
+                await self.send_frame({"type": "subscribed", "cells": sorted(self.cells)})
+                return
+            if data.get("type") == "resync":
+                # Client noticed a gap in the delta sequence of these cells
+                await self.send_snapshot(set(data.get("cells") or self.cells) & self.cells)
+                return
+            if data.get("type") == "points":
+                # Timestamped points queued while offline; the newest becomes the live position
+                *trail, (timestamp, latitude, longitude) = parse_points(data.get("points"))
+                await self.record_position(latitude, longitude, timestamp, trail)
+                return
+
             latitude = data.get("latitude")
             longitude = data.get("longitude")
-
             if latitude is not None and longitude is not None:
-                # Update in-memory location
-                volunteer_locations[self.volunteer_id] = {"latitude": latitude, "longitude": longitude}
-                print(f"📍 Updated {self.volunteer_id} location: {latitude}, {longitude}")
+                await self.record_position(float(latitude), float(longitude))
+        except InvalidMessage as e:
+            await self.send_frame({"error": str(e)})
+        except (TypeError, ValueError):
+            await self.send_frame({"error": "Invalid coordinates"})
+
+    async def record_position(self, latitude, longitude, timestamp=None, trail=()):
+        # Shared by every worker, so dispatch and REST reads see this position too
+        changes = await sync_to_async(get_live_store().update)(self.volunteer_id, self.user_type, latitude, longitude)
+        track_position(self.volunteer_id, self.user_type, latitude, longitude)
 
-                # Update the database
-                await self.update_volunteer_location(latitude, longitude)
+        # Location pings double as presence heartbeats
+        if time.monotonic() - self.presence_refreshed_at > presence.get_presence_store().ttl / 3:
+            await self.refresh_presence()
 
-                # Remove outdated entries (older than 24 hours)
-                await self.cleanup_old_locations()
+        # History gets offline tracks, and live pings when LOCATION_BUFFER_HISTORY is on,
+        # minus the points the movement filter finds redundant
+        candidates = list(trail)
+        if trail or getattr(settings, "LOCATION_BUFFER_HISTORY", False):
+            candidates.append((timestamp or timezone.now(), latitude, longitude))
+        history = [
+            point for point in candidates
+            if movement_filter.accept(self.volunteer_id, self.user_type, point[1], point[2], point[0])
+        ]
 
-                # Broadcast updated locations
-                await self.broadcast_volunteer_locations()
-        except json.JSONDecodeError:
-            await self.send(json.dumps({"error": "Invalid JSON format"}))
+        # Written to VolunteerLocation in batches by the write-behind buffer
+        location_buffer.add(self.volunteer_id, self.user_type, latitude, longitude, timestamp, history)
+
+        # Sent on the next broadcast tick, only to clients watching its cell
+        live_broadcaster.publish(changes)
+
+    async def send_frame(self, frame):
+        """Send a dict, or a frame already encoded for this client's protocol."""
+        if isinstance(frame, dict):
+            frame = encode_frame(frame, self.binary)
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
 
     @sync_to_async
-    def update_volunteer_location(self, latitude, longitude):
-        """Update location in VolunteerLocation."""
-        try:
-            # Ensure latitude and longitude are not None
-            latitude = float(latitude) if latitude is not None else 0.0
-            longitude = float(longitude) if longitude is not None else 0.0
+    def get_user_type(self):
+        profile = getattr(self.user, "userprofile", None)
+        return profile.user_type if profile else None
+
+    @sync_to_async
+    def refresh_presence(self):
+        """Mark the connected user as online in the presence registry."""
+        presence.mark_online(self.user, self.user_type)
+        self.presence_refreshed_at = time.monotonic()
+
+    async def subscribe(self, data):
+        """
+        Set the client's viewport, given as {"bbox": [south, west, north, east]} or as
+        {"cells": [...]}. Joins the new cells' groups, leaves the ones no longer covered and
+        sends snapshots of the newly added cells.
+        """
+        if data.get("bbox"):
+            try:
+                south, west, north, east = map(float, data["bbox"])
+            except (TypeError, ValueError):
+                await self.send_frame({"error": "bbox must be [south, west, north, east]"})
+                return
+            cells = viewport_cells(south, west, north, east)
+        else:
+            cells = set(data.get("cells") or ())
+            if len(cells) > getattr(settings, "LIVE_MAX_SUBSCRIBED_CELLS", 100):
+                cells = None
+        if cells is None:
+            await self.send_frame({"error": "Viewport too large, zoom in"})
+            return
 
-            # Use update_or_create to avoid inserting null values
-            volunteer_location, created = VolunteerLocation.objects.update_or_create(
-                volunteer_id=self.volunteer_id,
-                defaults={"latitude": latitude, "longitude": longitude, "updated_at": now()},
-            )
+        added = cells - self.cells
+        await self.unsubscribe(self.cells - cells)
+        for cell in added:
+            await self.channel_layer.group_add(group_name(cell), self.channel_name)
+        self.cells |= added
+        await self.send_frame({"type": "subscribed", "cells": sorted(self.cells)})
+        await self.send_snapshot(added)
 
-            print(f"✅ Volunteer {self.volunteer_id} location updated in DB.")
-        except Exception as e:
-            print(f"⚠️ Error updating location: {str(e)}")
+    async def unsubscribe(self, cells):
+        for cell in cells:
+            await self.channel_layer.group_discard(group_name(cell), self.channel_name)
+        self.cells -= cells
+        self.frames.forget(cells)
 
-    async def broadcast_volunteer_locations(self):
-        """Broadcast updated volunteer locations to all clients."""
-        channel_layer = get_channel_layer()
-        message = json.dumps({"type": "volunteer_locations", "locations": volunteer_locations})
-        
-        # Send the message to all volunteers in the group
-        await channel_layer.group_send("volunteers", {"type": "send_location_update", "message": message})
+    async def send_snapshot(self, cells):
+        """Send this client the live positions in `cells`, e.g. on subscribe or after a sequence gap."""
+        if cells:
+            snapshot = await sync_to_async(get_live_store().snapshot)(cells)
+            for cell, (seq, _) in snapshot.items():
+                self.frames.sent(cell, seq)
+            await self.send_frame(snapshot_frame(snapshot, self.binary))
+
+    async def send_location_update(self, event):
+        """Queue a cell's delta frame for this client, merging it with an unsent one."""
+        if event["cell"] not in self.cells:
+            return  # Sent before we left the group
+        outcome = self.frames.add(
+            event["cell"], event["since"], event["seq"],
+            {user_id: (lat, lng) for user_id, lat, lng in event["updated"]}, event["removed"],
+        )
+        if outcome == "coalesced":
+            live_broadcaster.client_coalesced += 1
+        elif outcome == "dropped":
+            live_broadcaster.client_dropped += 1
+        if self.sender is None or self.sender.done():
+            self.sender = asyncio.get_running_loop().create_task(self.send_pending())
 
+    async def send_pending(self):
+        # Runs apart from the message loop, so frames arriving during a slow send are merged
+        while (frame := self.frames.pop()) is not None:
+            cell, since, seq, updated, removed = frame
+            await self.send_frame(delta_frame(cell, seq, updated, removed, since=since, binary=self.binary))
+
+
+class TrackingConsumer(AsyncWebsocketConsumer):
+    """
+    Lets a reporter follow the volunteer assigned to their report, at ws/tracking/<report_id>/.
+    It listens to the live group of the volunteer's current cell, receiving the same deltas
+    as LocationConsumer clients. It pushes {"type": "position", ...} with distance and ETA
+    only when the volunteer moves, and follows them from cell to cell.
+    """
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        self.cell = None
+        self.last_position = None
+        self.recheck = None
+
+        if not self.user or not self.user.is_authenticated:
+            await self.close()
+            return
+        tracked = await self.get_assignment(int(self.scope["url_route"]["kwargs"]["report_id"]))
+        if tracked is None:
+            await self.close()
+            return
+
+        self.volunteer, self.report_position, saved_position = tracked
+        await self.accept()
+        await self.send(text_data=json.dumps({"type": "tracking", "volunteer": self.volunteer}))
+        position = await self.live_position() or saved_position
+        if position:
+            await self.push(position)
+
+    async def disconnect(self, close_code):
+        if self.recheck:
+            self.recheck.cancel()
+        if self.cell:
+            await self.channel_layer.group_discard(group_name(self.cell), self.channel_name)
 
     @sync_to_async
-    def cleanup_old_locations(self):
-        """Delete volunteer locations older than 24 hours."""
-        cutoff_time = now() - timedelta(hours=24)
-        deleted_count, _ = VolunteerLocation.objects.filter(updated_at__lt=cutoff_time).delete()
-        if deleted_count > 0:
-            print(f"🗑️ Deleted {deleted_count} outdated volunteer locations.")
+    def get_assignment(self, report_id):
+        """(volunteer info, report position, saved volunteer position) of the user's report, or None."""
+        from rescue.models import AnimalReport
+
+        report = (
+            AnimalReport.objects.filter(id=report_id, user=self.user, assigned_to__isnull=False, location__isnull=False)
+            .select_related("assigned_to__userprofile")
+            .first()
+        )
+        if report is None:
+            return None
+        profile = getattr(report.assigned_to, "userprofile", None)
+        volunteer = {
+            "id": report.assigned_to_id,
+            "username": report.assigned_to.username,
+            "mobile_number": str(profile.mobile_number) if profile else None,
+        }
+        saved = (profile.location.y, profile.location.x) if profile and profile.location else None
+        return volunteer, (report.location.y, report.location.x), saved
+
+    async def live_position(self):
+        positions = await sync_to_async(get_live_store().positions)([self.volunteer["id"]])
+        return positions.get(self.volunteer["id"])
 
+    async def follow(self, position):
+        cell = cell_of(*position)
+        if cell != self.cell:
+            if self.cell:
+                await self.channel_layer.group_discard(group_name(self.cell), self.channel_name)
+            await self.channel_layer.group_add(group_name(cell), self.channel_name)
+            self.cell = cell
+
+    async def push(self, position):
+        if self.recheck:
+            self.recheck.cancel()
+            self.recheck = None
+        await self.follow(position)
+        if position == self.last_position:
+            return
+        self.last_position = position
+        distance_km = haversine_km(*position, *self.report_position)
+        await self.send(text_data=json.dumps({
+            "type": "position",
+            "latitude": position[0],
+            "longitude": position[1],
+            "distance_km": round(distance_km, 2),
+            "eta_s": await self.estimate_eta(position, distance_km),
+        }))
+
+    async def estimate_eta(self, position, distance_km):
+        """Road travel time when routing is configured, else straight-line distance at TRACKING_ETA_SPEED_KMH."""
+        if routing.get_graph() is not None:
+            found = await sync_to_async(routing.route)(*position, *self.report_position)
+            if found is not None:
+                return found["duration_s"]
+        return round(distance_km / getattr(settings, "TRACKING_ETA_SPEED_KMH", 25) * 3600)
 
     async def send_location_update(self, event):
-        """Send location updates to WebSocket clients."""
-        await self.send(text_data=event["message"])
+        """A delta of the volunteer's cell, as broadcast to LocationConsumer clients."""
+        if event["cell"] != self.cell:
+            return  # Sent before we followed the volunteer elsewhere
+        volunteer_id = self.volunteer["id"]
+        for user_id, latitude, longitude in event["updated"]:
+            if user_id == volunteer_id:
+                await self.push((latitude, longitude))
+                return
+        if volunteer_id in event["removed"]:
+            # Moved to another cell, or went offline
+            position = await self.live_position()
+            if position:
+                await self.push(position)
+            elif self.recheck is None:
+                await self.send(text_data=json.dumps({"type": "offline"}))
+                self.recheck = asyncio.get_running_loop().create_task(self.wait_for_return())
+
+    async def wait_for_return(self):
+        # The volunteer may come back in another cell, whose group we are not in
+        while True:
+            await asyncio.sleep(getattr(settings, "TRACKING_OFFLINE_RECHECK", 30))
+            position = await self.live_position()
+            if position:
+                self.recheck = None
+                await self.push(position)
+                return
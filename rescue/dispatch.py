@@ -0,0 +1,243 @@
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Min, Q, Value, When
+from django.utils import timezone
+
+from accounts import presence
+from accounts import send_email as sm
+from accounts.models import UserProfile
+from . import routing
+from .live import get_live_store
+from .models import AnimalReport, RescueTask
+from .optimizer import solve_assignment
+
+# Reports without a volunteer; ORGANIZATION REVIEW is what UserReportView falls back to
+UNASSIGNED_STATUSES = ("PENDING", "ADMIN_REVIEW", "ORGANIZATION REVIEW")
+
+PRIORITY_ORDER = Case(
+    When(priority="HIGH", then=Value(0)),
+    When(priority="MEDIUM", then=Value(1)),
+    default=Value(2),
+    output_field=IntegerField(),
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _nearest_from_db(point, user_ids, radius_km, limit):
+    volunteers = (
+        UserProfile.objects.filter(
+            user_type="VOLUNTEER",
+            location__isnull=False,
+            user__id__in=user_ids,
+        )
+        .select_related("user")
+        .annotate(distance=Distance("location", point))
+        .order_by("distance")
+    )
+    if radius_km is not None:
+        volunteers = volunteers.filter(distance__lte=D(km=radius_km))
+    return list(volunteers[:limit] if limit else volunteers)
+
+
+def nearest_volunteers(latitude, longitude, radius_km=None, limit=None):
+    """
+    Return online volunteer profiles ordered by distance from the given point, each with
+    a `distance` measure like the PostGIS annotation. Live positions come from the shared
+    store; online volunteers without one are matched on their PostGIS profile location.
+    """
+    online_ids = presence.online_user_ids("VOLUNTEER")
+    if not online_ids:
+        return []
+
+    by_travel_time = limit and getattr(settings, "DISPATCH_RANK_BY_TRAVEL_TIME", False)
+    k = limit * getattr(settings, "DISPATCH_TRAVEL_TIME_CANDIDATES", 5) if by_travel_time else limit
+    store = get_live_store()
+    live = store.positions(online_ids, "VOLUNTEER")
+    hits = store.nearest(latitude, longitude, "VOLUNTEER", k=k, radius_km=radius_km, candidates=set(live)) if live else []
+    profiles = UserProfile.objects.select_related("user").in_bulk(
+        [user_id for user_id, _ in hits], field_name="user_id"
+    )
+
+    volunteers = []
+    for user_id, distance_km in hits:
+        profile = profiles.get(user_id)
+        if profile:
+            profile.distance = D(km=distance_km)
+            volunteers.append(profile)
+    # E.g. volunteers who are online but only share their position through their profile
+    missing = online_ids - live.keys()
+    if missing:
+        point = Point(float(longitude), float(latitude), srid=4326)
+        volunteers += _nearest_from_db(point, missing, radius_km, k)
+        volunteers.sort(key=lambda profile: profile.distance.km)
+        volunteers = volunteers[:k] if k else volunteers
+
+    times = {}
+    if by_travel_time:
+        # Straight-line distance shortlists; road travel time picks, e.g. the volunteer on this side of the river
+        positions = [
+            (profile.user_id, *(live.get(profile.user_id) or (profile.location.y, profile.location.x)))
+            for profile in volunteers
+        ]
+        times = routing.travel_times(positions, (latitude, longitude)) or {}
+        if times:
+            volunteers = sorted(volunteers, key=lambda profile: times.get(profile.user_id, float("inf")))
+    for profile in volunteers:
+        profile.travel_time = times.get(profile.user_id)  # Seconds by road, when ranked by travel time
+    return volunteers[:limit] if limit else volunteers
+
+
+def available_volunteers():
+    """
+    Online volunteers with a known position and spare capacity, as {user_id: (lat, lng)}.
+    Live positions come from the shared store; volunteers without one fall back to their
+    profile location. A volunteer is busy once they hold DISPATCH_MAX_OPEN_TASKS incomplete tasks.
+    """
+    online_ids = presence.online_user_ids("VOLUNTEER")
+    if not online_ids:
+        return {}
+
+    busy_ids = set(
+        RescueTask.objects.filter(assigned_to_id__in=online_ids, is_completed=False)
+        .values("assigned_to_id")
+        .annotate(open_tasks=Count("id"))
+        .filter(open_tasks__gte=getattr(settings, "DISPATCH_MAX_OPEN_TASKS", 1))
+        .values_list("assigned_to_id", flat=True)
+    )
+    free_ids = online_ids - busy_ids
+    positions = get_live_store().positions(free_ids, "VOLUNTEER")
+    missing = free_ids - positions.keys()
+    if missing:
+        for user_id, location in UserProfile.objects.filter(
+            user_id__in=missing, user_type="VOLUNTEER", location__isnull=False
+        ).values_list("user_id", "location"):
+            positions[user_id] = (location.y, location.x)
+    return positions
+
+
+def assign_reports(assignments):
+    """
+    Assign `(report, volunteer_profile)` pairs: update the reports, create their RescueTask
+    rows in bulk and queue the volunteer emails.
+    """
+    reports = []
+    tasks = []
+    for report, volunteer in assignments:
+        report.assigned_to = volunteer.user
+        report.status = "ASSIGNED"
+        reports.append(report)
+        tasks.append(RescueTask(
+            title=f"Animal Rescue #{report.id}",
+            description=report.description,
+            assigned_to=volunteer.user,
+            location=report.location,
+            priority=report.priority,
+            report=report,
+            is_completed=False,
+        ))
+
+    AnimalReport.objects.bulk_update(reports, ["assigned_to", "status"])
+    tasks = RescueTask.objects.bulk_create(tasks)
+    for report, volunteer in assignments:
+        sm.send_mail_to_volunteer(volunteer, report)
+    return tasks
+
+
+def report_urgency(reports, now):
+    """Urgency bonus per report in km-equivalents: priority weight plus time spent waiting."""
+    priority_weights = getattr(settings, "DISPATCH_PRIORITY_WEIGHTS", {"HIGH": 10.0, "MEDIUM": 5.0, "LOW": 0.0})
+    age_weight = getattr(settings, "DISPATCH_AGE_WEIGHT_PER_HOUR", 1.0)
+    return [
+        priority_weights.get(report.priority, 0.0)
+        + age_weight * (now - report.timestamp).total_seconds() / 3600
+        for report in reports
+    ]
+
+
+def escalation_radii():
+    return getattr(settings, "DISPATCH_ESCALATION_RADII_KM", (2, 5, 10, 25))
+
+
+def dispatch_pending_reports(now=None):
+    """
+    One sweep of the escalating re-dispatch scheduler. Unassigned reports that are due
+    (next_dispatch_at passed) are taken in priority then age order, and one global min-cost
+    assignment is solved between them and every available volunteer. Each report only
+    accepts volunteers within the radius of its escalation level; reports left unmatched
+    while volunteers were available move to the next, wider radius. Every swept report is
+    retried after DISPATCH_SWEEP_INTERVAL. Returns a dict of per-tick metrics.
+    """
+    started = time.perf_counter()
+    now = now or timezone.now()
+    radii = escalation_radii()
+    retry_at = now + timedelta(seconds=getattr(settings, "DISPATCH_SWEEP_INTERVAL", 30))
+
+    unassigned = AnimalReport.objects.filter(
+        status__in=UNASSIGNED_STATUSES, location__isnull=False, rescue_task__isnull=True
+    )
+    with transaction.atomic():
+        # Due reports via the (status, next_dispatch_at) index; skip rows another dispatcher holds
+        reports = list(
+            unassigned.select_for_update(skip_locked=True, of=("self",))
+            .filter(Q(next_dispatch_at__isnull=True) | Q(next_dispatch_at__lte=now))
+            .select_related("user")
+            .order_by(PRIORITY_ORDER, "timestamp")[:getattr(settings, "DISPATCH_SWEEP_BATCH", 200)]
+        )
+        positions = available_volunteers() if reports else {}
+        volunteer_ids = list(positions)
+        report_radii = [radii[min(report.dispatch_level, len(radii) - 1)] for report in reports]
+
+        matches = solve_assignment(
+            [(report.location.y, report.location.x) for report in reports],
+            report_urgency(reports, now),
+            [positions[user_id] for user_id in volunteer_ids],
+            report_radii,
+        )
+
+        profiles = UserProfile.objects.select_related("user").in_bulk(
+            [volunteer_ids[v] for _, v, _ in matches], field_name="user_id"
+        )
+        assignments = [
+            (reports[r], profiles[volunteer_ids[v]])
+            for r, v, _ in matches
+            if volunteer_ids[v] in profiles
+        ]
+        assign_reports(assignments)
+
+        assigned_ids = {report.id for report, _ in assignments}
+        waiting = [report for report in reports if report.id not in assigned_ids]
+        escalated = 0
+        for report in waiting:
+            # Only widen the search when there were volunteers, just none close enough
+            if positions and report.dispatch_level < len(radii) - 1:
+                report.dispatch_level += 1
+                escalated += 1
+            report.next_dispatch_at = retry_at
+        AnimalReport.objects.bulk_update(waiting, ["dispatch_level", "next_dispatch_at"])
+
+    assigned_by_radius = Counter(report_radii[r] for r, v, _ in matches if volunteer_ids[v] in profiles)
+    # Over the whole backlog, including reports not yet due or beyond this sweep's batch
+    backlog = unassigned.aggregate(count=Count("id"), oldest=Min("timestamp"))
+    oldest = backlog["oldest"]
+    stats = {
+        "reports": len(reports),
+        "backlog": backlog["count"],
+        "volunteers": len(positions),
+        "assigned": len(assignments),
+        "assigned_by_radius_km": dict(sorted(assigned_by_radius.items())),
+        "escalated": escalated,
+        "oldest_wait_s": round((now - oldest).total_seconds()) if oldest else 0,
+        "total_distance_km": round(sum(distance for _, _, distance in matches), 2),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info(f"Dispatch sweep: {stats}")
+    return stats
@@ -0,0 +1,172 @@
+import heapq
+import math
+import threading
+import time
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two WGS84 points in kilometres."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class GridIndex:
+    """
+    Thread-safe bucket grid of point positions keyed by id, supporting k-nearest queries
+    within a radius. Buckets are `cell_degrees` wide, so a query only touches the cells
+    overlapping its search box instead of every point.
+    """
+
+    # Below this many candidate ids it is cheaper to measure them directly than to walk cells
+    candidate_scan_threshold = 256
+
+    def __init__(self, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self._positions = {}
+        self._buckets = {}
+        self._lock = threading.RLock()
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def update(self, key, lat, lng):
+        lat, lng = float(lat), float(lng)
+        cell = self._cell(lat, lng)
+        with self._lock:
+            previous = self._positions.get(key)
+            if previous and previous[2] != cell:
+                self._discard(key, previous[2])
+            self._positions[key] = (lat, lng, cell)
+            self._buckets.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        with self._lock:
+            previous = self._positions.pop(key, None)
+            if previous:
+                self._discard(key, previous[2])
+
+    def _discard(self, key, cell):
+        bucket = self._buckets.get(cell)
+        if bucket:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[cell]
+
+    def get(self, key):
+        position = self._positions.get(key)
+        return position[:2] if position else None
+
+    def load(self, items):
+        """Replace the whole index with `(key, lat, lng)` tuples."""
+        with self._lock:
+            self._positions.clear()
+            self._buckets.clear()
+            for key, lat, lng in items:
+                self.update(key, lat, lng)
+            self.loaded_at = time.monotonic()
+
+    def _cells_within(self, lat, lng, radius_km):
+        dlat = radius_km / KM_PER_DEGREE
+        dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        (y0, x0), (y1, x1) = self._cell(lat - dlat, lng - dlng), self._cell(lat + dlat, lng + dlng)
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self._buckets):
+            # Search box is larger than the populated grid; walk the buckets instead
+            return [cell for cell in self._buckets if y0 <= cell[0] <= y1 and x0 <= cell[1] <= x1]
+        return [(y, x) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+    def _measure(self, lat, lng, keys, radius_km, candidates):
+        hits = []
+        for key in keys:
+            if candidates is not None and key not in candidates:
+                continue
+            position = self._positions.get(key)
+            if position is None:
+                continue
+            distance = haversine_km(lat, lng, position[0], position[1])
+            if radius_km is None or distance <= radius_km:
+                hits.append((distance, key))
+        return hits
+
+    def nearest(self, lat, lng, k=None, radius_km=None, candidates=None):
+        """
+        Return up to `k` `(key, distance_km)` pairs ordered by distance, optionally limited
+        to `radius_km` and to keys in `candidates`.
+        """
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            if radius_km is None or (candidates is not None and len(candidates) <= self.candidate_scan_threshold):
+                keys = self._positions if candidates is None else candidates
+                hits = self._measure(lat, lng, keys, radius_km, candidates)
+            else:
+                # Grow the search box until it holds k hits or covers the full radius
+                cell_km = self.cell_degrees * KM_PER_DEGREE
+                search_km = min(cell_km, radius_km)
+                while True:
+                    keys = (key for cell in self._cells_within(lat, lng, search_km) for key in self._buckets.get(cell, ()))
+                    hits = self._measure(lat, lng, keys, search_km, candidates)
+                    if (k is not None and len(hits) >= k) or search_km >= radius_km:
+                        break
+                    search_km = min(search_km * 2, radius_km)
+
+        best = heapq.nsmallest(k, hits) if k is not None else sorted(hits)
+        return [(key, distance) for distance, key in best]
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_cell_size(precision):
+    """(height, width) in degrees of a geohash cell of the given precision."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def geohash(latitude, longitude, precision=5):
+    """Geohash of a point, e.g. geohash(18.5204, 73.8567) == 'tek92'."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, value, bits, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            value, bits = 0, 0
+    return "".join(chars)
+
+
+def geohash_cells(south, west, north, east, precision=5, limit=None):
+    """
+    Geohash cells covering a bounding box, found by sampling one point per cell. A box with
+    east < west crosses the antimeridian. Returns None when more than `limit` cells would
+    be needed.
+    """
+    height, width = geohash_cell_size(precision)
+    rows = math.floor(north / height) - math.floor(south / height) + 1
+    last_column = math.ceil(180 / width) - 1
+    spans = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+    columns = [(math.floor(w / width), min(math.floor(e / width), last_column)) for w, e in spans]
+    if limit is not None and rows * sum(last - first + 1 for first, last in columns) > limit:
+        return None
+    first_lat = (math.floor(south / height) + 0.5) * height
+    return {
+        geohash(first_lat + row * height, (column + 0.5) * width, precision)
+        for row in range(rows)
+        for first, last in columns
+        for column in range(first, last + 1)
+    }
@@ -0,0 +1,8 @@
+from jobqueue.queue import register
+
+from .dispatch import dispatch_pending_reports
+
+
+@register('rescue.dispatch_pending_reports')
+def run_batch_dispatch():
+    dispatch_pending_reports()
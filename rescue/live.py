@@ -0,0 +1,466 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import msgpack
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .geo_index import GridIndex, geohash, geohash_cells
+
+# Live positions are streamed per geohash cell, so a client only hears about the cells
+# covering its map viewport. Each cell has its own sequence number:
+#   {"type": "snapshot", "cells": {"tek92": {"seq": 41, "volunteers": [{"id": 7, "latitude": .., "longitude": ..}]}}}
+#   {"type": "delta", "cell": "tek92", "since": 41, "seq": 42, "updated": [{"id": 7, ...}], "removed": [9]}
+# A delta holds the latest state of every user changed in the cell after `since`, up to
+# `seq`, so applying it twice is harmless. A client applies it when `since` is at or below
+# the last seq it saw for that cell, ignores it when `seq` is not newer, and sends
+# {"type": "resync", "cells": [...]} on a gap to get fresh snapshots. A user moving
+# between cells is removed from the old cell and added to the new one.
+
+
+# Redis geo sets reject latitudes beyond the Web Mercator limit
+MAX_LATITUDE = 85.05112878
+
+
+def cell_precision():
+    return getattr(settings, "LIVE_CELL_PRECISION", 5)
+
+
+def cell_of(latitude, longitude):
+    return geohash(latitude, longitude, cell_precision())
+
+
+def viewport_cells(south, west, north, east):
+    """Cells covering a viewport, or None if it spans more than LIVE_MAX_SUBSCRIBED_CELLS."""
+    return geohash_cells(south, west, north, east, cell_precision(), getattr(settings, "LIVE_MAX_SUBSCRIBED_CELLS", 100))
+
+
+def group_name(cell):
+    return f"live.{cell}"
+
+
+class BaseLiveLocationStore:
+    """
+    Latest position per connected user, shared by every worker. Entries expire `ttl`
+    seconds after their last update, are indexed by cell for snapshots and by user_type
+    for nearest-volunteer queries. Each cell's sequence number is advanced by the
+    broadcaster once per delta frame it sends for that cell.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def update(self, user_id, user_type, latitude, longitude):
+        """
+        Record a position. Returns the resulting changes as (cell, updated, removed)
+        tuples: one for the user's cell, preceded by a removal from the old cell if they moved.
+        """
+        user_id, position = int(user_id), (float(latitude), float(longitude))
+        if not (-MAX_LATITUDE <= position[0] <= MAX_LATITUDE and -180 <= position[1] <= 180):
+            raise ValueError(f"Position out of range: {position}")
+        cell = cell_of(*position)
+        previous_cell = self._update(user_id, user_type or "", position, cell, time.time() + self.ttl)
+        changes = [(previous_cell, {}, [user_id])] if previous_cell and previous_cell != cell else []
+        return changes + [(cell, {user_id: position}, [])]
+
+    def remove(self, user_id):
+        """Forget a user; returns the removal changes (empty if they had no position)."""
+        previous_cell = self._remove(int(user_id))
+        return [(previous_cell, {}, [int(user_id)])] if previous_cell else []
+
+    def purge_expired(self):
+        """Drop entries past their TTL; returns their removal changes."""
+        return [(cell, {}, [user_id]) for user_id, cell in self._purge(time.time())]
+
+    def _update(self, user_id, user_type, position, cell, expires_at):
+        """Store the entry atomically; return the user's previous cell, if any."""
+        raise NotImplementedError
+
+    def _remove(self, user_id):
+        raise NotImplementedError
+
+    def _purge(self, now):
+        """Remove expired entries; return them as (user_id, cell) pairs."""
+        raise NotImplementedError
+
+    def positions(self, user_ids=None, user_type=None):
+        """Live {user_id: (lat, lng)}, optionally limited to `user_ids` and to one user_type."""
+        raise NotImplementedError
+
+    def nearest(self, latitude, longitude, user_type, k=None, radius_km=None, candidates=None):
+        """Up to `k` `(user_id, distance_km)` pairs of `user_type` ordered by distance, like GridIndex.nearest."""
+        raise NotImplementedError
+
+    def snapshot(self, cells):
+        """{cell: (seq, {user_id: (lat, lng)})} for the given cells."""
+        raise NotImplementedError
+
+    def next_seq(self, cell):
+        raise NotImplementedError
+
+
+class InMemoryLiveLocationStore(BaseLiveLocationStore):
+    """Process-local store, used by the test suite and single-process development servers."""
+
+    def __init__(self, ttl):
+        super().__init__(ttl)
+        self._entries = {}
+        self._members = {}
+        self._indexes = {}
+        self._seq = {}
+        self._lock = threading.Lock()
+
+    def _leave(self, user_id, entry):
+        members = self._members.get(entry[3])
+        if members:
+            members.discard(user_id)
+            if not members:
+                del self._members[entry[3]]
+        self._indexes[entry[2]].remove(user_id)
+
+    def _update(self, user_id, user_type, position, cell, expires_at):
+        with self._lock:
+            previous = self._entries.get(user_id)
+            if previous:
+                self._leave(user_id, previous)
+            self._entries[user_id] = (*position, user_type, cell, expires_at)
+            self._members.setdefault(cell, set()).add(user_id)
+            self._indexes.setdefault(user_type, GridIndex()).update(user_id, *position)
+        return previous[3] if previous else None
+
+    def _remove(self, user_id):
+        with self._lock:
+            previous = self._entries.pop(user_id, None)
+            if previous:
+                self._leave(user_id, previous)
+        return previous[3] if previous else None
+
+    def _purge(self, now):
+        with self._lock:
+            expired = [(user_id, entry) for user_id, entry in self._entries.items() if entry[4] <= now]
+            for user_id, entry in expired:
+                del self._entries[user_id]
+                self._leave(user_id, entry)
+        return [(user_id, entry[3]) for user_id, entry in expired]
+
+    def _live(self, user_id, now, user_type=None):
+        entry = self._entries.get(user_id)
+        return entry is not None and entry[4] > now and (user_type is None or entry[2] == user_type)
+
+    def positions(self, user_ids=None, user_type=None):
+        now = time.time()
+        with self._lock:
+            ids = self._entries if user_ids is None else user_ids
+            return {user_id: self._entries[user_id][:2] for user_id in ids if self._live(user_id, now, user_type)}
+
+    def nearest(self, latitude, longitude, user_type, k=None, radius_km=None, candidates=None):
+        now = time.time()
+        with self._lock:
+            index = self._indexes.get(user_type or "")
+            if index is None:
+                return []
+            ids = self._entries if candidates is None else candidates
+            live = {user_id for user_id in ids if self._live(user_id, now, user_type or "")}
+        return index.nearest(latitude, longitude, k=k, radius_km=radius_km, candidates=live)
+
+    def snapshot(self, cells):
+        now = time.time()
+        with self._lock:
+            return {
+                cell: (
+                    self._seq.get(cell, 0),
+                    {
+                        user_id: self._entries[user_id][:2]
+                        for user_id in self._members.get(cell, ())
+                        if self._live(user_id, now)
+                    },
+                )
+                for cell in cells
+            }
+
+    def next_seq(self, cell):
+        with self._lock:
+            self._seq[cell] = self._seq.get(cell, 0) + 1
+            return self._seq[cell]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._members.clear()
+            self._indexes.clear()
+            self._seq.clear()
+
+
+# Scripts keep an entry, its cell membership, geo index and expiry in step in one round trip.
+# Keys: <prefix>:entries (hash id -> [lat, lng, user_type, cell, expires_at]),
+# <prefix>:cell:<cell> (hash id -> [lat, lng, expires_at]), <prefix>:geo:<user_type>,
+# <prefix>:expiry (zset id -> expires_at) and <prefix>:seq:<cell> (INCR counter).
+_UNLINK = """
+local function unlink(p, id)
+    local old = redis.call('HGET', p .. ':entries', id)
+    if not old then return false end
+    local entry = cjson.decode(old)
+    redis.call('HDEL', p .. ':entries', id)
+    redis.call('HDEL', p .. ':cell:' .. entry[4], id)
+    redis.call('ZREM', p .. ':geo:' .. entry[3], id)
+    redis.call('ZREM', p .. ':expiry', id)
+    return entry[4]
+end
+"""
+
+_UPDATE_SCRIPT = _UNLINK + """
+local p, id, lat, lng, user_type, cell, expires_at = unpack(ARGV)
+local previous = unlink(p, id)
+redis.call('HSET', p .. ':entries', id, cjson.encode({tonumber(lat), tonumber(lng), user_type, cell, tonumber(expires_at)}))
+redis.call('HSET', p .. ':cell:' .. cell, id, cjson.encode({tonumber(lat), tonumber(lng), tonumber(expires_at)}))
+redis.call('GEOADD', p .. ':geo:' .. user_type, lng, lat, id)
+redis.call('ZADD', p .. ':expiry', expires_at, id)
+return previous
+"""
+
+_REMOVE_SCRIPT = _UNLINK + """
+return unlink(ARGV[1], ARGV[2])
+"""
+
+_PURGE_SCRIPT = _UNLINK + """
+local p = ARGV[1]
+local expired = {}
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', p .. ':expiry', '-inf', ARGV[2], 'LIMIT', 0, tonumber(ARGV[3]))) do
+    local cell = unlink(p, id)
+    if cell then
+        table.insert(expired, id)
+        table.insert(expired, cell)
+    end
+end
+return expired
+"""
+
+
+class RedisLiveLocationStore(BaseLiveLocationStore):
+    """
+    Stores entries in Redis so every ASGI worker sees the same live positions. Updates,
+    removals and expiry run as Lua scripts, so an entry never sits in one cell's hash while
+    its record points at another; nearest queries use GEOSEARCH and per-cell sequence
+    numbers come from INCR, so frames from different workers share one sequence.
+    """
+
+    key_prefix = "live"
+    purge_batch = 500
+    # GEOSEARCH needs a radius; this covers the globe
+    max_radius_km = 20040
+
+    def __init__(self, ttl, url=None):
+        import redis
+
+        super().__init__(ttl)
+        self.redis = redis.Redis.from_url(url or getattr(settings, "LIVE_LOCATION_REDIS_URL"))
+        self._update_script = self.redis.register_script(_UPDATE_SCRIPT)
+        self._remove_script = self.redis.register_script(_REMOVE_SCRIPT)
+        self._purge_script = self.redis.register_script(_PURGE_SCRIPT)
+
+    def _key(self, *parts):
+        return ":".join((self.key_prefix, *parts))
+
+    @staticmethod
+    def _str(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _update(self, user_id, user_type, position, cell, expires_at):
+        previous = self._update_script(args=[self.key_prefix, user_id, *map(repr, position), user_type, cell, expires_at])
+        return self._str(previous) if previous else None
+
+    def _remove(self, user_id):
+        previous = self._remove_script(args=[self.key_prefix, user_id])
+        return self._str(previous) if previous else None
+
+    def _purge(self, now):
+        flat = self._purge_script(args=[self.key_prefix, now, self.purge_batch])
+        return [(int(flat[i]), self._str(flat[i + 1])) for i in range(0, len(flat), 2)]
+
+    def positions(self, user_ids=None, user_type=None):
+        key = self._key("entries")
+        if user_ids is None:
+            rows = self.redis.hgetall(key).items()
+        else:
+            user_ids = list(user_ids)
+            rows = zip(user_ids, self.redis.hmget(key, user_ids) if user_ids else [])
+        now = time.time()
+        positions = {}
+        for user_id, raw in rows:
+            if raw:
+                lat, lng, entry_type, _, expires_at = json.loads(raw)
+                if expires_at > now and (user_type is None or entry_type == user_type):
+                    positions[int(user_id)] = (lat, lng)
+        return positions
+
+    def nearest(self, latitude, longitude, user_type, k=None, radius_km=None, candidates=None):
+        hits = self.redis.geosearch(
+            self._key("geo", user_type or ""),
+            longitude=float(longitude),
+            latitude=float(latitude),
+            radius=radius_km if radius_km is not None else self.max_radius_km,
+            unit="km",
+            sort="ASC",
+            # Candidate filtering happens here, so a count would cut off valid hits
+            count=k if candidates is None else None,
+            withdist=True,
+        )
+        hits = [(int(user_id), distance) for user_id, distance in hits]
+        if candidates is not None:
+            hits = [hit for hit in hits if hit[0] in candidates]
+        if not hits:
+            return []
+        now = time.time()
+        expiry = self.redis.zmscore(self._key("expiry"), [user_id for user_id, _ in hits])
+        hits = [hit for hit, expires_at in zip(hits, expiry) if expires_at and expires_at > now]
+        return hits[:k] if k is not None else hits
+
+    def snapshot(self, cells):
+        cells = list(cells)
+        pipe = self.redis.pipeline(transaction=True)
+        for cell in cells:
+            pipe.get(self._key("seq", cell))
+            pipe.hgetall(self._key("cell", cell))
+        results = pipe.execute()
+        now = time.time()
+        snapshot = {}
+        for i, cell in enumerate(cells):
+            seq, members = results[2 * i], results[2 * i + 1]
+            positions = {}
+            for user_id, raw in members.items():
+                lat, lng, expires_at = json.loads(raw)
+                if expires_at > now:
+                    positions[int(user_id)] = (lat, lng)
+            snapshot[cell] = (int(seq or 0), positions)
+        return snapshot
+
+    def next_seq(self, cell):
+        return self.redis.incr(self._key("seq", cell))
+
+
+_store = None
+
+
+def get_live_store():
+    global _store
+    if _store is None:
+        backend = import_string(getattr(settings, "LIVE_LOCATION_STORE", "rescue.live.InMemoryLiveLocationStore"))
+        _store = backend(ttl=getattr(settings, "LIVE_LOCATION_TTL", 300))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_live_store(sender, setting, **kwargs):
+    global _store
+    if setting in ("LIVE_LOCATION_STORE", "LIVE_LOCATION_TTL", "LIVE_LOCATION_REDIS_URL"):
+        _store = None
+
+
+# Clients that offer this WebSocket subprotocol exchange msgpack frames instead of JSON text.
+# Frames have the same shape, except that position entries are [id, lat, lng] arrays and a
+# location ping may be sent as a bare [lat, lng] array.
+BINARY_SUBPROTOCOL = "wesalvator.location.msgpack.v1"
+
+
+class InvalidMessage(ValueError):
+    pass
+
+
+def encode_frame(payload, binary=False):
+    return msgpack.packb(payload) if binary else json.dumps(payload)
+
+
+def decode_message(text_data=None, bytes_data=None):
+    """Parse a client message into a dict; raises InvalidMessage for anything malformed."""
+    if bytes_data is not None:
+        try:
+            data = msgpack.unpackb(bytes_data, raw=False, strict_map_key=False)
+        except Exception:
+            raise InvalidMessage("Invalid msgpack frame")
+        if isinstance(data, (list, tuple)) and len(data) == 2:
+            data = {"latitude": data[0], "longitude": data[1]}
+    else:
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            raise InvalidMessage("Invalid JSON format")
+    if not isinstance(data, dict):
+        raise InvalidMessage("Expected an object")
+    return data
+
+
+def parse_points(points):
+    """
+    Validate a batch of [unix_seconds, lat, lng] points, e.g. queued while offline. Returns
+    (timestamp, lat, lng) tuples oldest first, with timezone-aware timestamps.
+    """
+    if not isinstance(points, (list, tuple)) or not points:
+        raise InvalidMessage("points must be a non-empty list of [timestamp, latitude, longitude]")
+    if len(points) > getattr(settings, "LIVE_MAX_BATCH_POINTS", 500):
+        raise InvalidMessage("Too many points in one message")
+    latest = time.time() + 60  # Allow for client clock skew
+    parsed = []
+    for point in points:
+        try:
+            timestamp, latitude, longitude = map(float, point)
+        except (TypeError, ValueError):
+            raise InvalidMessage("points must be a non-empty list of [timestamp, latitude, longitude]")
+        if timestamp > latest or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise InvalidMessage("Point out of range")
+        parsed.append((datetime.fromtimestamp(min(timestamp, time.time()), tz=dt_timezone.utc), latitude, longitude))
+    parsed.sort(key=lambda point: point[0])
+    return parsed
+
+
+def _entry(user_id, position, binary=False):
+    if binary:
+        return [user_id, position[0], position[1]]
+    return {"id": user_id, "latitude": position[0], "longitude": position[1]}
+
+
+def snapshot_frame(cells, binary=False):
+    """Frame for the output of BaseLiveLocationStore.snapshot()."""
+    return encode_frame({
+        "type": "snapshot",
+        "cells": {
+            cell: {
+                "seq": seq,
+                "volunteers": [_entry(user_id, position, binary) for user_id, position in positions.items()],
+            }
+            for cell, (seq, positions) in cells.items()
+        },
+    }, binary)
+
+
+def merge_changes(updated, removed, new_updated, new_removed):
+    """
+    Fold a later change of one cell into pending `updated` ({id: (lat, lng)}) and `removed`
+    (set of ids), in place. Returns how many pending entries it superseded.
+    """
+    superseded = 0
+    for user_id, position in new_updated.items():
+        superseded += user_id in updated or user_id in removed
+        removed.discard(user_id)
+        updated[user_id] = position
+    for user_id in new_removed:
+        superseded += user_id in updated or user_id in removed
+        updated.pop(user_id, None)
+        removed.add(user_id)
+    return superseded
+
+
+def delta_frame(cell, seq, updated=None, removed=(), since=None, binary=False):
+    return encode_frame({
+        "type": "delta",
+        "cell": cell,
+        "since": seq - 1 if since is None else since,
+        "seq": seq,
+        "updated": [_entry(user_id, position, binary) for user_id, position in (updated or {}).items()],
+        "removed": sorted(removed),
+    }, binary)
+
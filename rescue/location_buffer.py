@@ -0,0 +1,164 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class LocationWriteBuffer:
+    """
+    Write-behind buffer for live location pings. Only the latest position per user is kept
+    in memory; every LOCATION_BUFFER_INTERVAL seconds, or once LOCATION_BUFFER_MAX_UPDATES
+    pings have arrived, the batch is written with one upsert into VolunteerLocation plus
+    one insert of the points callers marked for UserLocationHistory. So database load grows
+    with the number of moving users per interval, not with the ping rate.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Keeps batches written in the order they were taken
+        self._updates = 0
+        self._task = None
+        self._flush_lock = None
+        self.received = self.written = self.flushes = 0
+
+    @property
+    def interval(self):
+        return getattr(settings, "LOCATION_BUFFER_INTERVAL", 2.0)
+
+    @property
+    def max_updates(self):
+        return getattr(settings, "LOCATION_BUFFER_MAX_UPDATES", 500)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id, user_type, latitude, longitude, timestamp=None, history=()):
+        """
+        Record a position, plus `(timestamp, lat, lng)` points to append to the history
+        (e.g. the ones the movement filter kept); must be called from the event loop.
+        """
+        with self._lock:
+            previous = self._pending.get(int(user_id))
+            kept = (previous[4] if previous else []) + list(history)
+            self._pending[int(user_id)] = (float(latitude), float(longitude), user_type, timestamp or timezone.now(), kept)
+            self._updates += 1
+            self.received += 1
+            full = self._updates >= self.max_updates
+        self._ensure_running()
+        if full:
+            asyncio.get_running_loop().create_task(self.flush())
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def _take(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                batch, self._pending, self._updates = self._pending, {}, 0
+            else:
+                batch = {
+                    user_id: self._pending.pop(user_id)
+                    for user_id in map(int, user_ids)
+                    if user_id in self._pending
+                }
+        return batch
+
+    def _restore(self, batch):
+        # Put a failed batch back, without overwriting positions that arrived since
+        with self._lock:
+            for user_id, entry in batch.items():
+                newer = self._pending.get(user_id)
+                if newer:
+                    self._pending[user_id] = (*newer[:4], entry[4] + newer[4])
+                else:
+                    self._pending[user_id] = entry
+
+    async def flush(self, user_ids=None):
+        """
+        Write everything buffered so far, or only the positions of `user_ids`. Concurrent
+        calls are serialised.
+        """
+        async with self._flush_lock or asyncio.Lock():
+            if self._pending:
+                await sync_to_async(self._write_pending)(user_ids)
+
+    def flush_sync(self):
+        """Flush from synchronous code, e.g. at interpreter shutdown."""
+        self._write_pending()
+
+    def _write_pending(self, user_ids=None):
+        # Taken and written under one lock, so a shutdown flush can't overtake an older
+        # batch that flush() is still writing
+        with self._write_lock:
+            batch = self._take(user_ids)
+            if batch:
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    logger.error(f"Location flush of {len(batch)} users failed, will retry: {e}")
+                    self._restore(batch)
+
+    def write(self, batch):
+        from django.contrib.gis.geos import Point
+        from base.snapshots import invalidate_snapshot
+        from .models import UserLocationHistory, VolunteerLocation
+
+        try:
+            VolunteerLocation.objects.bulk_create(
+                [
+                    VolunteerLocation(volunteer_id=user_id, latitude=lat, longitude=lng)
+                    for user_id, (lat, lng, _, _, _) in batch.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["volunteer"],
+                update_fields=["latitude", "longitude", "updated_at"],
+            )
+            history = [
+                (user_id, point, user_type)
+                for user_id, (_, _, user_type, _, points) in batch.items()
+                for point in points
+            ]
+            if history:
+                UserLocationHistory.objects.bulk_create([
+                    UserLocationHistory(
+                        user_id=user_id,
+                        location=Point(lng, lat, srid=4326),
+                        timestamp=timestamp,
+                        user_type=user_type or "",
+                    )
+                    for user_id, (timestamp, lat, lng), user_type in history
+                ])
+            # bulk_create skips post_save, so do what the VolunteerLocation receiver would have done
+            invalidate_snapshot("volunteer_locations")
+        finally:
+            close_old_connections()
+        self.written += len(batch)
+        self.flushes += 1
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "received": self.received,
+            "written": self.written,
+            "flushes": self.flushes,
+        }
+
+
+# Process-wide buffer shared by every LocationConsumer
+location_buffer = LocationWriteBuffer()
+atexit.register(location_buffer.flush_sync)
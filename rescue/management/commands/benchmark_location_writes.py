@@ -0,0 +1,75 @@
+import math
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from rescue.api.views import save_location_batch, save_user_location
+from rescue.models import UserLocationHistory
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare location write throughput: one point per save-location request vs locations/batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=500, help='Points written per run')
+        parser.add_argument('--batch-sizes', nargs='+', type=int, default=[10, 100, 500])
+
+    def handle(self, *args, **options):
+        # A walk around Pune, one point every 10 s and ~40 m apart, so the movement filter keeps most of them
+        started_at = time.time() - options['points'] * 10
+        track = [
+            (started_at + i * 10, 18.5204 + 0.0003 * math.sin(i / 20) + i * 0.0002, 73.8567 + 0.0003 * i)
+            for i in range(options['points'])
+        ]
+
+        rate, stored = self.run(track, single=True)
+        self.stdout.write(f'{"save-location":>18} | {rate:10,.0f} points/s | {stored:>6} history rows')
+        baseline = rate
+        for size in options['batch_sizes']:
+            rate, stored = self.run(track, batch_size=size)
+            self.stdout.write(
+                f'{f"batch of {size}":>18} | {rate:10,.0f} points/s | {stored:>6} history rows | x{rate / baseline:,.1f}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def run(self, track, single=False, batch_size=None):
+        """Write `track` for a throwaway user, rolled back afterwards. Returns (points/s, history rows)."""
+        factory = APIRequestFactory()
+        result = None
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username=f'bench-writer-{time.monotonic_ns()}')
+                if single:
+                    requests = [
+                        factory.post('/api/save-location/', {'latitude': lat, 'longitude': lng}, format='json')
+                        for _, lat, lng in track
+                    ]
+                    view = save_user_location
+                else:
+                    requests = [
+                        factory.post('/api/locations/batch/', {'points': track[i:i + batch_size]}, format='json')
+                        for i in range(0, len(track), batch_size)
+                    ]
+                    view = save_location_batch
+
+                started = time.perf_counter()
+                for request in requests:
+                    force_authenticate(request, user=user)
+                    response = view(request)
+                    if response.status_code != 200:
+                        raise RuntimeError(f'Write failed with {response.status_code}: {response.data}')
+                elapsed = time.perf_counter() - started
+
+                result = (len(track) / elapsed, UserLocationHistory.objects.filter(user=user).count())
+                raise Rollback
+        except Rollback:
+            pass
+        return result
@@ -0,0 +1,95 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import UserProfile
+from rescue.geo_index import GridIndex
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare nearest-volunteer lookups: in-memory grid index vs the PostGIS Distance query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--radius', type=float, default=10, help='Search radius in km')
+        parser.add_argument('--skip-orm', action='store_true', help='Only benchmark the in-memory index')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        # Volunteers spread over a ~100km box around Pune
+        center_lat, center_lng, spread = 18.5204, 73.8567, 0.5
+
+        for size in options['sizes']:
+            points = [
+                (i, center_lat + rng.uniform(-spread, spread), center_lng + rng.uniform(-spread, spread))
+                for i in range(size)
+            ]
+            queries = [
+                (center_lat + rng.uniform(-spread, spread), center_lng + rng.uniform(-spread, spread))
+                for _ in range(options['queries'])
+            ]
+
+            index = GridIndex()
+            started = time.perf_counter()
+            index.load(points)
+            load_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            for lat, lng in queries:
+                index.nearest(lat, lng, k=1, radius_km=options['radius'])
+            index_us = (time.perf_counter() - started) / len(queries) * 1e6
+
+            line = f'{size:>7} volunteers | index load {load_ms:8.1f} ms | index query {index_us:9.1f} us'
+            if not options['skip_orm']:
+                orm_us = self.benchmark_orm(points, queries, options['radius'])
+                line += f' | PostGIS query {orm_us:9.1f} us | speedup x{orm_us / index_us:,.0f}'
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def benchmark_orm(self, points, queries, radius_km):
+        """Time the previous dispatch query against throwaway volunteers, rolled back afterwards."""
+        result = None
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    [User(username=f'bench-volunteer-{i}') for i, _, _ in points], batch_size=5000
+                )
+                UserProfile.objects.bulk_create(
+                    [
+                        UserProfile(user=user, user_type='VOLUNTEER', location=Point(lng, lat, srid=4326))
+                        for user, (_, lat, lng) in zip(users, points)
+                    ],
+                    batch_size=5000,
+                )
+                user_ids = [user.id for user in users]
+
+                started = time.perf_counter()
+                for lat, lng in queries:
+                    (
+                        UserProfile.objects.filter(
+                            user_type='VOLUNTEER',
+                            location__isnull=False,
+                            user__id__in=user_ids,
+                        )
+                        .annotate(distance=Distance('location', Point(lng, lat, srid=4326)))
+                        .filter(distance__lte=D(km=radius_km))
+                        .order_by('distance')
+                        .first()
+                    )
+                result = (time.perf_counter() - started) / len(queries) * 1e6
+                raise Rollback
+        except Rollback:
+            pass
+        return result
@@ -0,0 +1,51 @@
+import itertools
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rescue.models import UserLocationHistory
+from rescue.track_filter import get_thresholds, simplify
+
+
+class Command(BaseCommand):
+    help = 'Simplify stored location tracks with Douglas-Peucker, deleting points that do not change their shape'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, default=3600.0, help='Only compact points older than this many seconds')
+        parser.add_argument('--window', type=float, default=24 * 3600.0, help='Seconds of history before --older-than to compact')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help='Report the reduction without deleting')
+
+    def handle(self, *args, **options):
+        end = timezone.now() - timedelta(seconds=options['older_than'])
+        start = end - timedelta(seconds=options['window'])
+        # Bounded on timestamp so only the partitions of that window are read
+        window = UserLocationHistory.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        rows = (
+            window.order_by('user_id', 'timestamp')
+            .values_list('id', 'user_id', 'user_type', 'location')
+            .iterator(chunk_size=options['batch_size'])
+        )
+
+        total = tracks = 0
+        redundant = []
+        for _, track in itertools.groupby(rows, key=lambda row: row[1]):
+            track = list(track)
+            tolerance = get_thresholds(track[0][2])['simplify_tolerance_m']
+            kept = set(simplify([(location.y, location.x) for _, _, _, location in track], tolerance))
+            redundant += [row[0] for i, row in enumerate(track) if i not in kept]
+            total += len(track)
+            tracks += 1
+
+        deleted = 0
+        if not options['dry_run']:
+            for i in range(0, len(redundant), options['batch_size']):
+                count, _ = window.filter(id__in=redundant[i:i + options['batch_size']]).delete()
+                deleted += count
+
+        reduction = len(redundant) / total if total else 0
+        verb = 'would delete' if options['dry_run'] else f'deleted {deleted} of'
+        self.stdout.write(self.style.SUCCESS(
+            f'{tracks} tracks, {total} points: {verb} {len(redundant)} redundant points ({reduction:.1%} reduction)'
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from rescue.dispatch import dispatch_pending_reports
+
+
+class Command(BaseCommand):
+    help = 'Sweep unassigned reports and assign them to available volunteers, widening the radius each sweep'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping every --interval seconds')
+        parser.add_argument('--interval', type=float, help='Defaults to DISPATCH_SWEEP_INTERVAL')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or getattr(settings, 'DISPATCH_SWEEP_INTERVAL', 30)
+        while True:
+            close_old_connections()
+            stats = dispatch_pending_reports()
+            by_radius = ', '.join(f"{count}@{radius}km" for radius, count in stats['assigned_by_radius_km'].items())
+            self.stdout.write(
+                f"{stats['assigned']}/{stats['reports']} swept reports assigned ({by_radius or 'none'}) to "
+                f"{stats['volunteers']} available volunteers | {stats['escalated']} escalated | "
+                f"backlog {stats['backlog']}, oldest {stats['oldest_wait_s']}s | "
+                f"{stats['total_distance_km']} km total | {stats['elapsed_ms']} ms"
+            )
+            if not options['loop']:
+                break
+            # Keep a steady cadence: sleep for what's left of the interval after the sweep
+            time.sleep(max(0.0, interval - stats['elapsed_ms'] / 1000))
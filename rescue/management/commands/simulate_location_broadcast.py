@@ -0,0 +1,98 @@
+import json
+import random
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from rescue.geo_index import geohash_cell_size
+from rescue.live import InMemoryLiveLocationStore, cell_precision, delta_frame, merge_changes, snapshot_frame, viewport_cells
+
+
+class Command(BaseCommand):
+    help = 'Simulate volunteer location broadcasts and compare bandwidth of global, cell-scoped and ticked delta frames'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 5000], help='Connected volunteers')
+        parser.add_argument('--ping-interval', type=float, default=3.0, help='Seconds between pings per volunteer')
+        parser.add_argument('--seconds', type=float, default=30.0, help='Simulated duration')
+        parser.add_argument('--tick', type=float, default=1.0, help='Broadcast tick in seconds')
+        parser.add_argument('--spread', type=float, default=0.3, help='Degrees volunteers are scattered around the city centre')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        interval, duration, spread = options['ping_interval'], options['seconds'], options['spread']
+        height, width = geohash_cell_size(cell_precision())
+
+        for size in options['sizes']:
+            live = InMemoryLiveLocationStore(ttl=3600)
+            positions = {}
+            for user_id in range(1, size + 1):
+                positions[user_id] = (18.52 + rng.uniform(-spread, spread), 73.86 + rng.uniform(-spread, spread))
+                live.update(user_id, 'VOLUNTEER', *positions[user_id])
+
+            # Each client watches the 3x3 cells around itself, i.e. a map zoomed in on its area
+            watchers = Counter()
+            for lat, lng in positions.values():
+                watchers.update(viewport_cells(lat - height, lng - width, lat + height, lng + width))
+            observed = viewport_cells(18.52 - height, 73.86 - width, 18.52 + height, 73.86 + width)
+            snapshot = live.snapshot(observed)
+            snapshot_bytes = len(snapshot_frame(snapshot).encode())
+            client = {cell: dict(entries) for cell, (_, entries) in snapshot.items()}
+
+            pings = int(size * duration / interval)
+            ticks = max(1, int(duration / options['tick']))
+            # Per-ping frames (one per change) versus one merged frame per changed cell and tick
+            change_deliveries = changes = 0
+            frame_bytes = binary_bytes = deliveries = frames = 0
+            started = time.perf_counter()
+            for tick in range(ticks):
+                pending = {}
+                for _ in range(pings * (tick + 1) // ticks - pings * tick // ticks):
+                    user_id = rng.randint(1, size)
+                    lat, lng = positions[user_id]
+                    positions[user_id] = lat, lng = lat + rng.uniform(-2e-3, 2e-3), lng + rng.uniform(-2e-3, 2e-3)
+                    for cell, updated, removed in live.update(user_id, 'VOLUNTEER', lat, lng):
+                        changes += 1
+                        change_deliveries += watchers[cell]
+                        merge_changes(*pending.setdefault(cell, ({}, set())), updated, removed)
+                for cell, (updated, removed) in pending.items():
+                    seq = live.next_seq(cell)
+                    frame = delta_frame(cell, seq, updated, removed)
+                    frames += 1
+                    frame_bytes += len(frame.encode())
+                    binary_bytes += len(delta_frame(cell, seq, updated, removed, binary=True))
+                    deliveries += watchers[cell]
+                    # Apply it as the observing client would, to check the cell streams reproduce the state
+                    if cell in client:
+                        frame = json.loads(frame)
+                        client[cell].update({e["id"]: (e["latitude"], e["longitude"]) for e in frame["updated"]})
+                        for removed_id in frame["removed"]:
+                            client[cell].pop(removed_id, None)
+            encode_us = (time.perf_counter() - started) / max(frames, 1) * 1e6
+            expected = {cell: entries for cell, (_, entries) in live.snapshot(observed).items()}
+            assert client == expected, 'cell delta streams diverged from server state'
+
+            # Global fan-out sends every change to every client as its own frame; cell-scoped
+            # only to the cell's watchers; ticked merges a cell's changes into one frame per tick
+            single = len(delta_frame('tek92', 1, {1: (18.52, 73.86)}).encode())
+            global_rate = single * changes * size / duration
+            scoped_rate = single * change_deliveries / duration
+            ticked_rate = frame_bytes / max(frames, 1) * deliveries / duration
+            self.stdout.write(
+                f'{size:>5} volunteers, {pings / duration:7.1f} pings/s | snapshot {snapshot_bytes / 1024:6.1f} KB | '
+                f'global {self.rate(global_rate / size)}/client | '
+                f'by cell {self.rate(scoped_rate / size)}/client | '
+                f'ticked {self.rate(ticked_rate / size)}/client, {deliveries / size / duration:.1f} frames/s/client '
+                f'({changes / max(frames, 1):.1f} changes/frame) | msgpack {binary_bytes / max(frame_bytes, 1):.0%} of JSON | '
+                f'{encode_us:.1f} us/frame'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Simulation complete.'))
+
+    @staticmethod
+    def rate(bytes_per_second):
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if bytes_per_second < 1024 or unit == 'GB':
+                return f'{bytes_per_second:8.1f} {unit}/s'
+            bytes_per_second /= 1024
@@ -1,8 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
 from django.contrib.gis.db import models
 from django.conf import settings
 from django.utils import timezone
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from base.images import track_photo_derivatives
+from base.storage import track_blob_references
+from base.snapshots import invalidate_snapshot
+from .clusters import cluster_index, track_report, untrack_position
 
 class AnimalReport(models.Model):
     STATUS_CHOICES = (
@@ -31,6 +38,15 @@ class AnimalReport(models.Model):
         related_name='assigned_reports'
     )
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='MEDIUM')
+    # Escalating re-dispatch (see rescue/dispatch.py): index into DISPATCH_ESCALATION_RADII_KM
+    # and when the sweeper should try this report again
+    dispatch_level = models.PositiveSmallIntegerField(default=0)
+    next_dispatch_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_dispatch_at']),
+        ]
 
     def __str__(self):
         return f"Report by {self.user.username} on {self.timestamp}"
@@ -80,6 +96,8 @@ class VolunteerLocation(models.Model):
         return f"{self.volunteer.username}'s Location"
     
 class UserLocationHistory(models.Model):
+    # Range-partitioned by day on `timestamp` in PostgreSQL (see base/partitions.py), so
+    # queries should bound `timestamp` to touch only the recent partitions
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     location = models.PointField(geography=True)
     timestamp = models.DateTimeField(default=timezone.now)
@@ -92,4 +110,34 @@ class UserLocationHistory(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.user.username} location at {self.timestamp}"
\ No newline at end of file
+        return f"{self.user.username} location at {self.timestamp}"
+
+
+# Build resized photo derivatives off the request thread when a photo changes
+track_photo_derivatives(AnimalReport, 'photo')
+track_photo_derivatives(AnimalReportImage, 'image')
+
+# Keep the map cluster index (rescue/clusters.py) in step with reports
+@receiver(post_save, sender=AnimalReport)
+def cluster_report(sender, instance, **kwargs):
+    track_report(instance)
+
+@receiver(post_delete, sender=AnimalReport)
+def uncluster_report(sender, instance, **kwargs):
+    cluster_index.remove("report", instance.id)
+
+@receiver(user_logged_out)
+def uncluster_volunteer(sender, request, user, **kwargs):
+    if user is not None:
+        untrack_position(user.pk)
+
+# Cached active volunteer listing (base/snapshots.py); the location buffer's bulk upserts
+# skip these receivers and invalidate it themselves
+@receiver(post_save, sender=VolunteerLocation)
+@receiver(post_delete, sender=VolunteerLocation)
+def invalidate_volunteer_locations(sender, instance, **kwargs):
+    invalidate_snapshot("volunteer_locations")
+
+# Reference counts for deduplicated photo blobs
+track_blob_references(AnimalReport, 'photo')
+track_blob_references(AnimalReportImage, 'image')
@@ -0,0 +1,104 @@
+import numpy as np
+
+from .geo_index import EARTH_RADIUS_KM
+
+# Cost given to report/volunteer pairs that must never be matched (out of range)
+FORBIDDEN = 1e9
+
+
+def distance_matrix_km(report_coords, volunteer_coords):
+    """Haversine distances between every report and volunteer; coords are (lat, lng) rows."""
+    reports = np.radians(np.asarray(report_coords, dtype=float)).reshape(-1, 1, 2)
+    volunteers = np.radians(np.asarray(volunteer_coords, dtype=float)).reshape(1, -1, 2)
+    dlat = volunteers[..., 0] - reports[..., 0]
+    dlng = volunteers[..., 1] - reports[..., 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(reports[..., 0]) * np.cos(volunteers[..., 0]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def build_cost_matrix(distances_km, urgency, max_distance_km):
+    """
+    Cost of sending each volunteer to each report: travel distance minus the report's
+    urgency bonus (priority plus waiting time, in km-equivalents), so that when volunteers
+    are scarce the solver spends them on the most urgent reports. `max_distance_km` is a
+    single limit or one per report.
+    """
+    cost = distances_km - np.asarray(urgency, dtype=float).reshape(-1, 1)
+    cost[distances_km > np.asarray(max_distance_km, dtype=float).reshape(-1, 1)] = FORBIDDEN
+    return cost
+
+
+def linear_sum_assignment(cost):
+    """
+    Minimum-cost assignment for a rectangular cost matrix (Hungarian algorithm with
+    potentials, inner loop vectorised over columns). Returns (row_indices, col_indices)
+    sorted by row, matching min(n_rows, n_cols) pairs.
+    """
+    cost = np.asarray(cost, dtype=float)
+    if cost.size == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=int)  # owner[j] = 1-based row matched to column j, 0 = free
+    way = np.zeros(m + 1, dtype=int)
+
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            used_cols = np.flatnonzero(used)
+            u[owner[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(owner[1:])
+    rows = owner[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def solve_assignment(report_coords, urgency, volunteer_coords, max_distance_km):
+    """
+    Match reports to volunteers minimising total cost, never further apart than
+    `max_distance_km` (scalar or per report). Returns a list of
+    (report_index, volunteer_index, distance_km) for feasible pairs only.
+    """
+    if len(report_coords) == 0 or len(volunteer_coords) == 0:
+        return []
+    distances = distance_matrix_km(report_coords, volunteer_coords)
+    cost = build_cost_matrix(distances, urgency, max_distance_km)
+    rows, cols = linear_sum_assignment(cost)
+    return [
+        (int(r), int(c), float(distances[r, c]))
+        for r, c in zip(rows, cols)
+        if cost[r, c] < FORBIDDEN
+    ]
@@ -0,0 +1,332 @@
+import heapq
+import logging
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .geo_index import EARTH_RADIUS_KM, GridIndex
+
+logger = logging.getLogger(__name__)
+
+# Assumed speeds in km/h for the OSM highway classes we route over
+HIGHWAY_SPEEDS = {
+    "motorway": 80, "motorway_link": 50,
+    "trunk": 60, "trunk_link": 40,
+    "primary": 50, "primary_link": 35,
+    "secondary": 40, "secondary_link": 30,
+    "tertiary": 35, "tertiary_link": 25,
+    "unclassified": 25, "residential": 25, "living_street": 10,
+    "service": 15, "road": 20,
+}
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2000 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _csr(sources, targets, n):
+    """Sort an edge list by source and return (offsets, order) for compressed adjacency."""
+    order = np.argsort(sources, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+    return offsets, order
+
+
+class RoadGraph:
+    """
+    Directed road network in compressed sparse row form. Node positions, edge targets and
+    edge costs live in flat `array` buffers, so a city extract costs a few bytes per edge and
+    the search loop indexes plain Python floats. Routes are found with A* on travel time.
+    """
+
+    def __init__(self, lat, lng, sources, targets, lengths, durations):
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.float64)
+        durations = np.asarray(durations, dtype=np.float64)
+        n = len(lat)
+
+        offsets, order = _csr(sources, targets, n)
+        self.lat = array("d", lat.tobytes())
+        self.lng = array("d", lng.tobytes())
+        self.offsets = array("q", offsets.tobytes())
+        self.targets = array("q", targets[order].tobytes())
+        self.lengths = array("d", lengths[order].tobytes())
+        self.durations = array("d", durations[order].tobytes())
+
+        # Reverse adjacency for one-to-many searches towards a single destination
+        reverse_offsets, reverse_order = _csr(targets, sources, n)
+        self.reverse_offsets = array("q", reverse_offsets.tobytes())
+        self.reverse_sources = array("q", sources[reverse_order].tobytes())
+        self.reverse_durations = array("d", durations[reverse_order].tobytes())
+
+        # Upper bound on speed (m/s) keeps the A* heuristic admissible
+        self.max_speed = float(np.max(lengths / np.maximum(durations, 1e-9))) if len(lengths) else 1.0
+
+        self.index = GridIndex(cell_degrees=0.005)
+        self.index.load((int(i), lat[i], lng[i]) for i in np.flatnonzero(np.diff(offsets) + np.diff(reverse_offsets)))
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    # Building and loading
+
+    @classmethod
+    def from_osm(cls, source):
+        """Build a graph from an OSM XML extract (path or file object), keeping routable highways."""
+        positions = {}
+        edges = []
+        for _, element in ET.iterparse(source, events=("end",)):
+            if element.tag == "node":
+                positions[element.get("id")] = (float(element.get("lat")), float(element.get("lon")))
+                element.clear()
+            elif element.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                speed = HIGHWAY_SPEEDS.get(tags.get("highway"))
+                if speed is not None:
+                    refs = [nd.get("ref") for nd in element.iter("nd")]
+                    oneway = tags.get("oneway")
+                    if oneway is None and (tags.get("junction") == "roundabout" or tags.get("highway") == "motorway"):
+                        oneway = "yes"
+                    if oneway == "-1":
+                        refs.reverse()
+                    edges.append((refs, speed, oneway in ("yes", "true", "1", "-1")))
+                element.clear()
+            elif element.tag == "relation":
+                element.clear()
+
+        node_ids = {}
+        lat, lng, sources, targets, lengths, durations = [], [], [], [], [], []
+
+        def node(ref):
+            if ref not in node_ids:
+                node_ids[ref] = len(lat)
+                lat.append(positions[ref][0])
+                lng.append(positions[ref][1])
+            return node_ids[ref]
+
+        for refs, speed, oneway in edges:
+            refs = [ref for ref in refs if ref in positions]
+            for a, b in zip(refs, refs[1:]):
+                u, v = node(a), node(b)
+                length = haversine_m(lat[u], lng[u], lat[v], lng[v])
+                duration = length / (speed / 3.6)
+                sources.append(u), targets.append(v), lengths.append(length), durations.append(duration)
+                if not oneway:
+                    sources.append(v), targets.append(u), lengths.append(length), durations.append(duration)
+        return cls(lat, lng, sources, targets, lengths, durations)
+
+    def save(self, path):
+        sources = np.repeat(np.arange(len(self)), np.diff(np.frombuffer(self.offsets, dtype=np.int64)))
+        np.savez_compressed(
+            path,
+            lat=np.frombuffer(self.lat), lng=np.frombuffer(self.lng), sources=sources,
+            targets=np.frombuffer(self.targets, dtype=np.int64),
+            lengths=np.frombuffer(self.lengths), durations=np.frombuffer(self.durations),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a graph from an .osm extract, reusing a compiled `<path>.npz` next to it when
+        it is newer than the extract.
+        """
+        compiled = f"{path}.npz"
+        if os.path.exists(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(path):
+            with np.load(compiled) as data:
+                return cls(data["lat"], data["lng"], data["sources"], data["targets"], data["lengths"], data["durations"])
+        graph = cls.from_osm(path)
+        try:
+            graph.save(compiled)
+        except OSError as e:
+            logger.warning(f"Could not cache the compiled road graph at {compiled}: {e}")
+        return graph
+
+    # Queries
+
+    def snap(self, latitude, longitude, radius_km=None):
+        """Index of the road node nearest to a point, or None if none is within `radius_km`."""
+        radius_km = radius_km or getattr(settings, "ROUTING_SNAP_RADIUS_KM", 1.0)
+        hits = self.index.nearest(latitude, longitude, k=1, radius_km=radius_km)
+        return hits[0][0] if hits else None
+
+    def _heuristic(self, node, goal):
+        return haversine_m(self.lat[node], self.lng[node], self.lat[goal], self.lng[goal]) / self.max_speed
+
+    def shortest_path(self, start, goal):
+        """A* on travel time. Returns (node_indices, length_m, duration_s) or None if unreachable."""
+        if start == goal:
+            return [start], 0.0, 0.0
+        offsets, targets, durations = self.offsets, self.targets, self.durations
+        best = {start: 0.0}
+        parent = {start: (None, 0.0)}
+        settled = set()
+        queue = [(self._heuristic(start, goal), 0.0, start)]
+        while queue:
+            _, cost, node = heapq.heappop(queue)
+            if node == goal:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = cost + durations[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    parent[neighbour] = (node, self.lengths[edge])
+                    heapq.heappush(queue, (candidate + self._heuristic(neighbour, goal), candidate, neighbour))
+        else:
+            return None
+
+        path, length, node = [], 0.0, goal
+        while node is not None:
+            path.append(node)
+            node, edge_length = parent[node]
+            length += edge_length
+        path.reverse()
+        return path, length, best[goal]
+
+    def travel_times_to(self, goal, sources, max_seconds=None):
+        """
+        Travel time in seconds from each node in `sources` to `goal`, from one Dijkstra on
+        the reversed graph that stops once every source is settled. Unreachable sources are
+        left out.
+        """
+        offsets, reverse_sources, durations = self.reverse_offsets, self.reverse_sources, self.reverse_durations
+        remaining = set(sources)
+        times = {}
+        best = {goal: 0.0}
+        queue = [(0.0, goal)]
+        while queue and remaining:
+            cost, node = heapq.heappop(queue)
+            if cost > best.get(node, math.inf):
+                continue
+            if max_seconds is not None and cost > max_seconds:
+                break
+            if node in remaining:
+                remaining.discard(node)
+                times[node] = cost
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = reverse_sources[edge]
+                candidate = cost + durations[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    heapq.heappush(queue, (candidate, neighbour))
+        return times
+
+
+class LRUCache:
+    """Small thread-safe least-recently-used cache."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_graph = None
+_route_cache = None
+_load_lock = threading.Lock()
+
+
+def get_graph():
+    """The road graph from ROUTING_OSM_FILE, loaded once per process; None when routing is not configured."""
+    global _graph, _route_cache
+    path = getattr(settings, "ROUTING_OSM_FILE", None)
+    if not path:
+        return None
+    with _load_lock:
+        if _graph is None:
+            _graph = RoadGraph.load(path)
+            _route_cache = LRUCache(getattr(settings, "ROUTING_CACHE_SIZE", 10000))
+            logger.info(f"Road graph loaded: {len(_graph)} nodes, {_graph.edge_count} edges")
+        return _graph
+
+
+@receiver(setting_changed)
+def _reset_graph(setting, **kwargs):
+    global _graph, _route_cache
+    if setting in ("ROUTING_OSM_FILE", "ROUTING_CACHE_SIZE"):
+        _graph = _route_cache = None
+
+
+def route(start_lat, start_lng, end_lat, end_lng):
+    """
+    Road route between two points as {"coordinates": [[lat, lng], ...], "distance_m",
+    "duration_s"}, or None when a point is off the network or no route exists. Results are
+    cached by snapped start and end node, so nearby requests share one search.
+    """
+    graph = get_graph()
+    if graph is None:
+        return None
+    start, end = graph.snap(start_lat, start_lng), graph.snap(end_lat, end_lng)
+    if start is None or end is None:
+        return None
+
+    found = _route_cache.get((start, end))
+    if found is None:
+        found = graph.shortest_path(start, end) or ()
+        _route_cache.set((start, end), found)
+    if not found:
+        return None
+    path, length, duration = found
+    return {
+        "coordinates": [[start_lat, start_lng]] + [[graph.lat[n], graph.lng[n]] for n in path] + [[end_lat, end_lng]],
+        "distance_m": round(length, 1),
+        "duration_s": round(duration, 1),
+    }
+
+
+def travel_times(points, destination):
+    """
+    Travel time in seconds from each `(key, lat, lng)` in `points` to `destination` (lat, lng),
+    as {key: seconds}. Points off the network or unable to reach it are left out; returns
+    None when routing is not configured.
+    """
+    graph = get_graph()
+    if graph is None:
+        return None
+    goal = graph.snap(*destination)
+    if goal is None:
+        return {}
+    nodes = {}
+    for key, lat, lng in points:
+        node = graph.snap(lat, lng)
+        if node is not None:
+            nodes.setdefault(node, []).append(key)
+    times = graph.travel_times_to(goal, nodes)
+    return {key: seconds for node, seconds in times.items() for key in nodes[node]}
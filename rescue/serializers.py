@@ -4,6 +4,7 @@ from django.contrib.gis.measure import D
 from django.contrib.gis.db.models.functions import Distance
 from accounts.models import UserProfile
 from .models import UserLocationHistory
+from .track_filter import movement_filter
 from django.utils import timezone
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -52,15 +53,16 @@ class UserLocationSerializer(serializers.ModelSerializer):
         # Update user's current location
         instance.location = location_point
         instance.last_location_update = timezone.now()
-        instance.save()
-
-        # Save to UserLocationHistory
-        UserLocationHistory.objects.create(
-            user=instance.user,
-            location=location_point,
-            timestamp=timezone.now(),
-            user_type=instance.user_type
-        )
+        instance.save(update_fields=['location', 'last_location_update'])
+
+        # Save to UserLocationHistory, unless the user has barely moved since the last point
+        if movement_filter.accept(instance.user_id, instance.user_type, latitude, longitude, instance.last_location_update):
+            UserLocationHistory.objects.create(
+                user=instance.user,
+                location=location_point,
+                timestamp=instance.last_location_update,
+                user_type=instance.user_type
+            )
 
         return instance
 
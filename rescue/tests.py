@@ -1,3 +1,628 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase, override_settings
 
-# Create your tests here.
+import itertools
+
+import numpy as np
+
+from .geo_index import GridIndex, haversine_km
+from .optimizer import linear_sum_assignment, solve_assignment
+
+
+class GridIndexTest(SimpleTestCase):
+    def test_nearest_matches_brute_force(self):
+        points = [(i, 18.5 + (i % 17) * 0.013, 73.8 + (i % 23) * 0.011) for i in range(400)]
+        index = GridIndex()
+        index.load(points)
+
+        expected = sorted(
+            (haversine_km(18.6, 73.9, lat, lng), key) for key, lat, lng in points
+            if haversine_km(18.6, 73.9, lat, lng) <= 5
+        )[:3]
+        result = index.nearest(18.6, 73.9, k=3, radius_km=5)
+
+        self.assertEqual([key for key, _ in result], [key for _, key in expected])
+
+    def test_candidates_and_removal(self):
+        index = GridIndex()
+        index.update(1, 18.52, 73.85)
+        index.update(2, 18.53, 73.86)
+        index.remove(1)
+
+        self.assertEqual([key for key, _ in index.nearest(18.52, 73.85, k=1, radius_km=10)], [2])
+        self.assertEqual(index.nearest(18.52, 73.85, k=1, radius_km=10, candidates={1}), [])
+
+
+class AssignmentOptimizerTest(SimpleTestCase):
+    def test_matches_brute_force_minimum(self):
+        rng = np.random.default_rng(7)
+        for n_rows, n_cols in [(3, 3), (2, 4), (4, 2)]:
+            cost = rng.random((n_rows, n_cols))
+            rows, cols = linear_sum_assignment(cost)
+            small = cost if n_rows <= n_cols else cost.T
+            best = min(
+                sum(small[r, c] for r, c in enumerate(perm))
+                for perm in itertools.permutations(range(small.shape[1]), small.shape[0])
+            )
+            self.assertEqual(len(rows), min(n_rows, n_cols))
+            self.assertAlmostEqual(cost[rows, cols].sum(), best)
+
+    def test_urgent_report_wins_scarce_volunteer(self):
+        reports = [(18.520, 73.850), (18.530, 73.860)]
+        volunteers = [(18.525, 73.855)]
+        # The second report is slightly farther but HIGH priority
+        matches = solve_assignment(reports, [0.0, 10.0], volunteers, max_distance_km=25)
+        self.assertEqual([(r, v) for r, v, _ in matches], [(1, 0)])
+
+    def test_out_of_range_pairs_are_not_assigned(self):
+        matches = solve_assignment([(18.52, 73.85)], [0.0], [(19.07, 72.87)], max_distance_km=25)
+        self.assertEqual(matches, [])
+
+    def test_per_report_radius(self):
+        # Volunteer is ~3.5 km from both reports; only the one escalated to 5 km may take it
+        reports = [(18.520, 73.850), (18.520, 73.850)]
+        volunteers = [(18.550, 73.860)]
+        matches = solve_assignment(reports, [10.0, 0.0], volunteers, max_distance_km=[2, 5])
+        self.assertEqual([(r, v) for r, v, _ in matches], [(1, 0)])
+
+
+class RoadGraphTest(SimpleTestCase):
+    # Two streets on either side of a river, joined by one bridge at the east end;
+    # the west connector only runs south to north
+    OSM = """<osm>
+        <node id="1" lat="18.500" lon="73.800"/><node id="2" lat="18.500" lon="73.810"/>
+        <node id="3" lat="18.500" lon="73.820"/><node id="4" lat="18.510" lon="73.800"/>
+        <node id="5" lat="18.510" lon="73.810"/><node id="6" lat="18.510" lon="73.820"/>
+        <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>
+        <way id="11"><nd ref="4"/><nd ref="5"/><nd ref="6"/><tag k="highway" v="residential"/></way>
+        <way id="12"><nd ref="3"/><nd ref="6"/><tag k="highway" v="primary"/></way>
+        <way id="13"><nd ref="1"/><nd ref="4"/><tag k="highway" v="service"/><tag k="oneway" v="yes"/></way>
+        <way id="14"><nd ref="2"/><nd ref="5"/><tag k="waterway" v="river"/></way>
+    </osm>"""
+
+    def setUp(self):
+        import io
+        from .routing import RoadGraph
+
+        self.graph = RoadGraph.from_osm(io.StringIO(self.OSM))
+
+    def test_route_follows_roads_and_one_way_streets(self):
+        south_west, north_west = self.graph.snap(18.500, 73.800), self.graph.snap(18.510, 73.800)
+        path, length_m, _ = self.graph.shortest_path(north_west, south_west)
+        # Against the one-way connector, so the route crosses the east bridge (~4.3 km)
+        self.assertEqual(len(path), 6)
+        self.assertGreater(length_m, 4000)
+        self.assertEqual(len(self.graph.shortest_path(south_west, north_west)[0]), 2)
+
+    def test_travel_times_match_point_to_point_search(self):
+        goal = self.graph.snap(18.510, 73.810)
+        sources = [self.graph.snap(18.500, 73.800), self.graph.snap(18.500, 73.820)]
+        times = self.graph.travel_times_to(goal, sources)
+        for source in sources:
+            self.assertAlmostEqual(times[source], self.graph.shortest_path(source, goal)[2])
+
+
+@override_settings(LOCATION_BUFFER_INTERVAL=60, LOCATION_BUFFER_MAX_UPDATES=3)
+class LocationWriteBufferTest(SimpleTestCase):
+    def test_coalesces_latest_position_and_flushes_after_max_updates(self):
+        import asyncio
+        from unittest import mock
+
+        from .location_buffer import LocationWriteBuffer
+
+        buffer = LocationWriteBuffer()
+        written = []
+
+        async def pings():
+            with mock.patch.object(buffer, "write", side_effect=lambda batch: written.append(dict(batch))):
+                buffer.add(1, "VOLUNTEER", 18.50, 73.80)
+                buffer.add(1, "VOLUNTEER", 18.51, 73.81)
+                self.assertEqual(len(buffer), 1)
+                buffer.add(2, "VOLUNTEER", 18.52, 73.82)
+                await asyncio.sleep(0.05)
+                buffer._task.cancel()
+
+        asyncio.run(pings())
+        self.assertEqual(len(written), 1)
+        self.assertEqual({user_id: entry[:2] for user_id, entry in written[0].items()}, {1: (18.51, 73.81), 2: (18.52, 73.82)})
+        self.assertEqual(len(buffer), 0)
+
+    def test_flush_of_one_user_leaves_others_pending(self):
+        import asyncio
+        from unittest import mock
+
+        from .location_buffer import LocationWriteBuffer
+
+        buffer = LocationWriteBuffer()
+        written = []
+
+        async def disconnect():
+            with mock.patch.object(buffer, "write", side_effect=lambda batch: written.append(dict(batch))):
+                buffer.add(1, "VOLUNTEER", 18.50, 73.80)
+                buffer.add(2, "VOLUNTEER", 18.52, 73.82)
+                await buffer.flush(user_ids=["1"])  # Consumers pass the id as a string
+                buffer._task.cancel()
+
+        asyncio.run(disconnect())
+        self.assertEqual([list(batch) for batch in written], [[1]])
+        self.assertEqual(list(buffer._pending), [2])
+
+
+class TrackFilterTest(SimpleTestCase):
+    def test_drops_stationary_pings_but_keeps_turns(self):
+        from datetime import datetime, timedelta, timezone as dt_timezone
+
+        from .track_filter import MovementFilter
+
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        movement = MovementFilter()
+        accept = lambda seconds, lat, lng: movement.accept(1, "VOLUNTEER", lat, lng, start + timedelta(seconds=seconds))
+
+        self.assertTrue(accept(0, 18.5000, 73.8000))
+        self.assertFalse(accept(10, 18.50002, 73.80002))  # ~3 m of GPS jitter
+        self.assertTrue(accept(20, 18.5010, 73.8000))  # 110 m north
+        self.assertFalse(accept(22, 18.5012, 73.8000))  # Too soon, same heading
+        self.assertTrue(accept(24, 18.5010, 73.8002))  # Too soon, but turned east
+        self.assertEqual(movement.stats()["VOLUNTEER"], {"seen": 5, "kept": 3, "reduction": 0.4})
+
+    def test_offline_track_arriving_after_a_live_ping_is_kept(self):
+        from datetime import datetime, timedelta, timezone as dt_timezone
+
+        from .track_filter import MovementFilter
+
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        movement = MovementFilter()
+        accept = lambda seconds, lat: movement.accept(1, "VOLUNTEER", lat, 73.8, start + timedelta(seconds=seconds))
+
+        self.assertTrue(accept(600, 18.6000))  # Live ping once back online
+        # The queued track is older, ~40 m and 10 s apart, with one stationary repeat
+        kept = [accept(i * 10, 18.5 + i * 0.0004) for i in range(5)] + [accept(50, 18.5016)]
+        self.assertEqual(kept, [True, True, True, True, True, False])
+        self.assertFalse(accept(601, 18.6000))  # Live filtering carries on from the live point
+
+    def test_simplify_keeps_corners_of_a_track(self):
+        from .track_filter import simplify
+
+        leg = [(18.5 + i * 1e-4, 73.8) for i in range(11)]
+        track = leg + [(18.501, 73.8 + i * 1e-4) for i in range(1, 11)]
+        self.assertEqual(simplify(track, tolerance_m=5), [0, 10, 20])
+        self.assertEqual(simplify(track[:2], tolerance_m=5), [0, 1])
+
+
+class LiveLocationsTest(SimpleTestCase):
+    def test_geohash(self):
+        from .geo_index import geohash, geohash_cells
+
+        self.assertEqual(geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+        cell = geohash(18.52, 73.86)
+        self.assertIn(cell, geohash_cells(18.51, 73.85, 18.53, 73.87))
+        self.assertIsNone(geohash_cells(10, 70, 30, 90, limit=100))
+
+    def test_geohash_cells_across_the_antimeridian(self):
+        from .geo_index import geohash, geohash_cells
+
+        cells = geohash_cells(-17.0, 179.8, -16.8, -179.8)
+        self.assertIn(geohash(-16.9, 179.9), cells)  # Fiji, west of the line
+        self.assertIn(geohash(-16.9, -179.9), cells)  # and east of it
+        self.assertEqual(cells, geohash_cells(-17.0, 179.8, -16.8, 180) | geohash_cells(-17.0, -180, -16.8, -179.8))
+
+    def test_cell_deltas_replayed_on_snapshot_reproduce_state(self):
+        import json
+
+        from .live import InMemoryLiveLocationStore, cell_of, delta_frame, snapshot_frame
+
+        live = InMemoryLiveLocationStore(ttl=60)
+        home, away = cell_of(18.50, 73.80), cell_of(18.70, 73.95)
+        self.assertNotEqual(home, away)
+        live.update(1, "VOLUNTEER", 18.50, 73.80)
+        snapshot = json.loads(snapshot_frame(live.snapshot([home, away])))["cells"]
+        client = {
+            cell: {entry["id"]: (entry["latitude"], entry["longitude"]) for entry in state["volunteers"]}
+            for cell, state in snapshot.items()
+        }
+        seqs = {cell: state["seq"] for cell, state in snapshot.items()}
+
+        changes = live.update(2, "USER", 18.5001, 73.8001) + live.update(1, "VOLUNTEER", 18.70, 73.95) + live.remove(2)
+        self.assertEqual(live.remove(2), [])
+        for cell, updated, removed in changes:
+            frame = json.loads(delta_frame(cell, live.next_seq(cell), updated, removed))
+            self.assertEqual(frame["since"], seqs[cell])
+            seqs[cell] = frame["seq"]
+            client[cell].update({e["id"]: (e["latitude"], e["longitude"]) for e in frame["updated"]})
+            for user_id in frame["removed"]:
+                client[cell].pop(user_id)
+        self.assertEqual(client, {home: {}, away: {1: (18.70, 73.95)}})
+        self.assertEqual(client, {cell: entries for cell, (_, entries) in live.snapshot([home, away]).items()})
+
+    def test_entries_expire_and_index_by_user_type(self):
+        from unittest import mock
+
+        from .live import InMemoryLiveLocationStore, cell_of
+
+        live = InMemoryLiveLocationStore(ttl=60)
+        live.update(1, "VOLUNTEER", 18.50, 73.80)
+        live.update(2, "VOLUNTEER", 18.60, 73.90)
+        live.update(3, "USER", 18.50, 73.80)
+        self.assertEqual([user_id for user_id, _ in live.nearest(18.50, 73.80, "VOLUNTEER")], [1, 2])
+        self.assertEqual(live.positions([1, 3, 4], "VOLUNTEER"), {1: (18.50, 73.80)})
+
+        with mock.patch("rescue.live.time.time", return_value=live._entries[2][4] - 1):
+            live.update(1, "VOLUNTEER", 18.51, 73.81)
+        with mock.patch("rescue.live.time.time", return_value=live._entries[2][4] + 1):
+            self.assertEqual(live.positions(), {1: (18.51, 73.81)})
+            self.assertEqual(live.nearest(18.50, 73.80, "VOLUNTEER", radius_km=50), [(1, mock.ANY)])
+            self.assertEqual(sorted(live.purge_expired()), [(cell_of(18.50, 73.80), {}, [3]), (cell_of(18.60, 73.90), {}, [2])])
+        self.assertEqual(live.purge_expired(), [])
+
+
+    def test_binary_frames_and_point_batches(self):
+        import msgpack
+
+        from .live import InvalidMessage, decode_message, delta_frame, parse_points
+
+        frame = msgpack.unpackb(delta_frame("tek92", 3, {7: (18.5, 73.8)}, [9], binary=True))
+        self.assertEqual((frame["since"], frame["updated"], frame["removed"]), (2, [[7, 18.5, 73.8]], [9]))
+        self.assertEqual(decode_message(bytes_data=msgpack.packb([18.5, 73.8])), {"latitude": 18.5, "longitude": 73.8})
+
+        message = decode_message(bytes_data=msgpack.packb({"type": "points", "points": [[1700000060, 18.6, 73.9], [1700000000, 18.5, 73.8]]}))
+        points = parse_points(message["points"])
+        self.assertEqual([(p[0].timestamp(), p[1], p[2]) for p in points], [(1700000000, 18.5, 73.8), (1700000060, 18.6, 73.9)])
+
+        for bad in ([], [[1700000000, 95, 73.8]], [["now", 18.5, 73.8]]):
+            with self.assertRaises(InvalidMessage):
+                parse_points(bad)
+        with self.assertRaises(InvalidMessage):
+            decode_message(bytes_data=b"\xc1")
+
+
+class LiveBroadcastTest(SimpleTestCase):
+    @override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+    def test_burst_is_sent_as_one_frame_per_cell(self):
+        import asyncio
+
+        from channels.layers import get_channel_layer
+
+        from .broadcast import LiveBroadcaster
+        from .live import cell_of, get_live_store, group_name
+
+        cell = cell_of(18.52, 73.86)
+        broadcaster = LiveBroadcaster()
+
+        async def run():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add(group_name(cell), channel)
+            for i in range(50):
+                broadcaster.publish([(cell, {1: (18.52, 73.86 + i * 1e-5)}, [])])
+            broadcaster.publish([(cell, {2: (18.52, 73.86)}, [])])
+            await broadcaster.flush()
+            broadcaster._task.cancel()
+            return await layer.receive(channel)
+
+        message = asyncio.run(run())
+        self.assertEqual(message["seq"], get_live_store().snapshot([cell])[cell][0])
+        self.assertEqual(message["updated"], [[1, 18.52, 73.86 + 49e-5], [2, 18.52, 73.86]])
+        self.assertEqual(broadcaster.stats()["coalesced"], 49)
+        self.assertEqual(broadcaster.frames, 1)
+
+    @override_settings(LIVE_BROADCAST_INTERVAL=0)
+    def test_flushes_without_a_tick_task_are_serialised(self):
+        import asyncio
+        from unittest import mock
+
+        from .broadcast import LiveBroadcaster
+
+        broadcaster = LiveBroadcaster()
+        sends, active, peak = [], [0], [0]
+
+        async def send(batch):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            if not sends:
+                # A ping arriving mid-send starts another flush
+                broadcaster.publish([("tek92", {2: (18.52, 73.86)}, [])])
+            sends.append(batch)
+            await asyncio.sleep(0.05)
+            active[0] -= 1
+
+        async def run():
+            with mock.patch.object(broadcaster, "send", side_effect=send):
+                broadcaster.publish([("tek92", {1: (18.52, 73.86)}, [])])
+                await asyncio.sleep(0.3)
+
+        asyncio.run(run())
+        self.assertEqual(len(sends), 2)
+        self.assertEqual(peak[0], 1)
+
+    def test_pending_frames_keep_one_merged_frame_per_cell(self):
+        from .broadcast import PendingFrames
+
+        frames = PendingFrames()
+        self.assertEqual(frames.add("tek92", 4, 5, {1: (1.0, 1.0)}, []), "queued")
+        self.assertEqual(frames.add("tek92", 5, 6, {2: (2.0, 2.0)}, [1]), "coalesced")
+        self.assertEqual(frames.pop(), ("tek92", 4, 6, {2: (2.0, 2.0)}, {1}))
+        self.assertIsNone(frames.pop())
+        self.assertEqual(frames.add("tek92", 5, 6, {}, [2]), "dropped")
+        frames.sent("tek92", 9)
+        self.assertEqual(frames.add("tek92", 8, 9, {}, [2]), "dropped")
+        self.assertEqual(frames.add("tek92", 9, 10, {}, [2]), "queued")
+
+
+class IdempotentCreateTaskTest(TestCase):
+    def test_retry_with_same_key_replays_response(self):
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIClient
+
+        from .models import RescueTask
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="dispatcher", password="name1234"))
+        payload = {"title": "Rescue", "description": "Dog on highway", "latitude": 18.52, "longitude": 73.85}
+
+        first = client.post("/api/create_task/", payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        second = client.post("/api/create_task/", payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(RescueTask.objects.count(), 1)
+
+        reused = client.post("/api/create_task/", {**payload, "title": "Other"}, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(reused.status_code, 422)
+
+
+@override_settings(
+    PRESENCE_STORE="accounts.presence.InMemoryPresenceStore",
+    LIVE_LOCATION_STORE="rescue.live.InMemoryLiveLocationStore",
+)
+class NearestVolunteersTest(TestCase):
+    def test_live_and_profile_only_volunteers_are_ranked_together(self):
+        from django.contrib.auth.models import User
+        from django.contrib.gis.geos import Point
+
+        from accounts.models import UserProfile
+        from accounts.presence import get_presence_store
+        from .dispatch import nearest_volunteers
+        from .live import get_live_store
+
+        users = [User.objects.create_user(username=f"volunteer-{i}", password="name1234") for i in range(3)]
+        for user in users:
+            UserProfile.objects.filter(user=user).update(user_type="VOLUNTEER")
+            get_presence_store().mark_online(user.id, "VOLUNTEER")
+        # Shares its position only through its profile
+        UserProfile.objects.filter(user=users[0]).update(location=Point(73.851, 18.52, srid=4326))
+        # Live over the WebSocket, which never writes the profile location
+        get_live_store().update(users[1].id, "VOLUNTEER", 18.52, 73.86)
+        get_live_store().update(users[2].id, "VOLUNTEER", 18.52, 73.90)
+
+        nearest = nearest_volunteers(18.52, 73.85, radius_km=10)
+        self.assertEqual([profile.user_id for profile in nearest], [user.id for user in users])
+        self.assertEqual([profile.user_id for profile in nearest_volunteers(18.52, 73.85, limit=2)], [users[0].id, users[1].id])
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    LIVE_LOCATION_STORE="rescue.live.InMemoryLiveLocationStore",
+)
+class LocationBatchTest(TestCase):
+    def setUp(self):
+        from unittest import mock
+
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIClient
+
+        from accounts.models import UserProfile
+        from .track_filter import MovementFilter
+
+        patcher = mock.patch("rescue.api.views.movement_filter", MovementFilter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username="walker", password="name1234")
+        UserProfile.objects.filter(user=self.user).update(user_type="VOLUNTEER")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_is_stored_in_bulk_and_moves_the_profile_once(self):
+        import time
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from accounts.models import UserProfile
+        from .models import UserLocationHistory
+
+        start = int(time.time()) - 600
+        # Sent out of order; ~40 m and 10 s apart once sorted
+        points = [[start + i * 10, 18.52 + i * 0.0004, 73.85] for i in (2, 0, 4, 1, 3)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/locations/batch/", {"points": points}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["received"], response.data["stored"]), (5, 5))
+        history = UserLocationHistory.objects.filter(user=self.user).order_by("timestamp")
+        self.assertEqual([round(h.location.y, 4) for h in history], [round(18.52 + i * 0.0004, 4) for i in range(5)])
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "rescue_userlocationhistory"')]
+        updates = [q for q in queries.captured_queries if q["sql"].startswith('UPDATE "accounts_userprofile"')]
+        self.assertEqual((len(inserts), len(updates)), (1, 1))
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertAlmostEqual(profile.location.y, 18.5216)
+        self.assertEqual(profile.last_location_update.timestamp(), start + 40)
+
+        # A batch older than the saved position only adds history
+        older = [[start - 600 + i * 10, 18.50 + i * 0.0004, 73.85] for i in range(3)]
+        response = self.client.post("/api/locations/batch/", {"points": older}, format="json")
+        self.assertEqual(response.data["stored"], 3)
+        self.assertEqual(UserLocationHistory.objects.filter(user=self.user).count(), 8)
+        profile.refresh_from_db()
+        self.assertEqual(profile.last_location_update.timestamp(), start + 40)
+
+
+class AllUsersLocationsTest(TestCase):
+    def add_users(self, count, start):
+        from datetime import timedelta
+
+        from django.contrib.auth.models import User
+        from django.contrib.gis.geos import Point
+        from django.utils import timezone
+
+        from accounts.models import UserProfile
+        from .models import UserLocationHistory
+
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f"walker-{i}", password="name1234")
+            UserProfile.objects.filter(user=user).update(
+                user_type="VOLUNTEER", location=Point(73.85, 18.52, srid=4326), last_location_update=timezone.now()
+            )
+            UserLocationHistory.objects.bulk_create([
+                UserLocationHistory(
+                    user=user,
+                    location=Point(73.85 + j * 0.001, 18.52, srid=4326),
+                    timestamp=timezone.now() - timedelta(minutes=j),
+                    user_type="VOLUNTEER",
+                )
+                for j in range(5)
+            ])
+
+    @override_settings(LOCATIONS_FEED_HISTORY_LIMIT=3, LOCATIONS_FEED_PAGE_SIZE=100)
+    def test_query_count_does_not_grow_with_users(self):
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="viewer", password="name1234"))
+        self.add_users(2, 0)
+        with CaptureQueriesContext(connection) as few:
+            response = client.get("/api/all-user-locations/")
+        self.assertEqual(len(response.json()["users"]), 2)
+
+        self.add_users(20, 2)
+        with self.assertNumQueries(len(few.captured_queries)):
+            response = client.get("/api/all-user-locations/")
+        users = response.json()["users"]
+        self.assertEqual(len(users), 22)
+        self.assertTrue(all(len(user["location_history"]) == 3 for user in users))
+
+        first = client.get("/api/all-user-locations/", {"limit": 10}).json()
+        second = client.get("/api/all-user-locations/", {"limit": 10, "cursor": first["next_cursor"]}).json()
+        self.assertEqual(len(second["users"]), 10)
+        self.assertLess(first["users"][-1]["id"], second["users"][0]["id"])
+
+
+class ClusterIndexTest(SimpleTestCase):
+    def setUp(self):
+        from .clusters import ClusterIndex
+
+        rng = np.random.default_rng(3)
+        self.index = ClusterIndex(max_zoom=18, radius_px=64)
+        # 500 volunteers around Pune, 20 reports around Mumbai
+        for i, (dlat, dlng) in enumerate(rng.uniform(-0.05, 0.05, (500, 2))):
+            self.index.update("volunteer", i, 18.52 + dlat, 73.85 + dlng)
+        for i, (dlat, dlng) in enumerate(rng.uniform(-0.01, 0.01, (20, 2))):
+            self.index.update("report", i, 19.07 + dlat, 72.87 + dlng)
+
+    def test_low_zoom_aggregates_everything(self):
+        clusters = self.index.clusters(5, 60, 30, 90, zoom=4)
+        self.assertEqual(sorted((c["kind"], c["count"]) for c in clusters), [("report", 20), ("volunteer", 500)])
+        volunteers = next(c for c in clusters if c["kind"] == "volunteer")
+        self.assertLess(haversine_km(volunteers["latitude"], volunteers["longitude"], 18.52, 73.85), 5)
+
+    def test_high_zoom_splits_and_tracks_updates(self):
+        clusters = self.index.clusters(18.4, 73.7, 18.6, 74.0, zoom=16, kinds={"volunteer"})
+        self.assertEqual(sum(c["count"] for c in clusters), 500)
+        self.assertGreater(len(clusters), 100)
+
+        self.index.remove("volunteer", 1)
+        self.index.update("volunteer", 0, 40.0, -3.7)
+        self.assertEqual(sum(c["count"] for c in self.index.clusters(18.4, 73.7, 18.6, 74.0, zoom=16)), 498)
+        (moved,) = self.index.clusters(39, -5, 41, -2, zoom=10)
+        self.assertEqual((moved["id"], moved["count"]), (0, 1))
+        self.assertAlmostEqual(moved["latitude"], 40.0)
+
+    def test_track_position_accepts_consumer_string_ids(self):
+        from unittest import mock
+
+        from .clusters import track_position
+
+        with mock.patch("rescue.clusters.cluster_index", self.index):
+            # LocationConsumer passes str(user.id)
+            track_position("7", "VOLUNTEER", 48.85, 2.35)
+            track_position("7", "VOLUNTEER", 48.86, 2.36)
+            track_position("8", "USER", 48.86, 2.36)
+        (moved,) = self.index.clusters(48, 2, 49, 3, zoom=12)
+        self.assertEqual((moved["id"], moved["count"]), (7, 1))
+
+    def test_offline_volunteers_leave_the_clusters(self):
+        from unittest import mock
+
+        from .broadcast import LiveBroadcaster
+        from .clusters import track_position, untrack_position
+
+        with mock.patch("rescue.clusters.cluster_index", self.index):
+            track_position("7", "VOLUNTEER", 48.85, 2.35)
+            track_position("8", "VOLUNTEER", 48.86, 2.36)
+            untrack_position("7")  # LocationConsumer.disconnect
+            self.assertEqual([c["id"] for c in self.index.clusters(48, 2, 49, 3, zoom=12)], [8])
+            # Live positions past their TTL, purged on a broadcaster tick
+            LiveBroadcaster().publish_expired([("u09tv", {}, [8])])
+        self.assertEqual(self.index.clusters(48, 2, 49, 3, zoom=12), [])
+
+    def test_viewport_across_antimeridian(self):
+        self.index.update("volunteer", 900, -17.7, 178.4)
+        self.index.update("volunteer", 901, -14.3, -170.7)
+        clusters = self.index.clusters(-20, 170, -10, -165, zoom=3)
+        self.assertEqual(sum(c["count"] for c in clusters), 2)
+
+
+class TrackingConsumerTest(SimpleTestCase):
+    @override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}, ROUTING_OSM_FILE=None)
+    def test_pushes_only_when_the_assigned_volunteer_moves(self):
+        import asyncio
+        import json
+        from types import SimpleNamespace
+        from unittest import mock
+
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from django.urls import re_path
+
+        from .broadcast import LiveBroadcaster
+        from .consumers import TrackingConsumer
+        from .live import get_live_store
+
+        async def assignment(consumer, report_id):
+            return {"id": 41, "username": "rescuer", "mobile_number": None}, (18.53, 73.86), None
+
+        store = get_live_store()
+        broadcaster = LiveBroadcaster()
+        app = URLRouter([re_path(r"ws/tracking/(?P<report_id>\d+)/$", TrackingConsumer.as_asgi())])
+
+        async def run():
+            store.update(41, "VOLUNTEER", 18.52, 73.86)
+            communicator = WebsocketCommunicator(app, "/ws/tracking/7/")
+            communicator.scope["user"] = SimpleNamespace(is_authenticated=True, id=3)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            frames = [json.loads(await communicator.receive_from()) for _ in range(2)]
+
+            # Someone else moving in the same cell is not pushed
+            await broadcaster.send_now(store.update(42, "VOLUNTEER", 18.521, 73.861))
+            self.assertTrue(await communicator.receive_nothing())
+
+            # The volunteer crosses into another cell and is followed there
+            await broadcaster.send_now(store.update(41, "VOLUNTEER", 18.60, 73.95))
+            frames.append(json.loads(await communicator.receive_from()))
+            await broadcaster.send_now(store.update(41, "VOLUNTEER", 18.601, 73.951))
+            frames.append(json.loads(await communicator.receive_from()))
+            await communicator.disconnect()
+            return frames
+
+        try:
+            with mock.patch.object(TrackingConsumer, "get_assignment", assignment):
+                tracking, *positions = asyncio.run(run())
+        finally:
+            store.remove(41)
+            store.remove(42)
+        self.assertEqual(tracking["volunteer"]["username"], "rescuer")
+        self.assertEqual([(p["latitude"], p["longitude"]) for p in positions], [(18.52, 73.86), (18.60, 73.95), (18.601, 73.951)])
+        self.assertAlmostEqual(positions[0]["distance_km"], 1.11, places=2)
+        # Straight line at TRACKING_ETA_SPEED_KMH without a road graph
+        self.assertAlmostEqual(positions[0]["eta_s"], positions[0]["distance_km"] / 25 * 3600, delta=5)
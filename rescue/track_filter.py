@@ -0,0 +1,156 @@
+import logging
+import math
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from .geo_index import EARTH_RADIUS_KM, haversine_km
+from .routing import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS = {
+    # Volunteers are followed closely while on a rescue; reporters only need a coarse trail
+    "VOLUNTEER": {"min_distance_m": 10, "min_interval_s": 5, "heading_change_deg": 30, "simplify_tolerance_m": 5},
+    "USER": {"min_distance_m": 50, "min_interval_s": 30, "heading_change_deg": 45, "simplify_tolerance_m": 20},
+    "default": {"min_distance_m": 25, "min_interval_s": 15, "heading_change_deg": 45, "simplify_tolerance_m": 10},
+}
+
+
+def get_thresholds(user_type):
+    """LOCATION_FILTER_THRESHOLDS entry for `user_type`, falling back to its "default" entry."""
+    thresholds = getattr(settings, "LOCATION_FILTER_THRESHOLDS", DEFAULT_THRESHOLDS)
+    return {**DEFAULT_THRESHOLDS["default"], **thresholds.get("default", {}), **thresholds.get(user_type, {})}
+
+
+def bearing(lat1, lng1, lat2, lng2):
+    """Initial compass bearing in degrees from the first point to the second."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    x = math.sin(lng2 - lng1) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lng2 - lng1)
+    return math.degrees(math.atan2(x, y)) % 360
+
+
+def heading_change(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+class MovementFilter:
+    """
+    Decides which location pings are worth storing as history. A point is dropped when it
+    is within `min_distance_m` of, or `min_interval_s` after, the last stored point of the
+    same user, unless the direction of travel turned by `heading_change_deg` or more. Turns
+    only count once the user moved at least half of `min_distance_m`, so GPS jitter while
+    standing still does not look like a change of heading. Points older than the last stored
+    one, such as an offline track uploaded after a live ping, are compared with the previous
+    point of that backfill instead. The reduction ratio per user_type
+    is logged every `log_every` points and available from stats().
+    """
+
+    log_every = 10000
+
+    def __init__(self, maxsize=100000):
+        self._last = LRUCache(maxsize)
+        self._backfill = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._kept = {}
+
+    def accept(self, user_id, user_type, latitude, longitude, timestamp=None):
+        timestamp = timestamp or timezone.now()
+        limits = get_thresholds(user_type)
+        key = int(user_id)
+        with self._lock:
+            self._seen[user_type] = self._seen.get(user_type, 0) + 1
+            if sum(self._seen.values()) % self.log_every == 0:
+                logger.info(f"Movement filter: {self._stats()}")
+            chain = self._last
+            last = chain.get(key)
+            if last is not None and timestamp < last[2]:
+                # Older than the last stored point, e.g. a track queued while offline that
+                # arrives after a live ping: filter it against its own predecessors instead
+                chain = self._backfill
+                last = chain.get(key)
+                if last is not None and timestamp < last[2]:
+                    last = None
+            state = self._next_state(limits, last, latitude, longitude, timestamp)
+            if state is None:
+                return False
+            chain.set(key, state)
+            self._kept[user_type] = self._kept.get(user_type, 0) + 1
+            return True
+
+    @staticmethod
+    def _next_state(limits, last, latitude, longitude, timestamp):
+        """The new last-stored state if the point is kept, None if it is dropped."""
+        heading = None
+        if last is not None:
+            last_lat, last_lng, last_time, last_heading = last
+            distance_m = haversine_km(last_lat, last_lng, latitude, longitude) * 1000
+            elapsed_s = (timestamp - last_time).total_seconds()
+            if distance_m >= limits["min_distance_m"] / 2:
+                heading = bearing(last_lat, last_lng, latitude, longitude)
+            turned = (
+                heading is not None and last_heading is not None
+                and heading_change(heading, last_heading) >= limits["heading_change_deg"]
+            )
+            if (distance_m < limits["min_distance_m"] or elapsed_s < limits["min_interval_s"]) and not turned:
+                return None
+            heading = heading if heading is not None else last_heading
+        return (latitude, longitude, timestamp, heading)
+
+    def stats(self):
+        """{user_type: {"seen", "kept", "reduction"}} where reduction is the share of points dropped."""
+        with self._lock:
+            return self._stats()
+
+    def _stats(self):
+        return {
+            user_type: {
+                "seen": seen,
+                "kept": self._kept.get(user_type, 0),
+                "reduction": round(1 - self._kept.get(user_type, 0) / seen, 3),
+            }
+            for user_type, seen in self._seen.items()
+        }
+
+
+def simplify(points, tolerance_m):
+    """
+    Douglas-Peucker simplification of a track of `(lat, lng, ...)` points. Returns the
+    indices of the points to keep, always including the first and last. Distances are
+    measured on a local equirectangular projection, which is accurate at track scale.
+    """
+    if len(points) < 3:
+        return list(range(len(points)))
+    lat0 = math.radians(points[0][0])
+    scale = EARTH_RADIUS_KM * 1000 * math.pi / 180
+    xy = [(p[1] * scale * math.cos(lat0), p[0] * scale) for p in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        farthest, max_distance = None, tolerance_m
+        for i in range(first + 1, last):
+            x, y = xy[i]
+            if length:
+                distance = abs(dy * (x - x1) - dx * (y - y1)) / length
+            else:
+                distance = math.hypot(x - x1, y - y1)
+            if distance > max_distance:
+                farthest, max_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+# Process-wide filter for history writes from the consumer and the REST endpoint
+movement_filter = MovementFilter()
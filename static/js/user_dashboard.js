@@ -466,9 +466,7 @@ async function submitReport() {
             trackingLine.remove();
             trackingLine = null;
         }
-        if (window.volunteerTrackingInterval) {
-            clearInterval(window.volunteerTrackingInterval);
-        }
+        stopVolunteerTracking();
 
         // Add report marker to the map
         if (reportMarker) {
@@ -541,7 +539,7 @@ async function submitReport() {
             
             // Start tracking the volunteer's movement
             startVolunteerTracking(
-                result.assigned_volunteer.id,
+                result.report_id,
                 parseFloat(latitude),
                 parseFloat(longitude)
             );
@@ -564,14 +562,11 @@ async function convertBase64ToFile(base64String, filename) {
     return new File([blob], filename, { type: 'image/jpeg' });
 }
 
-// Add this new function to get route coordinates
+// Road route from the server-side routing service (cached per snapped start/end)
 async function getRouteCoordinates(startLat, startLng, endLat, endLng) {
     try {
-        // OSRM expects coordinates in longitude,latitude format
         const response = await fetch(
-            `https://router.project-osrm.org/route/v1/driving/` +
-            `${startLng},${startLat};${endLng},${endLat}` +
-            `?overview=full&geometries=geojson`
+            `/api/route/?from=${startLat},${startLng}&to=${endLat},${endLng}`
         );
 
         if (!response.ok) {
@@ -580,13 +575,13 @@ async function getRouteCoordinates(startLat, startLng, endLat, endLng) {
 
         const data = await response.json();
 
-        if (data.code !== 'Ok' || !data.routes[0]) {
+        if (data.status !== 'success' || !data.coordinates) {
             throw new Error('No route found');
         }
 
-        return data.routes[0].geometry.coordinates.map(coord => [coord[1], coord[0]]);
+        return data.coordinates;
     } catch (error) {
-        console.error('OSRM routing error:', error);
+        console.error('Routing error:', error);
         throw error;
     }
 }
@@ -668,76 +663,117 @@ async function showAssignedVolunteer(volunteer, reportLat, reportLng) {
     }
 }
 
-// Function to update volunteer position
-function startVolunteerTracking(volunteerId, reportLat, reportLng) {
-    console.log('Starting volunteer tracking:', volunteerId);
-    // Clear any existing tracking interval
-    if (window.volunteerTrackingInterval) {
-        clearInterval(window.volunteerTrackingInterval);
+// Follow the volunteer assigned to a report over a WebSocket; the server pushes their
+// position and ETA only when they move, instead of the dashboard polling for it
+let trackingSocket = null;
+let trackedVolunteer = null;
+
+function stopVolunteerTracking() {
+    if (trackingSocket) {
+        trackingSocket.onclose = null; // Don't reconnect
+        trackingSocket.close();
+        trackingSocket = null;
     }
+}
 
-    // Set up tracking interval
-    window.volunteerTrackingInterval = setInterval(async () => {
-        try {
-            const response = await fetch(
-                `/api/volunteer/location/${volunteerId}/?reportLat=${reportLat}&reportLng=${reportLng}`
-            );
-            if (!response.ok) throw new Error('Failed to fetch volunteer location');
-            
-            const data = await response.json();
-            console.log('Received volunteer location update:', data);
-            
-            if (data.location && assignedVolunteerMarker) {
-                // Update volunteer marker position
-                const newLatLng = [
-                    data.location.coordinates[1],
-                    data.location.coordinates[0]
-                ];
-                assignedVolunteerMarker.setLatLng(newLatLng);
-
-                // Update route
-                try {
-                    const newRouteCoordinates = await getRouteCoordinates(
-                        newLatLng[0], newLatLng[1],
-                        reportLat, reportLng
-                    );
-
-                    if (trackingLine) {
-                        // Smooth transition to new route
-                        const currentCoords = trackingLine.getLatLngs();
-                        if (JSON.stringify(currentCoords) !== JSON.stringify(newRouteCoordinates)) {
-                            trackingLine.setLatLngs(newRouteCoordinates);
-                        }
-                    } else {
-                        trackingLine = L.polyline(newRouteCoordinates, {
-                            color: '#FF4444',
-                            weight: 4,
-                            opacity: 0.8,
-                            lineCap: 'round',
-                            lineJoin: 'round'
-                        }).addTo(map);
-                    }
+function startVolunteerTracking(reportId, reportLat, reportLng) {
+    console.log('Starting volunteer tracking for report:', reportId);
+    stopVolunteerTracking();
+
+    const wsProtocol = window.location.protocol === "https:" ? "wss://" : "ws://";
+    let reconnectAttempts = 0;
+
+    function connect() {
+        const socket = new WebSocket(`${wsProtocol}${window.location.host}/ws/tracking/${reportId}/`);
+        trackingSocket = socket;
+
+        socket.onopen = () => {
+            reconnectAttempts = 0;
+        };
 
-                    // Update popup content with new distance
-                    const popupContent = `
-                        <div class="assigned-volunteer-popup">
-                            <strong>Assigned Volunteer:</strong><br>
-                            ${data.user.username}<br>
-                            <strong>Mobile:</strong> ${data.mobile_number}<br>
-                            <strong>Distance:</strong> ${data.distance.text}
-                            <small>Volunteer is on the way!</small>
-                        </div>
-                    `;
-                    assignedVolunteerMarker.setPopupContent(popupContent);
-
-                } catch (error) {
-                    console.error('Error updating route:', error);
+        socket.onmessage = async (event) => {
+            try {
+                const data = JSON.parse(event.data);
+                console.log('Received volunteer tracking update:', data);
+
+                if (data.type === 'tracking') {
+                    trackedVolunteer = data.volunteer;
+                } else if (data.type === 'position' && assignedVolunteerMarker) {
+                    await updateTrackedVolunteer(data, reportLat, reportLng);
+                } else if (data.type === 'offline' && assignedVolunteerMarker) {
+                    assignedVolunteerMarker.setPopupContent(trackedVolunteerPopup('Waiting for the volunteer to reconnect'));
                 }
+            } catch (error) {
+                console.error('Error updating volunteer location:', error);
             }
-        } catch (error) {
-            console.error('Error updating volunteer location:', error);
+        };
+
+        socket.onerror = (error) => {
+            console.error('Volunteer tracking WebSocket error:', error);
+        };
+
+        socket.onclose = () => {
+            const delay = Math.min(5000, (2 ** reconnectAttempts) * 1000);
+            console.log(`Volunteer tracking closed. Reconnecting in ${delay / 1000} seconds...`);
+            setTimeout(() => {
+                if (trackingSocket === socket) connect();
+            }, delay);
+            reconnectAttempts++;
+        };
+    }
+
+    connect();
+}
+
+function trackedVolunteerPopup(status) {
+    return `
+        <div class="assigned-volunteer-popup">
+            <strong>Assigned Volunteer:</strong><br>
+            ${trackedVolunteer ? trackedVolunteer.username : ''}<br>
+            <strong>Mobile:</strong> ${trackedVolunteer ? trackedVolunteer.mobile_number : ''}<br>
+            ${status}
+        </div>
+    `;
+}
+
+async function updateTrackedVolunteer(data, reportLat, reportLng) {
+    // Update volunteer marker position
+    const newLatLng = [data.latitude, data.longitude];
+    assignedVolunteerMarker.setLatLng(newLatLng);
+
+    // Update route
+    try {
+        const newRouteCoordinates = await getRouteCoordinates(
+            newLatLng[0], newLatLng[1],
+            reportLat, reportLng
+        );
+
+        if (trackingLine) {
+            // Smooth transition to new route
+            const currentCoords = trackingLine.getLatLngs();
+            if (JSON.stringify(currentCoords) !== JSON.stringify(newRouteCoordinates)) {
+                trackingLine.setLatLngs(newRouteCoordinates);
+            }
+        } else {
+            trackingLine = L.polyline(newRouteCoordinates, {
+                color: '#FF4444',
+                weight: 4,
+                opacity: 0.8,
+                lineCap: 'round',
+                lineJoin: 'round'
+            }).addTo(map);
         }
-    }, 5000); // Update every 5 seconds
+    } catch (error) {
+        console.error('Error updating route:', error);
+    }
+
+    // Update popup content with new distance and ETA
+    const etaMinutes = Math.max(1, Math.round(data.eta_s / 60));
+    assignedVolunteerMarker.setPopupContent(trackedVolunteerPopup(`
+        <strong>Distance:</strong> ${data.distance_km.toFixed(2)} km away<br>
+        <strong>ETA:</strong> about ${etaMinutes} min
+        <small>Volunteer is on the way!</small>
+    `));
 }
 
 // Add event listener to the report form submission
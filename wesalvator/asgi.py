@@ -3,12 +3,13 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django.urls import re_path
-from rescue.consumers import LocationConsumer  # Ensure correct import
+from rescue.consumers import LocationConsumer, TrackingConsumer  # Ensure correct import
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "wesalvator.settings")
 
 websocket_urlpatterns = [
     re_path(r"ws/location/$", LocationConsumer.as_asgi()),
+    re_path(r"ws/tracking/(?P<report_id>\d+)/$", TrackingConsumer.as_asgi()),
 ]
 
 application = ProtocolTypeRouter({
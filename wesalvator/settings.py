@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'session_timeout',
     'base',
     'chatbot',
+    'jobqueue',
     'rest_framework',
     'rest_framework.authtoken',
     'django_otp',
@@ -108,6 +109,21 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared cache (presence registry, snapshots); falls back to per-process memory without Redis
+if os.getenv("REDIS_CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_CACHE_URL"),
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+
 # Database
 DATABASES = {
     'default': {  # PostgreSQL with PostGIS (for GIS data)
@@ -161,6 +177,16 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored once per unique content under media/cas/ (see base/storage.py)
+STORAGES = {
+    "default": {
+        "BACKEND": "base.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 # Firebase configuration
 '''FIREBASE_CONFIG = {
     "apiKey": os.getenv("FIREBASE_API_KEY"),
@@ -224,3 +250,108 @@ CSRF_TRUSTED_ORIGINS = [
 
 SESSION_COOKIE_AGE = 300  # 5 minutes in seconds
 SESSION_SAVE_EVERY_REQUEST = True  # Reset the session expiry time on every request
+
+# Online users are tracked in the presence registry instead of decoding session rows
+PRESENCE_STORE = "accounts.presence.CachePresenceStore"
+PRESENCE_TTL = SESSION_COOKIE_AGE  # Seconds without a login/heartbeat before a user counts as offline
+
+# Live positions shared by every ASGI worker (rescue/live.py); Redis when available
+LIVE_LOCATION_REDIS_URL = os.getenv("REDIS_CACHE_URL")
+LIVE_LOCATION_STORE = (
+    "rescue.live.RedisLiveLocationStore" if LIVE_LOCATION_REDIS_URL else "rescue.live.InMemoryLiveLocationStore"
+)
+LIVE_LOCATION_TTL = PRESENCE_TTL  # Seconds without a ping before a position is dropped
+
+# Background job queue (run workers with `python manage.py run_jobs`)
+JOBQUEUE_MAX_ATTEMPTS = 5
+JOBQUEUE_RETRY_BASE_DELAY = 30  # Seconds before the first retry; doubles on each attempt
+JOBQUEUE_RETRY_MAX_DELAY = 3600
+JOBQUEUE_LEASE_SECONDS = 300  # RUNNING jobs older than this are assumed abandoned and retried
+
+# Escalating batch dispatch (`python manage.py dispatch_reports --loop`); unmatched reports
+# widen their search radius one step per sweep. Weights are km-equivalent urgency bonuses
+DISPATCH_ESCALATION_RADII_KM = (2, 5, 10, 25)
+DISPATCH_SWEEP_INTERVAL = 30  # Seconds between sweeps, and before a swept report is retried
+DISPATCH_SWEEP_BATCH = 200  # Most reports considered per sweep
+DISPATCH_MAX_OPEN_TASKS = 1  # Volunteers with this many incomplete tasks are not offered new reports
+DISPATCH_PRIORITY_WEIGHTS = {"HIGH": 10.0, "MEDIUM": 5.0, "LOW": 0.0}
+DISPATCH_AGE_WEIGHT_PER_HOUR = 1.0
+
+# Photo derivatives built after upload in a process pool (0 workers = build inline)
+PHOTO_PIPELINE_WORKERS = 2
+PHOTO_DERIVATIVE_SIZES = {"thumb": 160, "medium": 640, "full": 1600}  # Longest edge in pixels
+PHOTO_DERIVATIVE_FORMATS = ("webp", "jpeg")
+
+# Multi-photo report uploads (base/uploads.py): files stay in memory up to the threshold,
+# then spool to a temp file; requests over the limits are rejected with 413
+PHOTO_UPLOAD_MEMORY_THRESHOLD = 1 * 1024 * 1024
+PHOTO_UPLOAD_MAX_FILES = 10
+PHOTO_UPLOAD_MAX_FILE_SIZE = 10 * 1024 * 1024
+PHOTO_UPLOAD_MAX_TOTAL_SIZE = 60 * 1024 * 1024
+
+# Resumable photo uploads (base/chunked.py); chunks are kept on local disk until finalized
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'chunked_uploads')
+CHUNKED_UPLOAD_CHUNK_SIZE = 512 * 1024  # Size suggested to clients
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 2 * 1024 * 1024  # Larger chunk bodies are refused with 413 before being read
+CHUNKED_UPLOAD_EXPIRY = 24 * 3600  # Seconds an idle session is kept
+
+# Requests sent with an Idempotency-Key header (base/idempotency.py)
+IDEMPOTENCY_KEY_TTL = 24 * 3600  # Seconds a stored response can be replayed
+IDEMPOTENCY_WAIT_TIMEOUT = 30  # Seconds a duplicate waits for the first request before getting 409
+
+# Offline road routing (rescue/routing.py, /api/route/) from a local OSM XML extract, e.g. one
+# exported from Geofabrik with `osmium cat pune.osm.pbf -o pune.osm`; unset disables routing
+ROUTING_OSM_FILE = os.getenv('ROUTING_OSM_FILE')
+ROUTING_CACHE_SIZE = 10000  # Routes kept per process, keyed by snapped start and end node
+ROUTING_SNAP_RADIUS_KM = 1.0  # Points further than this from any road get no route
+DISPATCH_RANK_BY_TRAVEL_TIME = False  # Order nearest-volunteer candidates by road travel time
+DISPATCH_TRAVEL_TIME_CANDIDATES = 5  # Straight-line shortlist size per volunteer requested
+
+# WebSocket location pings are coalesced per user and written in batches (rescue/location_buffer.py)
+LOCATION_BUFFER_INTERVAL = 2.0  # Seconds between flushes
+LOCATION_BUFFER_MAX_UPDATES = 500  # Flush early once this many pings are buffered
+LOCATION_BUFFER_HISTORY = False  # Also append live pings that pass the movement filter to UserLocationHistory
+
+# History points closer than min_distance_m or sooner than min_interval_s after the last kept
+# one are dropped unless the heading turned by heading_change_deg (rescue/track_filter.py);
+# simplify_tolerance_m is the Douglas-Peucker tolerance of `compact_location_history`
+LOCATION_FILTER_THRESHOLDS = {
+    "VOLUNTEER": {"min_distance_m": 10, "min_interval_s": 5, "heading_change_deg": 30, "simplify_tolerance_m": 5},
+    "USER": {"min_distance_m": 50, "min_interval_s": 30, "heading_change_deg": 45, "simplify_tolerance_m": 20},
+    "default": {"min_distance_m": 25, "min_interval_s": 15, "heading_change_deg": 45, "simplify_tolerance_m": 10},
+}
+
+# Live positions are streamed per geohash cell to the clients whose viewport covers it (rescue/live.py)
+LIVE_CELL_PRECISION = 5  # Geohash length; 5 gives cells of about 4.9 x 4.9 km
+LIVE_MAX_SUBSCRIBED_CELLS = 100  # Larger viewports are refused; clients must zoom in
+LIVE_BROADCAST_INTERVAL = 1.0  # Seconds per broadcast tick; changes in between are merged into one frame per cell
+LIVE_MAX_BATCH_POINTS = 500  # Points accepted in one {"type": "points"} catch-up message
+TRACKING_ETA_SPEED_KMH = 25  # Assumed speed for ws/tracking/ ETAs when road routing is not configured
+TRACKING_OFFLINE_RECHECK = 30  # Seconds between live store checks for an offline tracked volunteer
+
+# Paging of /api/all-user-locations/
+LOCATIONS_FEED_PAGE_SIZE = 200  # Default and largest ?limit=
+LOCATIONS_FEED_HISTORY_LIMIT = 50  # Newest history points returned per user
+
+# In-memory map cluster index behind /api/map/clusters/ (rescue/clusters.py)
+CLUSTER_MAX_ZOOM = 18  # Deeper zoom levels reuse this level's grid
+CLUSTER_RADIUS_PX = 64  # Cluster cell width in screen pixels at every zoom level
+CLUSTER_INDEX_REFRESH = 300  # Seconds between full reloads, which pick up other workers' writes
+
+# Volunteer and organization listings are cached as JSON bytes with an ETag (base/snapshots.py)
+SNAPSHOT_CACHE_TIMEOUT = 300  # Seconds a snapshot is kept, even if no write invalidates it
+
+# Retention sweeper (`python manage.py sweep_retention --loop`); max_age is in seconds
+RETENTION_POLICIES = {
+    "rescue.VolunteerLocation": {"field": "updated_at", "max_age": 24 * 3600},
+    "rescue.UserLocationHistory": {"field": "timestamp", "max_age": 24 * 3600},
+    "chatbot.ChatMessage": {"field": "timestamp", "max_age": 90 * 24 * 3600},
+    "base.IdempotencyKey": {"field": "expires_at", "max_age": 0},  # Rows carry their own expiry
+}
+RETENTION_BATCH_SIZE = 5000  # Primary-key window deleted per statement
+RETENTION_BATCH_PAUSE = 0.05  # Seconds between batches
+
+# Tables range-partitioned by day (`python manage.py manage_partitions --convert` once, then
+# daily); the retention sweeper drops their expired partitions instead of deleting rows
+PARTITIONED_TABLES = {"rescue.UserLocationHistory": "timestamp"}
+PARTITION_DAYS_AHEAD = 7  # Daily partitions kept ready ahead of time